@@ -1,6 +1,7 @@
 from bs4 import BeautifulSoup
 import functools
 import getpass
+import json
 import os
 import re
 import requests
@@ -23,6 +24,8 @@ class TurkleClient(object):
     ADD_PROJECT_URL = "/admin/turkle/project/add/"
     ADD_BATCH_URL = "/admin/turkle/batch/add/"
     LIST_BATCH_URL = "/admin/turkle/batch/"
+    ETAGS_FILENAME = ".etags.json"
+    DOWNLOAD_CHUNK_SIZE = 1024 * 1024
 
     def __init__(self, server, prefix, admin, password=None):
         # prefix is for when the app is not run in the base of the web server
@@ -58,7 +61,13 @@ class TurkleClient(object):
         return True
 
     @exception_handler
-    def download(self, directory):
+    def download(self, directory, gzip=False):
+        # The ETags of downloaded files are kept so that unchanged files are not downloaded again
+        etags_path = os.path.join(directory, self.ETAGS_FILENAME)
+        etags = {}
+        if os.path.exists(etags_path):
+            with open(etags_path) as fh:
+                etags = json.load(fh)
         with requests.Session() as session:
             if not self.login(session):
                 return False
@@ -69,12 +78,27 @@ class TurkleClient(object):
                 finished_col = row.find('td', {'class': 'field-total_finished_tasks'}).string
                 download_col = row.findAll('td')[-1].a
                 if finished_col != '0':
-                    resp = session.get(self.format_url(download_col['href'], False))
+                    href = download_col['href']
+                    if gzip:
+                        # Download .csv.gz files, which are compressed while they are streamed
+                        href += '?gzip=1'
+                    headers = {}
+                    if href in etags and os.path.exists(os.path.join(directory,
+                                                                     etags[href][1])):
+                        headers['If-None-Match'] = etags[href][0]
+                    resp = session.get(self.format_url(href, False), headers=headers,
+                                       stream=True)
+                    if resp.status_code == 304:
+                        continue
                     info = resp.headers['content-disposition']
                     filename = re.findall(r'filename="(.+)"', info)[0]
-                    filename = os.path.join(directory, filename)
-                    with open(filename, 'wb') as fh:
-                        fh.write(resp.content)
+                    with open(os.path.join(directory, filename), 'wb') as fh:
+                        for chunk in resp.iter_content(self.DOWNLOAD_CHUNK_SIZE):
+                            fh.write(chunk)
+                    if 'ETag' in resp.headers:
+                        etags[href] = [resp.headers['ETag'], filename]
+        with open(etags_path, 'w') as fh:
+            json.dump(etags, fh)
         return True
 
     @exception_handler
@@ -113,9 +137,10 @@ class TurkleClient(object):
     def upload_csv(self, session, options):
         url = self.format_url(self.ADD_BATCH_URL)
         resp = session.get(url)
-        # grab a list of the project ids from the form
+        # grab a list of the project ids from the form's project select
+        select = re.search(r'<select name="project".*?</select>', resp.text, re.S)
         regex = r'<option value="(.*)">'
-        ids = re.findall(regex, resp.text)
+        ids = re.findall(regex, select.group(0) if select else resp.text)
         payload = {
             # we just upload a project so we assume that its last in list
             'project': ids[-1],
@@ -15,10 +15,11 @@ parser.add_argument("-p", help="admin password")
 parser.add_argument("--server", help="hostname:port", default="localhost:8000")
 parser.add_argument("--prefix", help="URL prefix of the application", default="")
 parser.add_argument("--dir", help="directory to save files", default=".")
+parser.add_argument("--gzip", action="store_true", help="download gzip compressed files")
 args = parser.parse_args()
 
 client = TurkleClient(args.server, args.prefix, args.u, args.p)
-result = client.download(args.dir)
+result = client.download(args.dir, args.gzip)
 if result:
     print("Success")
 else:
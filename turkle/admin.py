@@ -1,26 +1,22 @@
-try:
-    from cStringIO import StringIO
-except ImportError:
-    try:
-        from StringIO import StringIO
-    except ImportError:
-        from io import BytesIO
-        StringIO = BytesIO
 import json
+import os
+import tempfile
 # hack to add unicode() to python3 for backward compatibility
 try:
     unicode('')
 except NameError:
     unicode = str
 
+from django.conf import settings
 from django.conf.urls import url
 from django.contrib import admin, messages
 from django.contrib.admin.widgets import FilteredSelectMultiple
 from django.contrib.auth.admin import GroupAdmin, UserAdmin
 from django.contrib.auth.models import Group, User
 from django.core.exceptions import ObjectDoesNotExist
+from django.core.files.move import file_move_safe
 from django.db import models
-from django.forms import (FileField, FileInput, HiddenInput, IntegerField,
+from django.forms import (CharField, FileField, FileInput, Form, HiddenInput, IntegerField,
                           ModelForm, ModelMultipleChoiceField, TextInput, ValidationError, Widget)
 from django.http import JsonResponse
 from django.shortcuts import redirect, render
@@ -28,9 +24,12 @@ from django.urls import reverse
 from django.utils.html import format_html, format_html_join
 from guardian.admin import GuardedModelAdmin
 from guardian.shortcuts import assign_perm, get_groups_with_perms, remove_perm
-import unicodecsv
 
-from turkle.models import Batch, Project, TaskAssignment
+from turkle import metrics
+from turkle.formats import open_batch_file
+from turkle.media import get_media_dir
+from turkle.models import (ApiToken, Batch, BatchIngestJob, BatchMedia, Project, ProjectAsset,
+                           TaskAssignment)
 from turkle.utils import get_site_name
 
 
@@ -50,9 +49,15 @@ class TurkleAdminSite(admin.AdminSite):
             url(r'^expire_abandoned_assignments/$',
                 self.admin_view(self.expire_abandoned_assignments),
                 name='expire_abandoned_assignments'),
+            url(r'^metrics/$', self.admin_view(self.metrics), name='metrics'),
         ]
         return my_urls + urls
 
+    def metrics(self, request):
+        if request.method == 'POST' and request.POST.get('reset') == 'true':
+            metrics.reset_counters()
+        return JsonResponse({'counters': metrics.get_counters()})
+
 
 class CustomGroupAdminForm(ModelForm):
     """Hides 'Permissions' section, adds 'Group Members' section
@@ -130,6 +135,12 @@ class CustomUserAdmin(UserAdmin):
         return redirect(reverse('turkle_admin:auth_user_changelist'))
 
 
+class ApiTokenAdmin(admin.ModelAdmin):
+    fields = ('user', 'key', 'created_at')
+    list_display = ('user', 'created_at')
+    readonly_fields = ('key', 'created_at')
+
+
 class CustomButtonFileWidget(FileInput):
     # HTML file inputs have a button followed by text that either
     # gives the filename or says "no file selected".  It is not
@@ -159,8 +170,19 @@ class ProjectNameReadOnlyWidget(Widget):
                 self.project_name, self.project_id))
 
 
+class CsvIngestError(Exception):
+    """Raised by BatchAdmin.save_model() when Tasks cannot be created from a CSV file
+    """
+    def __init__(self, messages):
+        super(CsvIngestError, self).__init__(messages)
+        self.messages = messages
+
+
 class BatchForm(ModelForm):
     csv_file = FileField(label='CSV File')
+    media_file = FileField(label='Media archive', required=False)
+    csv_errors = None
+    extra_csv_fields = ()
 
     # Allow a form to be submitted without an 'allotted_assignment_time'
     # field.  The default value for this field will be used instead.
@@ -177,10 +199,20 @@ class BatchForm(ModelForm):
             'this determines how long it takes until their assignment is deleted and ' + \
             'someone else can work on the Task.'
         self.fields['csv_file'].help_text = 'You can Drag-and-Drop a CSV file onto this ' + \
-            'window, or use the "Choose File" button to browse for the file'
+            'window, or use the "Choose File" button to browse for the file.  TSV and ' + \
+            'JSON Lines files, and files compressed with gzip or bzip2, are also accepted.'
         self.fields['csv_file'].widget = CustomButtonFileWidget()
+        self.fields['media_file'].help_text = 'Optional zip or tar archive of image, audio ' + \
+            'or other media files.  CSV values that are the path of a file in the archive ' + \
+            'are replaced with the URL of the file, which is served by Turkle.'
         self.fields['project'].label = 'Project'
         self.fields['name'].label = 'Batch Name'
+        if 'duplicate_tasks' in self.fields:
+            # Scripts that do not submit the field keep every row
+            self.fields['duplicate_tasks'].required = False
+            self.fields['duplicate_tasks'].help_text = 'Rows with the same input fields ' + \
+                'as an existing Task can be skipped, or linked to the existing Task so ' + \
+                'that they share its results without being assigned to Workers.'
 
         # csv_file field not required if changing existing Batch
         #
@@ -199,11 +231,12 @@ class BatchForm(ModelForm):
                 ProjectNameReadOnlyWidget(self.instance.project)
 
     def clean(self):
-        """Verify format of CSV file
+        """Verify format of CSV file header
 
-        Verify that:
-        - fieldnames in CSV file are identical to fieldnames in Project
-        - number of fields in each row matches number of fields in CSV header
+        Verify that fieldnames in CSV file are identical to fieldnames
+        in Project.  The number of fields in each row is checked while
+        the Tasks are created from the CSV file, to avoid reading the
+        whole file during validation.
         """
         cleaned_data = super(BatchForm, self).clean()
 
@@ -215,8 +248,10 @@ class BatchForm(ModelForm):
 
         validation_errors = []
 
-        rows = unicodecsv.reader(csv_file)
-        header = next(rows)
+        try:
+            (header, _) = open_batch_file(csv_file, csv_file.name)
+        except ValueError as ex:
+            raise ValidationError(str(ex))
 
         csv_fields = set(header)
         template_fields = set(project.fieldnames)
@@ -228,14 +263,11 @@ class BatchForm(ModelForm):
                         'The CSV file is missing fields that are in the HTML template. '
                         'These missing fields are: %s' %
                         ', '.join(template_but_not_csv)))
+        self.extra_csv_fields = csv_fields.difference(template_fields)
 
-        expected_fields = len(header)
-        for (i, row) in enumerate(rows):
-            if len(row) != expected_fields:
-                validation_errors.append(
-                    ValidationError(
-                        'The CSV file header has %d fields, but line %d has %d fields' %
-                        (expected_fields, i+2, len(row))))
+        # Errors found while creating Tasks, set by BatchAdmin.changeform_view()
+        if self.csv_errors:
+            validation_errors.extend(ValidationError(e) for e in self.csv_errors)
 
         if validation_errors:
             raise ValidationError(validation_errors)
@@ -260,6 +292,31 @@ class BatchForm(ModelForm):
         else:
             return data
 
+    def clean_duplicate_tasks(self):
+        return self.cleaned_data.get('duplicate_tasks') or Batch.KEEP_DUPLICATES
+
+    def clean_media_file(self):
+        media_file = self.cleaned_data.get('media_file')
+        if media_file and not get_media_dir():
+            raise ValidationError('Media archives cannot be uploaded, because the '
+                                  'TURKLE_MEDIA_DIR setting is not set')
+        return media_file
+
+
+class AppendTasksForm(Form):
+    csv_file = FileField(label='CSV File')
+
+
+class CloneBatchForm(Form):
+    name = CharField(max_length=1024, widget=TextInput(attrs={'size': '60'}))
+    assignments_per_task = IntegerField(label='Assignments per Task', min_value=1)
+    allotted_assignment_time = IntegerField(label='Allotted assignment time (hours)',
+                                            min_value=1)
+
+
+class TopUpAssignmentsForm(Form):
+    assignments_per_task = IntegerField(label='Assignments per Task', min_value=1)
+
 
 class BatchAdmin(admin.ModelAdmin):
     form = BatchForm
@@ -270,50 +327,169 @@ class BatchAdmin(admin.ModelAdmin):
         'name', 'project', 'filename', 'total_tasks', 'assignments_per_task',
         'task_assignments_completed', 'total_finished_tasks', 'active', 'download_csv')
 
+    def append_tasks(self, request, batch_id):
+        request.current_app = self.admin_site.name
+        try:
+            batch = Batch.objects.get(id=batch_id)
+        except ObjectDoesNotExist:
+            messages.error(request, u'Cannot find Batch with ID {}'.format(batch_id))
+            return redirect(reverse('turkle_admin:turkle_batch_changelist'))
+
+        if request.method == 'POST':
+            form = AppendTasksForm(request.POST, request.FILES)
+            if form.is_valid():
+                csv_file = form.cleaned_data['csv_file']
+                duplicate_rows = batch.duplicate_rows
+                try:
+                    total_created = batch.append_tasks_from_csv(csv_file, csv_file.name)
+                except ValidationError as ex:
+                    form.add_error('csv_file', ex)
+                else:
+                    messages.info(request, u'Added {} Tasks to Batch {}'.format(
+                        total_created, batch.name))
+                    if batch.duplicate_rows > duplicate_rows:
+                        messages.info(request, u'{} rows of the file had the same input as '
+                                      u'an existing Task'.format(
+                                          batch.duplicate_rows - duplicate_rows))
+                    return redirect(reverse('turkle_admin:turkle_batch_change',
+                                            args=[batch.id]))
+        else:
+            form = AppendTasksForm()
+
+        return render(request, 'admin/turkle/append_tasks.html', {
+            'batch': batch,
+            'form': form,
+            'opts': self.model._meta,
+            'site_header': self.admin_site.site_header,
+            'site_title': self.admin_site.site_title,
+        })
+
+    def batch_ingest_progress(self, request, batch_id):
+        try:
+            ingest_job = BatchIngestJob.objects.get(batch_id=batch_id)
+        except ObjectDoesNotExist:
+            return JsonResponse({'error': u'Cannot find Ingest Job for Batch with ID {}'.
+                                 format(batch_id)}, status=404)
+        return JsonResponse(ingest_job.progress())
+
     def cancel_batch(self, request, batch_id):
         try:
             batch = Batch.objects.get(id=batch_id)
+            if hasattr(batch, 'ingest_job'):
+                batch.ingest_job.remove_csv_file()
             batch.delete()
         except ObjectDoesNotExist:
             messages.error(request, u'Cannot find Batch with ID {}'.format(batch_id))
 
         return redirect(reverse('turkle_admin:turkle_batch_changelist'))
 
+    def changeform_view(self, request, object_id=None, form_url='', extra_context=None):
+        try:
+            return super(BatchAdmin, self).changeform_view(
+                request, object_id, form_url, extra_context)
+        except CsvIngestError as ex:
+            # The Batch was rolled back, so display the form again with the CSV file errors
+            request.turkle_csv_errors = ex.messages
+            return super(BatchAdmin, self).changeform_view(
+                request, object_id, form_url, extra_context)
+
     def changelist_view(self, request):
         c = {
             'csv_unix_line_endings': request.session.get('csv_unix_line_endings', False)
         }
         return super(BatchAdmin, self).changelist_view(request, extra_context=c)
 
+    def clone_batch(self, request, batch_id):
+        request.current_app = self.admin_site.name
+        try:
+            batch = Batch.objects.get(id=batch_id)
+        except ObjectDoesNotExist:
+            messages.error(request, u'Cannot find Batch with ID {}'.format(batch_id))
+            return redirect(reverse('turkle_admin:turkle_batch_changelist'))
+
+        if request.method == 'POST':
+            form = CloneBatchForm(request.POST)
+            if form.is_valid():
+                try:
+                    new_batch = batch.clone(
+                        created_by=request.user,
+                        name=form.cleaned_data['name'],
+                        allotted_assignment_time=form.cleaned_data['allotted_assignment_time'],
+                        assignments_per_task=form.cleaned_data['assignments_per_task'])
+                except ValidationError as ex:
+                    form.add_error(None, ex)
+                else:
+                    messages.info(request, u'Created Batch {} with {} Tasks'.format(
+                        new_batch.name, new_batch.total_tasks()))
+                    return redirect(reverse('turkle_admin:review_batch',
+                                            kwargs={'batch_id': new_batch.id}))
+        else:
+            form = CloneBatchForm(initial={
+                'allotted_assignment_time': batch.allotted_assignment_time,
+                'assignments_per_task': batch.assignments_per_task,
+                'name': u'{} (copy)'.format(batch.name),
+            })
+
+        return render(request, 'admin/turkle/clone_batch.html', {
+            'batch': batch,
+            'form': form,
+            'opts': self.model._meta,
+            'site_header': self.admin_site.site_header,
+            'site_title': self.admin_site.site_title,
+        })
+
     def download_csv(self, obj):
         download_url = reverse('download_batch_csv', kwargs={'batch_id': obj.id})
-        return format_html('<a href="{}" class="button">Download CSV results file</a>'.
-                           format(download_url))
+        jsonl_url = reverse('download_batch_jsonl', kwargs={'batch_id': obj.id})
+        return format_html('<a href="{}" class="button">Download CSV results file</a> '
+                           '<a href="{}" class="button">JSON Lines</a>'.
+                           format(download_url, jsonl_url))
 
     def get_fields(self, request, obj):
         # Display different fields when adding (when obj is None) vs changing a Batch
         if not obj:
             return ('project', 'name', 'assignments_per_task',
-                    'allotted_assignment_time', 'csv_file')
+                    'allotted_assignment_time', 'duplicate_tasks', 'csv_file', 'media_file')
         else:
             return ('active', 'project', 'name', 'assignments_per_task',
-                    'allotted_assignment_time', 'filename')
+                    'allotted_assignment_time', 'filename', 'duplicate_tasks',
+                    'duplicate_rows')
+
+    def get_form(self, request, obj=None, **kwargs):
+        form = super(BatchAdmin, self).get_form(request, obj, **kwargs)
+        csv_errors = getattr(request, 'turkle_csv_errors', None)
+        if csv_errors:
+            form = type(form.__name__, (form,), {'csv_errors': csv_errors})
+        return form
 
     def get_readonly_fields(self, request, obj):
         if not obj:
             return []
+        elif not obj.is_ingested():
+            # Like publish_batch, the Batch cannot be activated until its Tasks are created
+            return ('active', 'assignments_per_task', 'duplicate_rows', 'filename')
         else:
-            return ('assignments_per_task', 'filename')
+            return ('assignments_per_task', 'duplicate_rows', 'filename')
 
     def get_urls(self):
         urls = super(BatchAdmin, self).get_urls()
         my_urls = [
+            url(r'^(?P<batch_id>\d+)/append/$',
+                self.admin_site.admin_view(self.append_tasks), name='append_tasks'),
             url(r'^(?P<batch_id>\d+)/cancel/$',
                 self.admin_site.admin_view(self.cancel_batch), name='cancel_batch'),
+            url(r'^(?P<batch_id>\d+)/clone/$',
+                self.admin_site.admin_view(self.clone_batch), name='clone_batch'),
             url(r'^(?P<batch_id>\d+)/review/$',
                 self.admin_site.admin_view(self.review_batch), name='review_batch'),
             url(r'^(?P<batch_id>\d+)/publish/$',
                 self.admin_site.admin_view(self.publish_batch), name='publish_batch'),
+            url(r'^(?P<batch_id>\d+)/ingest_progress/$',
+                self.admin_site.admin_view(self.batch_ingest_progress),
+                name='batch_ingest_progress'),
+            url(r'^(?P<batch_id>\d+)/top_up/$',
+                self.admin_site.admin_view(self.top_up_assignments),
+                name='top_up_assignments'),
             url(r'^update_csv_line_endings',
                 self.admin_site.admin_view(self.update_csv_line_endings),
                 name='update_csv_line_endings'),
@@ -323,6 +499,11 @@ class BatchAdmin(admin.ModelAdmin):
     def publish_batch(self, request, batch_id):
         try:
             batch = Batch.objects.get(id=batch_id)
+            if not batch.is_ingested():
+                messages.error(request, u'Batch with ID {} cannot be published until all '
+                               u'of its Tasks have been created'.format(batch_id))
+                return redirect(reverse('turkle_admin:review_batch',
+                                        kwargs={'batch_id': batch_id}))
             batch.active = True
             batch.save()
         except ObjectDoesNotExist:
@@ -341,7 +522,18 @@ class BatchAdmin(admin.ModelAdmin):
             messages.error(request, u'Cannot find Batch with ID {}'.format(batch_id))
             return redirect(reverse('turkle_admin:turkle_batch_changelist'))
 
+        if not batch.is_ingested():
+            return render(request, 'admin/turkle/batch_ingest_progress.html', {
+                'batch_id': batch_id,
+                'ingest_job': batch.ingest_job,
+                'site_header': self.admin_site.site_header,
+                'site_title': self.admin_site.site_title,
+            })
+
         task_ids = list(batch.task_set.values_list('id', flat=True))
+        if not task_ids:
+            messages.info(request, u'Batch {} has no Tasks to review'.format(batch.name))
+            return redirect(reverse('turkle_admin:turkle_batch_changelist'))
         task_ids_as_json = json.dumps(task_ids)
         return render(request, 'admin/turkle/review_batch.html', {
             'batch_id': batch_id,
@@ -356,28 +548,64 @@ class BatchAdmin(admin.ModelAdmin):
             if request.user.is_authenticated:
                 obj.created_by = request.user
 
-            # If Batch active flag not explicitly set, make inactive until Batch reviewed
-            if u'active' not in request.POST:
-                obj.active = False
+            # The Batch stays inactive until all of its Tasks have been created.
+            # If the Batch active flag is not explicitly set, the Batch also
+            # stays inactive until it has been reviewed.
+            activate_on_completion = u'active' in request.POST and obj.active
+            obj.active = False
 
             # Only use CSV file when adding Batch, not when changing
-            obj.filename = request.FILES['csv_file']._name
-            csv_text = request.FILES['csv_file'].read()
+            csv_file = request.FILES['csv_file']
+            obj.filename = csv_file._name
             super(BatchAdmin, self).save_model(request, obj, form, change)
-            csv_fh = StringIO(csv_text)
-
-            csv_fields = set(next(unicodecsv.reader(csv_fh)))
-            csv_fh.seek(0)
-            template_fields = set(obj.project.fieldnames)
-            if csv_fields != template_fields:
-                csv_but_not_template = csv_fields.difference(template_fields)
-                if csv_but_not_template:
-                    messages.warning(
-                        request,
-                        'The CSV file contained fields that are not in the HTML template. '
-                        'These extra fields are: %s' %
-                        ', '.join(csv_but_not_template))
-            obj.create_tasks_from_csv(csv_fh)
+
+            # Media files are stored first, so that their paths in the CSV file are replaced
+            media_file = request.FILES.get('media_file')
+            total_media = 0
+            if media_file:
+                try:
+                    total_media = BatchMedia.add_archive(obj, media_file)
+                except ValidationError as ex:
+                    raise CsvIngestError(ex.messages)
+
+            (spool_fd, spool_path) = tempfile.mkstemp(
+                dir=getattr(settings, 'TURKLE_INGEST_DIR', None), prefix='turkle-batch-',
+                suffix='.csv')
+            if hasattr(csv_file, 'temporary_file_path'):
+                # The upload was already streamed to disk, so move it instead of copying it
+                os.close(spool_fd)
+                file_move_safe(csv_file.temporary_file_path(), spool_path, allow_overwrite=True)
+            else:
+                with os.fdopen(spool_fd, 'wb') as spool_fh:
+                    for chunk in csv_file.chunks():
+                        spool_fh.write(chunk)
+            ingest_job = BatchIngestJob(
+                activate_on_completion=activate_on_completion,
+                batch=obj,
+                csv_path=spool_path,
+                total_bytes=csv_file.size)
+            ingest_job.save()
+            if not getattr(settings, 'TURKLE_BACKGROUND_INGEST', False):
+                ingest_job.run()
+                if ingest_job.status == BatchIngestJob.FAILED:
+                    raise CsvIngestError(ingest_job.error.splitlines())
+
+            if total_media:
+                messages.info(request, u'Added {} media files to Batch {}'.format(
+                    total_media, obj.name))
+            if obj.duplicate_rows:
+                messages.info(request, u'{} rows of the CSV file had the same input as an '
+                              u'existing Task, and were {}'.format(
+                                  obj.duplicate_rows,
+                                  u'linked' if obj.duplicate_tasks in (
+                                      Batch.LINK_BATCH_DUPLICATES,
+                                      Batch.LINK_PROJECT_DUPLICATES) else u'skipped'))
+            if form.extra_csv_fields:
+                messages.warning(
+                    request,
+                    'The CSV file contained fields that are not in the HTML template. '
+                    'These extra fields are: %s' %
+                    ', '.join(form.extra_csv_fields))
         else:
             super(BatchAdmin, self).save_model(request, obj, form, change)
 
@@ -385,6 +613,41 @@ class BatchAdmin(admin.ModelAdmin):
         return '{} / {}'.format(obj.total_finished_task_assignments(),
                                 obj.assignments_per_task * obj.total_tasks())
 
+    def top_up_assignments(self, request, batch_id):
+        request.current_app = self.admin_site.name
+        try:
+            batch = Batch.objects.get(id=batch_id)
+        except ObjectDoesNotExist:
+            messages.error(request, u'Cannot find Batch with ID {}'.format(batch_id))
+            return redirect(reverse('turkle_admin:turkle_batch_changelist'))
+
+        if request.method == 'POST':
+            form = TopUpAssignmentsForm(request.POST)
+            if form.is_valid():
+                try:
+                    total_reopened = batch.top_up_assignments(
+                        form.cleaned_data['assignments_per_task'])
+                except ValidationError as ex:
+                    form.add_error('assignments_per_task', ex)
+                else:
+                    messages.info(request, u'Batch {} now has {} Assignments per Task. '
+                                  u'Reopened {} completed Tasks'.format(
+                                      batch.name, batch.assignments_per_task, total_reopened))
+                    return redirect(reverse('turkle_admin:turkle_batch_change',
+                                            args=[batch.id]))
+        else:
+            form = TopUpAssignmentsForm(initial={
+                'assignments_per_task': batch.assignments_per_task + 1,
+            })
+
+        return render(request, 'admin/turkle/top_up_assignments.html', {
+            'batch': batch,
+            'form': form,
+            'opts': self.model._meta,
+            'site_header': self.admin_site.site_header,
+            'site_title': self.admin_site.site_title,
+        })
+
     def update_csv_line_endings(self, request):
         csv_unix_line_endings = (request.POST[u'csv_unix_line_endings'] == u'true')
         request.session['csv_unix_line_endings'] = csv_unix_line_endings
@@ -416,6 +679,10 @@ class ProjectForm(ModelForm):
             'parameter DOES NOT change the number of Assignments per Task for already ' + \
             'published batches of Tasks.'
         self.fields['custom_permissions'].label = 'Restrict access to specific Groups of Workers '
+        self.fields['reuse_answers'].label = 'Reuse answers for Tasks with the same input'
+        self.fields['reuse_answers'].help_text = 'Submitted answers are cached, and copied ' + \
+            'to new Tasks with the same input fields.  Tasks with enough cached answers ' + \
+            'are completed without being assigned to Workers.'
         self.fields['html_template'].label = 'HTML template text'
         self.fields['html_template'].help_text = 'You can edit the template text directly, ' + \
             'Drag-and-Drop a template file onto this window, or use the "Choose File" button below'
@@ -431,11 +698,29 @@ class ProjectAdmin(GuardedModelAdmin):
     formfield_overrides = {
         models.CharField: {'widget': TextInput(attrs={'size': '60'})},
     }
-    list_display = ('name', 'filename', 'updated_at', 'active', 'publish_tasks')
+    list_display = ('name', 'filename', 'updated_at', 'active', 'publish_tasks',
+                    'download_jsonl')
 
     # Fieldnames are extracted from form text, and should not be edited directly
     exclude = ('fieldnames',)
-    readonly_fields = ('extracted_template_variables',)
+    readonly_fields = ('extracted_template_variables', 'assets')
+
+    def assets(self, instance):
+        asset_items = format_html_join(
+            '\n', '<li><a href="{}">{}</a></li>',
+            ((reverse('admin:turkle_projectasset_change', args=[asset.id]),
+              u'${asset:%s}' % asset.filename)
+             for asset in instance.projectasset_set.defer('content')))
+        add_url = '%s?project=%d' % (reverse('admin:turkle_projectasset_add'), instance.id)
+        return format_html('<ul>{}</ul><a href="{}" class="button">Add asset</a>',
+                           asset_items, add_url)
+    assets.short_description = 'Assets'
+
+    def download_jsonl(self, instance):
+        download_url = reverse('download_project_jsonl', kwargs={'project_id': instance.id})
+        return format_html('<a href="{}" class="button">Download JSON Lines results file</a>',
+                           download_url)
+    download_jsonl.short_description = 'Results'
 
     def extracted_template_variables(self, instance):
         return format_html_join('\n', "<li>{}</li>",
@@ -446,7 +731,7 @@ class ProjectAdmin(GuardedModelAdmin):
             # Adding
             return (
                 (None, {
-                    'fields': ('name', 'assignments_per_task')
+                    'fields': ('name', 'assignments_per_task', 'reuse_answers')
                 }),
                 ('HTML Template', {
                     'fields': ('html_template', 'template_file_upload', 'filename')
@@ -460,11 +745,11 @@ class ProjectAdmin(GuardedModelAdmin):
             # Changing
             return (
                 (None, {
-                    'fields': ('name', 'assignments_per_task')
+                    'fields': ('name', 'assignments_per_task', 'reuse_answers')
                 }),
                 ('HTML Template', {
                     'fields': ('html_template', 'template_file_upload', 'filename',
-                               'extracted_template_variables')
+                               'extracted_template_variables', 'assets')
                 }),
                 ('Permissions', {
                     'fields': ('active', 'login_required', 'custom_permissions',
@@ -503,8 +788,58 @@ class ProjectAdmin(GuardedModelAdmin):
                     remove_perm('can_work_on', group, obj)
 
 
+class ProjectAssetForm(ModelForm):
+    upload = FileField(label='File', required=False)
+
+    def __init__(self, *args, **kwargs):
+        super(ProjectAssetForm, self).__init__(*args, **kwargs)
+
+        self.fields['upload'].widget = CustomButtonFileWidget()
+        self.fields['filename'].required = False
+        self.fields['filename'].help_text = 'Defaults to the name of the uploaded file. ' + \
+            'Reference the asset from the HTML template using ${asset:<filename>}'
+        self.fields['content_type'].help_text = 'Guessed from the filename if left blank'
+        if self.instance._state.adding:
+            self.fields['upload'].required = True
+
+    def clean(self):
+        cleaned_data = super(ProjectAssetForm, self).clean()
+        upload = cleaned_data.get('upload')
+        if upload and not cleaned_data.get('filename'):
+            cleaned_data['filename'] = upload.name
+        if not cleaned_data.get('filename'):
+            raise ValidationError('The asset filename is required')
+        return cleaned_data
+
+    def save(self, commit=True):
+        upload = self.cleaned_data.get('upload')
+        if upload:
+            self.instance.content = upload.read()
+        return super(ProjectAssetForm, self).save(commit)
+
+
+class ProjectAssetAdmin(admin.ModelAdmin):
+    fields = ('project', 'filename', 'upload', 'content_type', 'template_token', 'size')
+    form = ProjectAssetForm
+    list_display = ('filename', 'project', 'template_token', 'size', 'updated_at')
+    list_filter = ('project',)
+    readonly_fields = ('template_token', 'size')
+
+    def size(self, instance):
+        if instance.pk is None:
+            return ''
+        return '{} bytes'.format(len(instance.content))
+
+    def template_token(self, instance):
+        if instance.pk is None:
+            return ''
+        return u'${asset:%s}' % instance.filename
+
+
 admin_site = TurkleAdminSite(name='turkle_admin')
+admin_site.register(ApiToken, ApiTokenAdmin)
 admin_site.register(Group, CustomGroupAdmin)
 admin_site.register(User, CustomUserAdmin)
 admin_site.register(Batch, BatchAdmin)
 admin_site.register(Project, ProjectAdmin)
+admin_site.register(ProjectAsset, ProjectAssetAdmin)
@@ -0,0 +1,280 @@
+"""JSON API for Workers
+
+The API lets Workers use custom front-ends and scripts instead of the
+HTML views.  Requests are authenticated using an API Token passed in
+the HTTP header:
+
+    Authorization: Token <key>
+
+All responses are JSON objects.  Errors are reported as:
+
+    {"error": "<message>"}
+
+with an appropriate HTTP status code.
+"""
+import json
+from functools import wraps
+import time
+
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction
+from django.db.utils import OperationalError
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+
+from turkle.availability import (
+    availability_version,
+    requested_wait_seconds,
+    wait_for_availability_change,
+)
+from turkle.db import is_db_lock_error, retry_on_db_lock
+from turkle.models import ApiToken, Batch, Project, Task, TaskAssignment
+from turkle.submission_journal import get_submission_journal
+from turkle.utils import read_answer_records
+
+
+def api_error(message, status):
+    return JsonResponse({'error': message}, status=status)
+
+
+def api_token_required(func):
+    """Decorator that authenticates the request using the API Token header
+
+    The Token's User replaces request.user, so that the permission
+    checks used by the HTML views can be reused unchanged.
+    """
+    retrying_func = retry_on_db_lock(func)
+
+    @csrf_exempt
+    @wraps(func)
+    def wrapper(request, *args, **kwargs):
+        auth_header = request.META.get('HTTP_AUTHORIZATION', '').split()
+        if len(auth_header) != 2 or auth_header[0].lower() != 'token':
+            return api_error(u'Missing API Token', 401)
+        try:
+            token = ApiToken.objects.select_related('user').get(key=auth_header[1])
+        except ObjectDoesNotExist:
+            return api_error(u'Invalid API Token', 401)
+        if not token.user.is_active:
+            return api_error(u'User account is disabled', 401)
+        request.user = token.user
+
+        try:
+            return retrying_func(request, *args, **kwargs)
+        except OperationalError as ex:
+            # See turkle.views.handle_db_lock
+            if is_db_lock_error(ex):
+                return api_error(u'The database is busy. Please try again.', 503)
+            raise ex
+    return wrapper
+
+
+@require_GET
+@api_token_required
+def batches(request):
+    """List the Batches the Worker has permission to work on
+    """
+    projects = Project.all_available_for(request.user)
+    batch_list = Batch.objects.filter(active=True, project__in=projects).\
+        select_related('project').order_by('id')
+    return JsonResponse({
+        'batches': [
+            {
+                'id': batch.id,
+                'name': batch.name,
+                'created_at': batch.created_at,
+                'project_id': batch.project_id,
+                'project_name': batch.project.name,
+                'assignments_per_task': batch.assignments_per_task,
+                'allotted_assignment_time': batch.allotted_assignment_time,
+            }
+            for batch in batch_list
+        ]
+    })
+
+
+@require_POST
+@api_token_required
+def claim_next_task(request, batch_id):
+    """Create a Task Assignment for the next available Task in the Batch
+
+    Like the accept_next_task view, the optional 'wait' query parameter
+    makes the request wait for a Task to become available.
+    """
+    try:
+        batch = Batch.objects.select_related('project').get(id=batch_id)
+    except ObjectDoesNotExist:
+        return api_error(u'Cannot find Task Batch with ID {}'.format(batch_id), 404)
+    if not batch.active or not batch.project.available_for(request.user):
+        return api_error(u'You do not have permission to work on Batch {}'.format(batch_id), 403)
+
+    deadline = time.time() + requested_wait_seconds(request)
+    while True:
+        version = availability_version()
+        task_assignment = _claim_next_task(request.user, batch)
+        if task_assignment is not None:
+            return JsonResponse(_task_assignment_as_json(task_assignment))
+
+        remaining = deadline - time.time()
+        if remaining <= 0 or not wait_for_availability_change(version, remaining):
+            return api_error(u'No more Tasks available from Batch {}'.format(batch_id), 404)
+
+
+@require_POST
+@api_token_required
+def return_task_assignment(request, task_assignment_id):
+    """Delete an uncompleted Task Assignment, so the Task can be assigned to someone else
+    """
+    task_assignment, error = _get_own_task_assignment(request, task_assignment_id)
+    if error:
+        return error
+    task_assignment.delete()
+    return JsonResponse({'task_assignment_id': int(task_assignment_id), 'returned': True})
+
+
+@require_POST
+@api_token_required
+def skip_task_assignment(request, task_assignment_id):
+    """Return a Task Assignment, and claim a different Task from the same Batch
+    """
+    task_assignment, error = _get_own_task_assignment(request, task_assignment_id)
+    if error:
+        return error
+    batch = task_assignment.task.batch
+    skipped_task_id = task_assignment.task_id
+    task_assignment.delete()
+
+    next_task_assignment = _claim_next_task(request.user, batch, exclude_task_id=skipped_task_id)
+    if next_task_assignment is None:
+        return api_error(u'No more Tasks available from Batch {}'.format(batch.id), 404)
+    return JsonResponse(_task_assignment_as_json(next_task_assignment))
+
+
+@require_POST
+@api_token_required
+def submit_task_assignment(request, task_assignment_id):
+    """Submit the answers for a Task Assignment
+
+    The answers are either a JSON object in the request body, or
+    form-encoded POST data.
+    """
+    task_assignment, error = _get_own_task_assignment(request, task_assignment_id)
+    if error:
+        return error
+
+    if request.content_type == 'application/json':
+        try:
+            answers = json.loads(request.body.decode('utf-8'))
+        except ValueError:
+            return api_error(u'Request body is not valid JSON', 400)
+        if not isinstance(answers, dict):
+            return api_error(u'Answers must be a JSON object', 400)
+    else:
+        answers = dict(request.POST.items())
+
+    submission_journal = get_submission_journal()
+    if submission_journal:
+        submission_journal.append(task_assignment, answers)
+    else:
+        task_assignment.answers = answers
+        task_assignment.completed = True
+        task_assignment.save()
+    return JsonResponse({
+        'task_id': task_assignment.task_id,
+        'task_assignment_id': task_assignment.id,
+        'completed': True,
+    })
+
+
+@require_POST
+@api_token_required
+def submit_answers(request, batch_id):
+    """Submit answers for many Tasks in the Batch in a single request
+
+    The request body uses the JSON Lines format, with one record per line:
+
+        {"task_id": 123, "answers": {"field": "value", ...}}
+    """
+    try:
+        batch = Batch.objects.select_related('project').get(id=batch_id)
+    except ObjectDoesNotExist:
+        return api_error(u'Cannot find Task Batch with ID {}'.format(batch_id), 404)
+    if not batch.active or not batch.project.available_for(request.user):
+        return api_error(u'You do not have permission to work on Batch {}'.format(batch_id), 403)
+
+    try:
+        summary = batch.bulk_submit_answers(request.user,
+                                            read_answer_records(request.body.splitlines()))
+    except ValueError as ex:
+        return api_error(str(ex), 400)
+    return JsonResponse(summary)
+
+
+def _claim_next_task(user, batch, exclude_task_id=None):
+    """Assign the next available Task in the Batch to the user
+
+    The available Tasks are locked as in views.accept_next_task, and
+    the number of Task Assignments of the chosen Task is checked again
+    before it is assigned, so that Workers claiming Tasks at the same
+    time cannot exceed assignments_per_task.
+
+    Returns:
+        TaskAssignment, or None if no more Tasks are available
+    """
+    excluded_task_ids = [exclude_task_id] if exclude_task_id else []
+    with transaction.atomic():
+        while True:
+            task_id = batch.available_task_ids_for(user).\
+                exclude(id__in=excluded_task_ids).\
+                select_for_update().\
+                first()
+            if task_id is None:
+                return None
+            task = Task.objects.select_related('batch__project').get(id=task_id)
+            if task.taskassignment_set.count() < task.batch.assignments_per_task:
+                break
+            # Another Worker claimed the last Task Assignment since it was found
+            excluded_task_ids.append(task_id)
+
+        task_assignment = TaskAssignment(assigned_to=user, task=task)
+        task_assignment.save()
+    return task_assignment
+
+
+def _get_own_task_assignment(request, task_assignment_id):
+    """Retrieve an uncompleted Task Assignment belonging to the user
+
+    Returns:
+        A (TaskAssignment, None) tuple on success, or a (None, JsonResponse)
+        tuple if the Task Assignment cannot be used by the user
+    """
+    try:
+        task_assignment = TaskAssignment.objects.select_related('task__batch__project').\
+            defer('answers', 'task__input_csv_fields').\
+            get(id=task_assignment_id)
+    except ObjectDoesNotExist:
+        return None, api_error(
+            u'Cannot find Task Assignment with ID {}'.format(task_assignment_id), 404)
+    if task_assignment.assigned_to_id != request.user.id:
+        return None, api_error(
+            u'You do not have permission to work on the Task Assignment with ID {}'.
+            format(task_assignment_id), 403)
+    if task_assignment.completed:
+        return None, api_error(
+            u'The Task Assignment with ID {} has already been completed'.
+            format(task_assignment_id), 409)
+    return task_assignment, None
+
+
+def _task_assignment_as_json(task_assignment):
+    task = task_assignment.task
+    return {
+        'batch_id': task.batch_id,
+        'task_id': task.id,
+        'task_assignment_id': task_assignment.id,
+        'expires_at': task_assignment.expires_at,
+        'input': task.resolved_input_csv_fields(),
+        'html': task.populate_html_template(),
+        'html_template_has_submit_button': task.batch.project.html_template_has_submit_button,
+    }
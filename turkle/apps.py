@@ -5,3 +5,15 @@ from turkle.utils import get_site_name
 class TurkleAppConfig(AppConfig):
     name = 'turkle'
     verbose_name = get_site_name()
+
+    def ready(self):
+        from django.core.signals import request_started
+        from django.db.backends.signals import connection_created
+        from turkle.db import configure_sqlite_connection
+        from turkle.submission_journal import start_writer_on_request
+        connection_created.connect(configure_sqlite_connection)
+        # The writer is started by the first request, rather than here, so
+        # that management commands (migrate, shell, ingest_worker...) do not
+        # start a thread that uses the database.  It replays any submissions
+        # journaled before a crash.
+        request_started.connect(start_writer_on_request)
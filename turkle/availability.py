@@ -0,0 +1,77 @@
+"""Cheap change detection for Task availability
+
+Requests that wait for a Task to become available (see the 'wait'
+parameter of the accept_next_task view) should not repeatedly run the
+expensive availability queries.  Instead, every event that can make
+a Task available - a returned or expired Task Assignment, a newly
+published Batch or newly added Tasks - increments a version number
+stored in the Django cache.  Waiting requests only re-check Task
+availability after the version number has changed.
+
+The default local-memory cache is private to each server process.
+When running multiple processes (e.g. with Gunicorn), configure a
+shared cache backend such as Memcached or the database cache so that
+waiting requests are woken up by events in other processes.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+AVAILABILITY_VERSION_KEY = 'turkle:availability_version'
+
+
+def availability_version():
+    """Returns the current Task availability version number
+    """
+    return cache.get(AVAILABILITY_VERSION_KEY, 0)
+
+
+def bump_availability_version():
+    """Signal waiting requests that Tasks may have become available
+    """
+    try:
+        cache.incr(AVAILABILITY_VERSION_KEY)
+    except ValueError:
+        # The key does not exist (yet, or any more)
+        cache.set(AVAILABILITY_VERSION_KEY, availability_version() + 1, None)
+
+
+def max_wait_seconds():
+    """Returns the maximum number of seconds a request may wait for a Task
+    """
+    return getattr(settings, 'TURKLE_MAX_WAIT_SECONDS', 30)
+
+
+def requested_wait_seconds(request):
+    """Returns the number of seconds a request may wait for a Task to become available
+
+    The number of seconds is taken from the 'wait' query parameter,
+    and is capped at max_wait_seconds().
+    """
+    try:
+        wait = float(request.GET.get('wait', 0))
+    except ValueError:
+        return 0
+    return max(0, min(wait, max_wait_seconds()))
+
+
+def wait_for_availability_change(version, timeout):
+    """Sleep until the availability version differs from version, or timeout
+
+    Args:
+        version (int): Availability version when Tasks were last checked
+        timeout (float): Maximum number of seconds to wait
+
+    Returns:
+        True if the availability version changed before the timeout
+    """
+    poll_interval = getattr(settings, 'TURKLE_WAIT_POLL_INTERVAL', 0.5)
+    deadline = time.time() + timeout
+    while True:
+        if availability_version() != version:
+            return True
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            return False
+        time.sleep(min(poll_interval, remaining))
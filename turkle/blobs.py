@@ -0,0 +1,118 @@
+"""Out-of-line storage for very large Task input values
+
+CSV cells can hold whole documents, and every query that loads a
+Task's input_csv_fields would otherwise read them from the database.
+When the TURKLE_BLOB_DIR setting is set to a directory, input values
+of at least TURKLE_BLOB_THRESHOLD characters are written to files in
+that directory when Tasks are created, and the Task's input only
+stores a reference to the file:
+
+    {"$blob": "<SHA-256 digest of the value>"}
+
+Files are named after the digest of their content, so a value that
+occurs in many Tasks is stored once.  References are only resolved
+when a Task is rendered or its results are exported, by reading the
+files with memory-mapped reads.
+
+Files are not deleted when their Tasks are deleted, because other
+Tasks may refer to the same file.
+"""
+import errno
+import hashlib
+import io
+import mmap
+import os
+import os.path
+import tempfile
+
+from django.conf import settings
+
+BLOB_KEY = '$blob'
+
+
+def get_blob_dir():
+    """Returns the directory of the blob store, or None if it is disabled
+    """
+    return getattr(settings, 'TURKLE_BLOB_DIR', None)
+
+
+def is_blob_reference(value):
+    return isinstance(value, dict) and BLOB_KEY in value
+
+
+def store_large_values(input_csv_fields):
+    """Move the large values of a Task's input fields to the blob store
+
+    Args:
+        input_csv_fields (dict): Task input fields
+
+    Returns:
+        A dict with the same keys as input_csv_fields, where values of
+        at least TURKLE_BLOB_THRESHOLD characters are replaced with
+        references to the blob store.  If the blob store is disabled,
+        input_csv_fields is returned unchanged.
+    """
+    blob_dir = get_blob_dir()
+    if not blob_dir:
+        return input_csv_fields
+    threshold = getattr(settings, 'TURKLE_BLOB_THRESHOLD', 64 * 1024)
+    stored_fields = {}
+    for (key, value) in input_csv_fields.items():
+        if isinstance(value, type(u'')) and len(value) >= threshold:
+            value = {BLOB_KEY: write_blob(blob_dir, value)}
+        stored_fields[key] = value
+    return stored_fields
+
+
+def resolve_values(input_csv_fields):
+    """Returns a copy of a Task's input fields with the blob store references resolved
+    """
+    if not any(is_blob_reference(v) for v in input_csv_fields.values()):
+        return input_csv_fields
+    return dict((k, read_blob(get_blob_dir(), v[BLOB_KEY]) if is_blob_reference(v) else v)
+                for (k, v) in input_csv_fields.items())
+
+
+def blob_path(blob_dir, digest):
+    return os.path.join(blob_dir, digest[:2], digest[2:4], digest)
+
+
+def write_blob(blob_dir, value):
+    """Write a value to the blob store, unless the blob store already has it
+
+    The file is written under a temporary name and then renamed, so
+    that other processes never read a partially written file.
+
+    Returns:
+        SHA-256 digest of the value
+    """
+    data = value.encode('utf-8')
+    digest = hashlib.sha256(data).hexdigest()
+    path = blob_path(blob_dir, digest)
+    if os.path.exists(path):
+        return digest
+    try:
+        os.makedirs(os.path.dirname(path))
+    except OSError as ex:
+        if ex.errno != errno.EEXIST:
+            raise
+    (fd, temp_path) = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp')
+    try:
+        with io.open(fd, 'wb') as fh:
+            fh.write(data)
+        os.rename(temp_path, path)
+    except Exception:
+        os.remove(temp_path)
+        raise
+    return digest
+
+
+def read_blob(blob_dir, digest):
+    """Read a value from the blob store using a memory-mapped read
+    """
+    with io.open(blob_path(blob_dir, digest), 'rb') as fh:
+        mapped = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            return mapped[:].decode('utf-8')
+        finally:
+            mapped.close()
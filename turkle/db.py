@@ -0,0 +1,76 @@
+"""Database helpers for running Turkle on SQLite under concurrent load
+
+SQLite allows only one writer at a time.  With the default rollback
+journal, readers also block writers, and a request that cannot get
+the database lock fails with "database is locked".  To reduce these
+failures:
+
+- configure_sqlite_connection() applies the PRAGMAs listed in the
+  TURKLE_SQLITE_PRAGMAS setting (e.g. WAL journal mode, which lets
+  readers and the writer work concurrently) to each new connection.
+- retry_on_db_lock() retries a view or transaction that failed because
+  the database was locked, using a bounded number of attempts with
+  jittered exponential backoff.
+"""
+from functools import wraps
+import logging
+import random
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.db.utils import OperationalError
+
+from turkle import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def configure_sqlite_connection(sender, connection, **kwargs):
+    """Handler for the connection_created signal that applies TURKLE_SQLITE_PRAGMAS
+    """
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'TURKLE_SQLITE_PRAGMAS', None)
+    if not pragmas:
+        return
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute('PRAGMA {}={}'.format(name, value))
+
+
+def is_db_lock_error(ex):
+    return isinstance(ex, OperationalError) and str(ex) == 'database is locked'
+
+
+def retry_on_db_lock(func):
+    """Decorator that retries func if it fails because the database is locked
+
+    func must be safe to call again after it failed, e.g. a view whose
+    database writes are done in a single transaction.  No retries are
+    attempted when called inside a transaction, because the failed
+    statement has already broken the enclosing transaction.
+
+    The number of retries and the initial delay between retries are set
+    by TURKLE_DB_LOCK_RETRIES and TURKLE_DB_LOCK_RETRY_DELAY (seconds).
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        max_retries = getattr(settings, 'TURKLE_DB_LOCK_RETRIES', 3)
+        delay = getattr(settings, 'TURKLE_DB_LOCK_RETRY_DELAY', 0.05)
+        attempt = 0
+        while True:
+            try:
+                return func(*args, **kwargs)
+            except OperationalError as ex:
+                if not is_db_lock_error(ex) or connection.in_atomic_block:
+                    raise
+                if attempt >= max_retries:
+                    metrics.increment('db_lock.failures')
+                    logger.warning('Database is locked, giving up after %d retries', attempt)
+                    raise
+            attempt += 1
+            metrics.increment('db_lock.retries')
+            # Full jitter, so that the requests that collided do not retry in lockstep
+            time.sleep(random.uniform(0, delay * 2 ** (attempt - 1)))
+    return wrapper
@@ -0,0 +1,169 @@
+"""Cached results CSV files of Batches
+
+Building the results CSV file of a Batch reads every Task and Task
+Assignment of the Batch from the database.  When the TURKLE_EXPORT_DIR
+setting is set to a directory, the results CSV file of each Batch is
+kept in that directory (see models.BatchExport), and a download only
+reads the rows of the Task Assignments completed since the file was
+last updated, which are appended to the end of the file.
+
+Appending is only possible while the new rows have the same columns
+as the file and the earlier rows have not changed.  Otherwise (e.g.
+the Project was renamed, an answer has a new field, or Task
+Assignments were deleted), the file is stale and is rebuilt from
+scratch.
+
+Files are written under a temporary name and then renamed, and
+appends start from the size recorded in the database, so a failed
+update never leaves a partial row in a file that is served.
+
+Clients that poll for new results can instead download only the
+results saved after a cursor (see Batch.results_since).  Cursors are
+passed to clients as strings like '20190314T153000123456-42': the UTC
+time a Task Assignment was last saved (its saved_at field) and its id.
+
+Results files can be downloaded compressed with gzip.  Files are
+written and compressed one block at a time while they are streamed
+(see csv_chunks() and gzip_chunks()), so neither the file nor its
+compressed form is held in memory.
+"""
+import datetime
+import errno
+import io
+import os
+import os.path
+import re
+import tempfile
+import zlib
+
+from django.conf import settings
+from django.utils import timezone
+import unicodecsv
+
+CURSOR_RE = re.compile(r'^(\d{8}T\d{12})-(\d+)$')
+_CURSOR_TIME_FORMAT = '%Y%m%dT%H%M%S%f'
+
+# Size of the blocks of uncompressed data passed to the gzip compressor
+_BLOCK_BYTES = 64 * 1024
+
+
+def get_export_dir():
+    """Returns the directory of the cached export files, or None if they are disabled
+    """
+    return getattr(settings, 'TURKLE_EXPORT_DIR', None)
+
+
+def export_path(export_dir, batch_id, lineterminator):
+    line_endings = 'lf' if lineterminator == '\n' else 'crlf'
+    return os.path.join(export_dir, 'batch-{}-{}.csv'.format(batch_id, line_endings))
+
+
+def format_cursor(cursor):
+    """Returns the string for a (saved_at, id) cursor, or '' for None
+    """
+    if cursor is None:
+        return ''
+    (saved_at, task_assignment_id) = cursor
+    return '{}-{}'.format(saved_at.astimezone(timezone.utc).strftime(_CURSOR_TIME_FORMAT),
+                          task_assignment_id)
+
+
+def parse_cursor(cursor_string):
+    """Returns the (saved_at, id) cursor for a string, or None for ''
+
+    Raises:
+        ValueError if the string is not a cursor
+    """
+    if not cursor_string:
+        return None
+    match = CURSOR_RE.match(cursor_string)
+    if not match:
+        raise ValueError(u'Invalid cursor "{}"'.format(cursor_string))
+    saved_at = datetime.datetime.strptime(match.group(1), _CURSOR_TIME_FORMAT)
+    return (timezone.make_aware(saved_at, timezone.utc), int(match.group(2)))
+
+
+def csv_chunks(fieldnames, rows, lineterminator):
+    """Yield a CSV file with a header and rows as blocks of bytes
+    """
+    buffer = io.BytesIO()
+    writer = _writer(buffer, fieldnames, lineterminator)
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= _BLOCK_BYTES:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def gzip_chunks(chunks, compresslevel=6):
+    """Compress an iterable of byte or text strings in the gzip format
+
+    Small strings (e.g. lines) are joined into blocks of about 64KB
+    before they are compressed, and compressed data is yielded as soon
+    as the compressor returns it, so that the memory used does not
+    depend on the size of the data.
+    """
+    compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    block = []
+    block_size = 0
+    for chunk in chunks:
+        if not isinstance(chunk, bytes):
+            chunk = chunk.encode('utf-8')
+        block.append(chunk)
+        block_size += len(chunk)
+        if block_size >= _BLOCK_BYTES:
+            compressed = compressor.compress(b''.join(block))
+            block = []
+            block_size = 0
+            if compressed:
+                yield compressed
+    yield compressor.compress(b''.join(block)) + compressor.flush()
+
+
+def write_export(path, fieldnames, rows, lineterminator):
+    """Replace an export file with a CSV file with a header and rows
+
+    Returns:
+        Size of the file in bytes
+    """
+    try:
+        os.makedirs(os.path.dirname(path))
+    except OSError as ex:
+        if ex.errno != errno.EEXIST:
+            raise
+    (fd, temp_path) = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp')
+    try:
+        with io.open(fd, 'wb') as fh:
+            writer = _writer(fh, fieldnames, lineterminator)
+            writer.writeheader()
+            writer.writerows(rows)
+            size = fh.tell()
+        os.rename(temp_path, path)
+    except Exception:
+        os.remove(temp_path)
+        raise
+    return size
+
+
+def append_export(path, size, fieldnames, rows, lineterminator):
+    """Append rows to an export file
+
+    Anything after the first size bytes of the file, which is left
+    over from an append that failed, is discarded first.
+
+    Returns:
+        New size of the file in bytes
+    """
+    with io.open(path, 'r+b') as fh:
+        fh.seek(size)
+        fh.truncate()
+        _writer(fh, fieldnames, lineterminator).writerows(rows)
+        return fh.tell()
+
+
+def _writer(fh, fieldnames, lineterminator):
+    return unicodecsv.DictWriter(fh, fieldnames, lineterminator=lineterminator,
+                                 quoting=unicodecsv.QUOTE_ALL)
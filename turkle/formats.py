@@ -0,0 +1,243 @@
+"""Readers for the file formats accepted when uploading a Batch
+
+A Batch can be created from a CSV file, a TSV (tab separated values)
+file or a JSON Lines file (one JSON object per line), optionally
+compressed with gzip or bzip2.  The format is detected from the
+filename extension (e.g. 'tasks.tsv.gz') or, if the extension is not
+recognized, from the first bytes of the file.  Compressed files are
+decompressed while they are read, without writing the decompressed
+file to disk.
+
+All formats are read as a header (list of fieldnames) and an iterator
+over rows (lists of values in the order of the header), so that they
+can be validated against the Project's template fields in the same way.
+"""
+import bz2
+from collections import OrderedDict
+import io
+import json
+import os.path
+import zlib
+
+import unicodecsv
+
+CSV = 'csv'
+TSV = 'tsv'
+JSONL = 'jsonl'
+
+GZIP = 'gzip'
+BZIP2 = 'bzip2'
+
+COMPRESSION_EXTENSIONS = {
+    '.bz2': BZIP2,
+    '.gz': GZIP,
+}
+FORMAT_EXTENSIONS = {
+    '.csv': CSV,
+    '.jsonl': JSONL,
+    '.ndjson': JSONL,
+    '.tsv': TSV,
+}
+
+_MAGIC_BYTES = (
+    (b'\x1f\x8b', GZIP),
+    (b'BZh', BZIP2),
+)
+
+
+class RowError(object):
+    """Returned instead of a row for a record that cannot be converted to a row
+    """
+    def __init__(self, message):
+        self.message = message
+
+
+def detect_format(fh, filename=None):
+    """Detect the compression and format of a Batch file
+
+    Args:
+        fh (file-like object): Seekable binary file handle, positioned
+            at the start of the file.  The position is not changed.
+        filename (str): Optional filename used to detect the format
+
+    Returns:
+        A (compression, file_format) tuple, where compression is GZIP,
+        BZIP2 or None, and file_format is CSV, TSV or JSONL
+    """
+    compression = None
+    file_format = None
+    if filename:
+        (root, extension) = os.path.splitext(filename.lower())
+        if extension in COMPRESSION_EXTENSIONS:
+            compression = COMPRESSION_EXTENSIONS[extension]
+            (root, extension) = os.path.splitext(root)
+        file_format = FORMAT_EXTENSIONS.get(extension)
+
+    position = fh.tell()
+    start = fh.read(4)
+    fh.seek(position)
+    if compression is None:
+        for (magic_bytes, magic_compression) in _MAGIC_BYTES:
+            if start.startswith(magic_bytes):
+                compression = magic_compression
+
+    if file_format is None:
+        if compression:
+            stream = _decompressing_stream(fh, compression)
+            start = stream.read(4)
+            fh.seek(position)
+        if start.lstrip()[:1] == b'{':
+            file_format = JSONL
+        else:
+            file_format = CSV
+    return (compression, file_format)
+
+
+def open_batch_file(fh, filename=None, file_format=None):
+    """Read the header and rows of a Batch file
+
+    Args:
+        fh (file-like object): Seekable binary file handle
+        filename (str): Optional filename used to detect the format
+        file_format (str): CSV, TSV or JSONL, if the format is known.
+            The compression is still detected.
+
+    Returns:
+        A tuple where the first value is a list of strings for the
+        header fieldnames, and the second value is an iterator over
+        the rows of the file.  Each row is either a list of values, or
+        a RowError for a JSON Lines record that is not valid.
+
+    Raises:
+        ValueError if the file has no header
+    """
+    (compression, detected_format) = detect_format(fh, filename)
+    file_format = file_format or detected_format
+    if compression:
+        fh = _decompressing_stream(fh, compression)
+
+    if file_format == JSONL:
+        return _read_jsonl(fh)
+
+    delimiter = '\t' if file_format == TSV else ','
+    rows = unicodecsv.reader(fh, delimiter=delimiter)
+    try:
+        header = next(rows)
+    except StopIteration:
+        raise ValueError('The file is empty')
+    return (header, rows)
+
+
+def split_batch_filename(filename):
+    """Split the filename of an uploaded Batch file for naming its CSV results file
+
+    Returns:
+        A (root, extension) tuple like os.path.splitext(), except that
+        compression extensions are removed, and the extension of TSV
+        and JSON Lines files is replaced with '.csv'
+    """
+    (root, extension) = os.path.splitext(filename)
+    if extension.lower() in COMPRESSION_EXTENSIONS:
+        (root, extension) = os.path.splitext(root)
+    if FORMAT_EXTENSIONS.get(extension.lower(), CSV) != CSV:
+        extension = '.csv'
+    return (root, extension)
+
+
+def _decompressing_stream(fh, compression):
+    if compression == GZIP:
+        # 16 + MAX_WBITS: expect a gzip header and trailer
+        return io.BufferedReader(_DecompressingReader(
+            fh, lambda: zlib.decompressobj(16 + zlib.MAX_WBITS)))
+    else:
+        return io.BufferedReader(_DecompressingReader(fh, bz2.BZ2Decompressor))
+
+
+def _read_jsonl(fh):
+    """
+    The fieldnames of the first record are used as the header.  The
+    values of fields that are not strings are encoded as JSON.
+    """
+    lines = (line for line in enumerate(fh, 1) if line[1].strip())
+    try:
+        (_, first_line) = next(lines)
+    except StopIteration:
+        raise ValueError('The file is empty')
+    try:
+        first_record = json.loads(first_line.decode('utf-8'), object_pairs_hook=OrderedDict)
+    except ValueError:
+        raise ValueError('Line 1 of the JSON Lines file is not valid JSON')
+    if not isinstance(first_record, dict):
+        raise ValueError('Line 1 of the JSON Lines file is not a JSON object')
+    header = list(first_record.keys())
+    header_set = set(header)
+
+    def rows():
+        yield _jsonl_row(header, first_record)
+        for (line_number, line) in lines:
+            try:
+                record = json.loads(line.decode('utf-8'))
+            except ValueError:
+                yield RowError('Line %d of the JSON Lines file is not valid JSON' % line_number)
+                continue
+            if not isinstance(record, dict):
+                yield RowError('Line %d of the JSON Lines file is not a JSON object' %
+                               line_number)
+            elif set(record) != header_set:
+                yield RowError('Line %d of the JSON Lines file has different fields than '
+                               'line 1' % line_number)
+            else:
+                yield _jsonl_row(header, record)
+
+    return (header, rows())
+
+
+def _jsonl_row(header, record):
+    row = []
+    for fieldname in header:
+        value = record[fieldname]
+        if not isinstance(value, type(u'')):
+            value = json.dumps(value)
+        row.append(value)
+    return row
+
+
+class _DecompressingReader(io.RawIOBase):
+    """Raw stream that decompresses a file object while it is read
+
+    Concatenated compressed streams (e.g. from 'cat a.gz b.gz') are
+    decompressed one after the other.  A ValueError is raised if the
+    file is corrupt, or if it ends in the middle of a compressed stream.
+    """
+    def __init__(self, fh, decompressor_factory):
+        self.buffer = b''
+        self.decompressor = decompressor_factory()
+        self.decompressor_factory = decompressor_factory
+        self.fh = fh
+        self.in_stream = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self.buffer:
+            data = self.decompressor.unused_data
+            if not data:
+                data = self.fh.read(64 * 1024)
+                if not data:
+                    # Decompressor objects only have an eof attribute on Python 3
+                    if self.in_stream and not getattr(self.decompressor, 'eof', True):
+                        raise ValueError('The compressed file is truncated')
+                    return 0
+            if data is self.decompressor.unused_data or getattr(self.decompressor, 'eof', False):
+                # Start of the next compressed stream
+                self.decompressor = self.decompressor_factory()
+            try:
+                self.buffer = self.decompressor.decompress(data)
+            except (IOError, OSError, zlib.error):
+                raise ValueError('The compressed file is corrupt')
+            self.in_stream = True
+        n = min(len(b), len(self.buffer))
+        b[:n] = self.buffer[:n]
+        self.buffer = self.buffer[n:]
+        return n
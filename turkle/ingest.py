@@ -0,0 +1,213 @@
+"""Parallel creation of Tasks from very large CSV files
+
+For CSV files with millions of rows, parsing the CSV file and encoding
+each row as JSON takes most of the time spent creating Tasks.  When
+TURKLE_INGEST_PROCESSES is greater than 1, BatchIngestJob.run() uses
+create_tasks_in_parallel(), which:
+
+- splits the CSV file into byte ranges that start and end at record
+  boundaries, taking quoted fields that contain newlines into account,
+- parses the byte ranges, hashes the input fields of the rows, moves
+  large values to the blob store (see turkle.blobs) and encodes (and
+  compresses) the rows as JSON in a pool of worker processes, and
+- inserts the encoded rows from the current process, in the same order
+  as the rows in the CSV file, so that Task IDs follow the file order.
+
+Only the byte ranges currently being processed are held in memory.
+"""
+import io
+import multiprocessing
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import connection, connections
+from django.db.transaction import TransactionManagementError
+import unicodecsv
+
+from turkle.availability import bump_availability_version
+from turkle.blobs import store_large_values
+from turkle.models import (BULK_CHUNK_SIZE, CSV_ROW_WIDTH_ERROR, CSV_TOO_MANY_ERRORS, Task,
+                           _chunks, _in_task_id_ranges, encode_json, hash_input_csv_fields)
+
+# Approximate size of the byte ranges parsed by each worker process
+INGEST_RANGE_BYTES = 8 * 1024 * 1024
+
+_READ_BLOCK_BYTES = 1024 * 1024
+
+
+def create_tasks_in_parallel(batch, csv_path, processes, progress_callback=None,
+                             max_errors=None):
+    """Create Tasks for batch from the CSV file at csv_path using a process pool
+
+    Behaves like Batch.create_tasks_from_csv(), including how rows with
+    the wrong number of fields are reported.  The database connections
+    of this process are closed before the worker processes are forked,
+    so that they do not inherit them, which is why this function cannot
+    be called inside a transaction.
+
+    Returns:
+        Number of Tasks created from CSV file
+    """
+    if connection.in_atomic_block:
+        raise TransactionManagementError(
+            'Tasks cannot be created in parallel inside a transaction')
+    if max_errors is None:
+        max_errors = getattr(settings, 'TURKLE_MAX_CSV_ERRORS', 20)
+
+    (header, byte_ranges) = split_csv(csv_path, INGEST_RANGE_BYTES)
+    columns = batch._input_csv_columns(header)
+    media_urls = batch.media_urls()
+    errors = []
+    task_id_ranges = []
+    num_created_tasks = 0
+    num_duplicate_rows = 0
+    num_records = 0
+
+    connections.close_all()
+    pool = multiprocessing.Pool(processes)
+    try:
+        # Limit the number of parsed byte ranges waiting to be inserted
+        for window in _chunks(byte_ranges, processes * 2):
+            results = pool.map(
+                _parse_byte_range,
+                [(csv_path, start, end, header, columns, media_urls, max_errors)
+                 for (start, end) in window])
+            for ((_, end), (encoded_rows, range_records, range_errors)) in zip(window, results):
+                for (record_index, num_fields) in range_errors:
+                    if len(errors) == max_errors:
+                        errors.append(CSV_TOO_MANY_ERRORS % max_errors)
+                        break
+                    errors.append(CSV_ROW_WIDTH_ERROR %
+                                  (len(header), num_records + record_index + 2, num_fields))
+                num_records += range_records
+                if len(errors) > max_errors:
+                    break
+                if not errors:
+                    for chunk in _chunks(encoded_rows, BULK_CHUNK_SIZE):
+                        (task_rows, num_duplicates) = batch._deduplicate_rows(chunk)
+                        task_id_ranges.append(batch._insert_tasks(
+                            lambda: _insert_encoded_tasks(batch, task_rows)))
+                        num_created_tasks += len(task_rows)
+                        num_duplicate_rows += num_duplicates
+                    if progress_callback:
+                        progress_callback(num_created_tasks, end)
+            if len(errors) > max_errors:
+                break
+    finally:
+        pool.terminate()
+        pool.join()
+
+    if errors:
+        batch.task_set.filter(_in_task_id_ranges(task_id_ranges)).delete()
+        raise ValidationError(errors)
+
+    batch._add_duplicate_rows(num_duplicate_rows)
+    batch.reuse_cached_answers(task_id_ranges)
+    if num_created_tasks and batch.active:
+        bump_availability_version()
+    return num_created_tasks
+
+
+def split_csv(csv_path, range_bytes):
+    """Split a CSV file into byte ranges that start and end at record boundaries
+
+    A newline is a record boundary if it is preceded by an even number
+    of double quote characters, because a newline inside a quoted field
+    is always preceded by an odd number of them (escaped quotes inside
+    a quoted field are written as two double quotes).
+
+    Returns:
+        A tuple where the first value is a list of strings for the
+        header fieldnames, and the second value is a list of
+        (start, end) byte offsets for the rest of the CSV file
+    """
+    boundaries = []
+    next_boundary = 0
+    quotes_before_block = 0
+    offset = 0
+    with io.open(csv_path, 'rb') as csv_fh:
+        while True:
+            block = csv_fh.read(_READ_BLOCK_BYTES)
+            if not block:
+                break
+            search_start = max(next_boundary - offset, 0)
+            while search_start < len(block):
+                newline = block.find(b'\n', search_start)
+                if newline == -1:
+                    break
+                if (quotes_before_block + block.count(b'"', 0, newline)) % 2 == 0:
+                    # The first boundary is the end of the header
+                    boundaries.append(offset + newline + 1)
+                    next_boundary = offset + newline + 1 + range_bytes
+                    search_start = next_boundary - offset
+                else:
+                    search_start = newline + 1
+            quotes_before_block += block.count(b'"')
+            offset += len(block)
+
+        if not boundaries:
+            boundaries.append(offset)
+        if boundaries[-1] != offset:
+            boundaries.append(offset)
+
+        csv_fh.seek(0)
+        header = next(unicodecsv.reader(io.BytesIO(csv_fh.read(boundaries[0]))))
+
+    byte_ranges = list(zip(boundaries, boundaries[1:]))
+    return (header, byte_ranges)
+
+
+def _insert_encoded_tasks(batch, task_rows):
+    """Insert Tasks whose input_csv_fields have already been encoded as JSON
+
+    Called by Batch._insert_tasks(), which runs it in a transaction.
+
+    Args:
+        task_rows (list): (input_hash, encoded input_csv_fields, duplicate) tuples
+    """
+    qn = connection.ops.quote_name
+    sql = 'INSERT INTO {} ({}, {}, {}, {}, {}) VALUES (%s, %s, %s, %s, %s)'.format(
+        qn(Task._meta.db_table), qn('batch_id'), qn('completed'), qn('duplicate'),
+        qn('input_csv_fields'), qn('input_hash'))
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, [(batch.id, duplicate, duplicate, row, input_hash)
+                                 for (input_hash, row, duplicate) in task_rows])
+
+
+def _parse_byte_range(args):
+    """Parse the CSV records in a byte range of a CSV file, in a worker process
+
+    If columns is not None, the values of each record are encoded as a
+    JSON list in the order of columns, instead of as a JSON object.
+    Values that are keys of media_urls are replaced with the media URL.
+
+    Returns:
+        A tuple of (list of (input hash, JSON string) tuples for the valid
+        records, number of records, list of (record index, number of
+        fields) for the records with the wrong number of fields)
+    """
+    (csv_path, start, end, header, columns, media_urls, max_errors) = args
+    with io.open(csv_path, 'rb') as csv_fh:
+        csv_fh.seek(start)
+        data = csv_fh.read(end - start)
+
+    encoded_rows = []
+    errors = []
+    num_records = 0
+    for (i, row) in enumerate(unicodecsv.reader(io.BytesIO(data))):
+        num_records += 1
+        if len(row) != len(header):
+            if len(errors) <= max_errors:
+                errors.append((i, len(row)))
+        elif not errors:
+            if media_urls:
+                row = [media_urls.get(value, value) for value in row]
+            input_csv_fields = dict(zip(header, row))
+            input_hash = hash_input_csv_fields(input_csv_fields)
+            input_csv_fields = store_large_values(input_csv_fields)
+            # Same format as the CompressedJSONField used for Task.input_csv_fields
+            encoded_rows.append((
+                input_hash,
+                encode_json([input_csv_fields[c] for c in columns] if columns
+                            else input_csv_fields)))
+    return (encoded_rows, num_records, errors)
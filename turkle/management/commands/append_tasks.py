@@ -0,0 +1,30 @@
+import io
+import logging
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from turkle.models import Batch
+
+
+class Command(BaseCommand):
+    help = 'Add Tasks to an existing Batch from a CSV, TSV or JSON Lines file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('batch_id', type=int)
+        parser.add_argument('csv_file')
+
+    def handle(self, *args, **options):
+        try:
+            batch = Batch.objects.get(id=options['batch_id'])
+        except Batch.DoesNotExist:
+            raise CommandError(u'Cannot find Task Batch with ID {}'.format(options['batch_id']))
+
+        with io.open(options['csv_file'], 'rb') as fh:
+            try:
+                total_created = batch.append_tasks_from_csv(fh, options['csv_file'])
+            except ValidationError as ex:
+                raise CommandError('\n'.join(ex.messages))
+
+        logging.basicConfig(format="%(asctime)-15s %(message)s", level=logging.INFO)
+        logging.info('TURKLE: Added {} Tasks to Batch {}'.format(total_created, batch.id))
@@ -0,0 +1,25 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from turkle.models import ApiToken
+
+
+class Command(BaseCommand):
+    help = 'Create (or replace) the JSON API Token for a user, and print the Token key'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('--replace', action='store_true',
+                            help='Replace the existing Token for the user')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(u'Cannot find user "{}"'.format(options['username']))
+
+        token, created = ApiToken.objects.get_or_create(user=user)
+        if not created and options['replace']:
+            token.key = ApiToken.generate_key()
+            token.save()
+        self.stdout.write(token.key)
@@ -0,0 +1,21 @@
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+
+from turkle.submission_journal import get_submission_journal
+
+
+class Command(BaseCommand):
+    help = 'Apply journaled submissions to the database (requires TURKLE_SUBMISSION_JOURNAL)'
+
+    def handle(self, *args, **options):
+        submission_journal = get_submission_journal()
+        if submission_journal is None:
+            raise CommandError('The TURKLE_SUBMISSION_JOURNAL setting is not set')
+
+        logging.basicConfig(format="%(asctime)-15s %(message)s", level=logging.INFO)
+        flushed = submission_journal.flush()
+        if flushed is None:
+            logging.info('TURKLE: Submission journal is already being flushed')
+        else:
+            logging.info('TURKLE: Flushed {} submissions'.format(flushed))
@@ -0,0 +1,38 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from turkle.models import BatchIngestJob
+
+
+class Command(BaseCommand):
+    help = 'Create the Tasks for uploaded Batches in the background ' + \
+        '(requires TURKLE_BACKGROUND_INGEST)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Exit when there are no more jobs to run')
+        parser.add_argument('--poll-interval', type=float, default=5.0,
+                            help='Seconds to wait between checks for new jobs')
+
+    def handle(self, *args, **options):
+        logging.basicConfig(format="%(asctime)-15s %(message)s", level=logging.INFO)
+        while True:
+            ingest_job = BatchIngestJob.claim_next()
+            if ingest_job is None:
+                if options['once']:
+                    return
+                connection.close()
+                time.sleep(options['poll_interval'])
+                continue
+
+            logging.info('TURKLE: Creating Tasks for Batch {}'.format(ingest_job.batch_id))
+            ingest_job.run()
+            if ingest_job.status == BatchIngestJob.FAILED:
+                logging.warning('TURKLE: Unable to create Tasks for Batch {}: {}'.format(
+                    ingest_job.batch_id, ingest_job.error))
+            else:
+                logging.info('TURKLE: Created {} Tasks for Batch {}'.format(
+                    ingest_job.tasks_created, ingest_job.batch_id))
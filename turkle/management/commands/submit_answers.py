@@ -0,0 +1,40 @@
+import io
+import logging
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from turkle.models import Batch
+from turkle.utils import read_answer_records
+
+
+class Command(BaseCommand):
+    help = 'Submit answers for many Tasks in a Batch from a JSON Lines file, where ' + \
+        'each line has the form {"task_id": 123, "answers": {"field": "value"}}'
+
+    def add_arguments(self, parser):
+        parser.add_argument('batch_id', type=int)
+        parser.add_argument('username', help='User the Task Assignments are assigned to')
+        parser.add_argument('answers_file')
+
+    def handle(self, *args, **options):
+        try:
+            batch = Batch.objects.get(id=options['batch_id'])
+        except Batch.DoesNotExist:
+            raise CommandError(u'Cannot find Task Batch with ID {}'.format(options['batch_id']))
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(u'Cannot find user "{}"'.format(options['username']))
+
+        with io.open(options['answers_file'], 'rb') as fh:
+            try:
+                summary = batch.bulk_submit_answers(user, read_answer_records(fh))
+            except ValueError as ex:
+                raise CommandError(str(ex))
+
+        logging.basicConfig(format="%(asctime)-15s %(message)s", level=logging.INFO)
+        for error in summary['errors']:
+            logging.warning('TURKLE: %s', error)
+        logging.info('TURKLE: Submitted {} answers, skipped {}'.format(
+            summary['submitted'], summary['skipped']))
@@ -0,0 +1,126 @@
+"""Local storage for the media files of a Batch
+
+Annotation Projects often display images or play audio files whose
+URLs are given in the Batch's CSV file.  Instead of linking to media
+on other servers, a Batch can be uploaded with a zip or tar archive
+of its media files.  The files are unpacked into a content-addressed
+store in the TURKLE_MEDIA_DIR directory, where each file is named
+after the SHA-256 digest of its content, so a file that is part of
+many Batches is stored once.
+
+CSV values that are the path of a file in the archive (e.g.
+'images/cat.jpg') are replaced with the URL of the stored file when
+the Tasks are created.  Media URLs are versioned by digest, so they
+are served with long-lived cache headers (see views.batch_media).
+
+Files are not deleted when their Batches are deleted, because other
+Batches may use the same files.
+"""
+import errno
+import hashlib
+import io
+import os
+import os.path
+import tarfile
+import tempfile
+import zipfile
+
+from django.conf import settings
+
+_COPY_BLOCK_BYTES = 1024 * 1024
+
+
+def get_media_dir():
+    """Returns the directory of the media store, or None if media archives are disabled
+    """
+    return getattr(settings, 'TURKLE_MEDIA_DIR', None)
+
+
+def media_path(media_dir, digest):
+    return os.path.join(media_dir, digest[:2], digest[2:4], digest)
+
+
+def read_media_archive(archive_fh):
+    """Iterate over the files in a zip or tar archive, optionally compressed
+
+    Args:
+        archive_fh (file-like object): Seekable binary file handle
+
+    Yields:
+        (path, file-like object) tuples for each regular file in the
+        archive.  Paths use '/' as the separator, without a leading './'.
+
+    Raises:
+        ValueError if the file is not a zip or tar archive
+    """
+    if zipfile.is_zipfile(archive_fh):
+        archive_fh.seek(0)
+        with zipfile.ZipFile(archive_fh) as archive:
+            for info in archive.infolist():
+                if not info.filename.endswith('/'):
+                    with archive.open(info) as member_fh:
+                        yield (_normalize_path(info.filename), member_fh)
+        return
+
+    archive_fh.seek(0)
+    try:
+        archive = tarfile.open(fileobj=archive_fh, mode='r:*')
+    except tarfile.TarError:
+        raise ValueError('The media file is not a zip or tar archive')
+    with archive:
+        for info in archive:
+            if info.isfile():
+                yield (_normalize_path(info.name), archive.extractfile(info))
+
+
+def store_media_file(media_dir, fh):
+    """Copy a file to the media store, unless the media store already has it
+
+    The file is copied to a temporary file while its digest is
+    computed, and the temporary file is then renamed, so that other
+    processes never read a partially written file.
+
+    Returns:
+        A (digest, size) tuple
+    """
+    sha256 = hashlib.sha256()
+    size = 0
+    if not os.path.isdir(media_dir):
+        _makedirs(media_dir)
+    (fd, temp_path) = tempfile.mkstemp(dir=media_dir, prefix='.tmp')
+    try:
+        with io.open(fd, 'wb') as temp_fh:
+            while True:
+                block = fh.read(_COPY_BLOCK_BYTES)
+                if not block:
+                    break
+                sha256.update(block)
+                size += len(block)
+                temp_fh.write(block)
+        digest = sha256.hexdigest()
+        path = media_path(media_dir, digest)
+        if os.path.exists(path):
+            os.remove(temp_path)
+        else:
+            _makedirs(os.path.dirname(path))
+            os.rename(temp_path, path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return (digest, size)
+
+
+def _makedirs(path):
+    try:
+        os.makedirs(path)
+    except OSError as ex:
+        if ex.errno != errno.EEXIST:
+            raise
+
+
+def _normalize_path(path):
+    path = path.replace('\\', '/')
+    while path.startswith('./'):
+        path = path[2:]
+    return path.lstrip('/')
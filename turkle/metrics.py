@@ -0,0 +1,43 @@
+"""Operational counters
+
+Counters are stored in the Django cache, so that they are cheap to
+update from any request.  The counters can be viewed by staff users
+on the admin 'metrics' page, and are used to tune settings such as
+the request throttling rates.
+
+As with Task availability (see turkle.availability), a cache that is
+shared between server processes must be configured to aggregate the
+counters of all processes.
+"""
+from django.core.cache import cache
+
+METRICS_KEY_PREFIX = 'turkle:metrics:'
+METRIC_NAMES_KEY = 'turkle:metric_names'
+
+
+def get_counters():
+    """Returns a dict mapping counter names to counter values
+    """
+    names = cache.get(METRIC_NAMES_KEY, [])
+    values = cache.get_many([METRICS_KEY_PREFIX + name for name in names])
+    return dict((name, values.get(METRICS_KEY_PREFIX + name, 0)) for name in names)
+
+
+def increment(name, delta=1):
+    """Increment the counter with the specified name
+    """
+    key = METRICS_KEY_PREFIX + name
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        # First use of this counter
+        cache.set(key, delta, None)
+        names = cache.get(METRIC_NAMES_KEY, [])
+        if name not in names:
+            cache.set(METRIC_NAMES_KEY, sorted(names + [name]), None)
+
+
+def reset_counters():
+    names = cache.get(METRIC_NAMES_KEY, [])
+    cache.delete_many([METRICS_KEY_PREFIX + name for name in names])
+    cache.delete(METRIC_NAMES_KEY)
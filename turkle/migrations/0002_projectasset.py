@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-19 08:40
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('turkle', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProjectAsset',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content', models.BinaryField()),
+                ('content_type', models.CharField(blank=True, max_length=255)),
+                ('digest', models.CharField(editable=False, max_length=40)),
+                ('filename', models.CharField(max_length=255)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='turkle.Project')),
+            ],
+            options={
+                'verbose_name': 'Project Asset',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='projectasset',
+            unique_together=set([('project', 'filename')]),
+        ),
+    ]
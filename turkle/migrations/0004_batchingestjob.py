@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-19 08:51
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('turkle', '0003_apitoken'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BatchIngestJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('activate_on_completion', models.BooleanField(default=False)),
+                ('bytes_processed', models.BigIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('csv_path', models.CharField(max_length=1024)),
+                ('error', models.TextField(blank=True)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], db_index=True, default='pending', max_length=16)),
+                ('tasks_created', models.IntegerField(default=0)),
+                ('total_bytes', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Batch Ingest Job',
+            },
+        ),
+        migrations.AddField(
+            model_name='batchingestjob',
+            name='batch',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='ingest_job', to='turkle.Batch'),
+        ),
+    ]
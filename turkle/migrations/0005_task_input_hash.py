@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-19 09:06
+from __future__ import unicode_literals
+
+import hashlib
+import json
+
+from django.db import migrations, models
+
+
+def hash_input_csv_fields(input_csv_fields):
+    # Frozen copy of turkle.models.hash_input_csv_fields(), so that this
+    # migration keeps computing the same hashes if that function changes
+    encoded = json.dumps(input_csv_fields, separators=(',', ':'), sort_keys=True)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+def hash_task_inputs(apps, schema_editor):
+    Task = apps.get_model('turkle', 'Task')
+    for task in Task.objects.filter(input_hash='').only('input_csv_fields').iterator():
+        Task.objects.filter(id=task.id).update(
+            input_hash=hash_input_csv_fields(task.input_csv_fields))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('turkle', '0004_batchingestjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='batch',
+            name='duplicate_rows',
+            field=models.IntegerField(default=0, verbose_name='Number of duplicate rows'),
+        ),
+        migrations.AddField(
+            model_name='batch',
+            name='duplicate_tasks',
+            field=models.CharField(choices=[('keep', 'Create a Task for every row'), ('skip_batch', 'Skip rows that duplicate a Task in this Batch'), ('skip_project', 'Skip rows that duplicate a Task in this Project'), ('link_batch', 'Link rows that duplicate a Task in this Batch'), ('link_project', 'Link rows that duplicate a Task in this Project')], default='keep', max_length=16, verbose_name='Duplicate rows'),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='duplicate',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='input_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.RunPython(hash_task_inputs, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-19 09:09
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import jsonfield.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('turkle', '0005_task_input_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CachedAnswer',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('answers', jsonfield.fields.JSONField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('input_hash', models.CharField(max_length=64)),
+                ('assigned_to', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Cached Answer',
+            },
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='reuse_answers',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='cachedanswer',
+            name='project',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='turkle.Project'),
+        ),
+        migrations.AlterIndexTogether(
+            name='cachedanswer',
+            index_together=set([('project', 'input_hash')]),
+        ),
+    ]
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-19 09:11
+from __future__ import unicode_literals
+
+import json
+
+from django.db import migrations, models, transaction
+import jsonfield.fields
+import turkle.models
+
+CHUNK_SIZE = 500
+
+# The stored JSON text is read and written directly, rather than with
+# helpers from turkle.models, so that this migration does not change
+# when those helpers do
+
+
+def _decode_json(text):
+    if not text:
+        return text
+    return json.loads(text)
+
+
+def _plain_json(value):
+    # Stored as uncompressed JSON text, which 0008_compressed_json compresses
+    return models.Value(json.dumps(value, separators=(',', ':')),
+                        output_field=models.TextField())
+
+
+def _convert_task_inputs(apps, to_columns):
+    Batch = apps.get_model('turkle', 'Batch')
+    Task = apps.get_model('turkle', 'Task')
+    for batch in Batch.objects.only('id', 'input_csv_header').iterator():
+        header = batch.input_csv_header or None
+        last_task_id = 0
+        while True:
+            # The stored values are read directly, because Task.input_csv_fields
+            # converts lists of values to dicts
+            tasks = list(Task.objects.
+                         filter(batch_id=batch.id, id__gt=last_task_id).
+                         order_by('id').
+                         values_list('id', 'input_csv_fields')[:CHUNK_SIZE])
+            if not tasks:
+                break
+            last_task_id = tasks[-1][0]
+            with transaction.atomic():
+                for (task_id, stored_fields) in tasks:
+                    fields = _decode_json(stored_fields)
+                    if to_columns and isinstance(fields, dict):
+                        if header is None:
+                            header = list(fields.keys())
+                            Batch.objects.filter(id=batch.id).update(input_csv_header=header)
+                        if set(fields) == set(header):
+                            Task.objects.filter(id=task_id).update(
+                                input_csv_fields=_plain_json([fields[f] for f in header]))
+                    elif not to_columns and isinstance(fields, list):
+                        Task.objects.filter(id=task_id).update(
+                            input_csv_fields=_plain_json(dict(zip(header, fields))))
+
+
+def store_task_inputs_as_lists(apps, schema_editor):
+    _convert_task_inputs(apps, True)
+
+
+def store_task_inputs_as_dicts(apps, schema_editor):
+    _convert_task_inputs(apps, False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('turkle', '0006_cachedanswer'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='batch',
+            name='input_csv_header',
+            field=jsonfield.fields.JSONField(blank=True, default=list),
+        ),
+        migrations.AlterField(
+            model_name='task',
+            name='input_csv_fields',
+            field=turkle.models.TaskInputField(),
+        ),
+        migrations.RunPython(store_task_inputs_as_lists, store_task_inputs_as_dicts),
+    ]
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-19 09:16
+from __future__ import unicode_literals
+
+import base64
+import zlib
+
+from django.conf import settings
+from django.db import migrations, models, transaction
+import turkle.models
+
+CHUNK_SIZE = 500
+
+# Frozen copies of the helpers in turkle.models, so that this migration
+# keeps reading and writing the same format if those helpers change
+COMPRESSED_JSON_PREFIX = 'zlib:'
+
+COMPRESSED_FIELDS = (
+    ('CachedAnswer', 'answers'),
+    ('Task', 'input_csv_fields'),
+    ('TaskAssignment', 'answers'),
+)
+
+
+def compress_json(text):
+    threshold = getattr(settings, 'TURKLE_COMPRESSION_THRESHOLD', 1024)
+    if threshold is None or len(text) < threshold or text.startswith(COMPRESSED_JSON_PREFIX):
+        return text
+    compressed = COMPRESSED_JSON_PREFIX + \
+        base64.b64encode(zlib.compress(text.encode('utf-8'))).decode('ascii')
+    return compressed if len(compressed) < len(text) else text
+
+
+def decompress_json(text):
+    if isinstance(text, bytes):
+        text = text.decode('utf-8')
+    if text.startswith(COMPRESSED_JSON_PREFIX):
+        text = zlib.decompress(base64.b64decode(text[len(COMPRESSED_JSON_PREFIX):])).\
+            decode('utf-8')
+    return text
+
+
+def _convert_stored_json(apps, convert):
+    # The stored text is converted without decoding the JSON values
+    for (model_name, field_name) in COMPRESSED_FIELDS:
+        model = apps.get_model('turkle', model_name)
+        last_id = 0
+        while True:
+            rows = list(model.objects.
+                        filter(id__gt=last_id).
+                        order_by('id').
+                        values_list('id', field_name)[:CHUNK_SIZE])
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            with transaction.atomic():
+                for (row_id, text) in rows:
+                    converted = convert(text)
+                    if converted != text:
+                        model.objects.filter(id=row_id).update(
+                            **{field_name: models.Value(converted, output_field=models.TextField())})
+
+
+def compress_stored_json(apps, schema_editor):
+    _convert_stored_json(apps, compress_json)
+
+
+def decompress_stored_json(apps, schema_editor):
+    _convert_stored_json(apps, decompress_json)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('turkle', '0007_columnar_task_inputs'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='cachedanswer',
+            name='answers',
+            field=turkle.models.CompressedJSONField(blank=True),
+        ),
+        migrations.AlterField(
+            model_name='taskassignment',
+            name='answers',
+            field=turkle.models.CompressedJSONField(blank=True),
+        ),
+        migrations.RunPython(compress_stored_json, decompress_stored_json),
+    ]
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-19 09:23
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('turkle', '0008_compressed_json'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BatchMedia',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_type', models.CharField(blank=True, max_length=255)),
+                ('digest', models.CharField(db_index=True, max_length=64)),
+                ('filename', models.CharField(max_length=255)),
+                ('size', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Batch Media',
+                'verbose_name_plural': 'Batch Media',
+            },
+        ),
+        migrations.AddField(
+            model_name='batchmedia',
+            name='batch',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='turkle.Batch'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='batchmedia',
+            unique_together=set([('batch', 'filename')]),
+        ),
+    ]
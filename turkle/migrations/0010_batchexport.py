@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-19 09:27
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+import jsonfield.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('turkle', '0009_batchmedia'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BatchExport',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cursor_id', models.IntegerField(default=0)),
+                ('cursor_updated_at', models.DateTimeField(null=True)),
+                ('fieldnames', jsonfield.fields.JSONField(default=list)),
+                ('lineterminator', models.CharField(max_length=2)),
+                ('row_count', models.IntegerField(default=0)),
+                ('signature', models.CharField(max_length=40)),
+                ('size', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('version', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='batchexport',
+            name='batch',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='turkle.Batch'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='batchexport',
+            unique_together=set([('batch', 'lineterminator')]),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-19 09:30
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def copy_updated_at(apps, schema_editor):
+    TaskAssignment = apps.get_model('turkle', 'TaskAssignment')
+    TaskAssignment.objects.update(saved_at=models.F('updated_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('turkle', '0010_batchexport'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='taskassignment',
+            name='saved_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(copy_updated_at, migrations.RunPython.noop),
+        migrations.RenameField(
+            model_name='batchexport',
+            old_name='cursor_updated_at',
+            new_name='cursor_saved_at',
+        ),
+        migrations.AlterIndexTogether(
+            name='taskassignment',
+            index_together=set([('completed', 'saved_at', 'id')]),
+        ),
+    ]
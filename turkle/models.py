@@ -1,21 +1,177 @@
+import base64
+import binascii
+from collections import OrderedDict
 import datetime
+from functools import reduce
+import hashlib
+import json
+import mimetypes
+import operator
+import os
 import os.path
 import re
 import sys
+import zlib
 
 from bs4 import BeautifulSoup
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import connection, models, transaction
 from django.db.models import Prefetch
+from django.urls import reverse
 from django.utils import timezone
+from guardian.core import ObjectPermissionChecker
 from jsonfield import JSONField
 import unicodecsv
 
+from turkle.availability import bump_availability_version
+from turkle.blobs import (
+    BLOB_KEY, get_blob_dir, is_blob_reference, read_blob, resolve_values, store_large_values
+)
+from turkle.exports import (
+    append_export, csv_chunks, export_path, get_export_dir, write_export
+)
+from turkle.formats import CSV, RowError, detect_format, open_batch_file, split_batch_filename
+from turkle.media import get_media_dir, media_path, read_media_archive, store_media_file
 
 # The default field size limit is 131072 characters
 unicodecsv.field_size_limit(sys.maxsize)
 
+# Number of rows processed per query by bulk operations, which keeps
+# the number of SQL parameters below the limits of all database backends
+BULK_CHUNK_SIZE = 500
+
+# Errors reported for uploaded CSV files with the wrong number of fields in a row
+CSV_ROW_WIDTH_ERROR = 'The CSV file header has %d fields, but line %d has %d fields'
+CSV_TOO_MANY_ERRORS = 'Stopped checking the CSV file after %d errors'
+
+# Prefix of JSON text that is stored compressed by CompressedJSONField
+COMPRESSED_JSON_PREFIX = 'zlib:'
+
+# HTML templates reference Project assets using tokens like ${asset:style.css}
+ASSET_TOKEN_RE = re.compile(r'\${asset:([^}]+)}')
+
+
+class ApiToken(models.Model):
+    """Token used by a Worker to authenticate with the JSON API
+    """
+    class Meta:
+        verbose_name = "API Token"
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    key = models.CharField(max_length=40, unique=True)
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='api_token')
+
+    @staticmethod
+    def generate_key():
+        return binascii.hexlify(os.urandom(20)).decode('ascii')
+
+    def save(self, *args, **kwargs):
+        if not self.key:
+            self.key = self.generate_key()
+        super(ApiToken, self).save(*args, **kwargs)
+
+    def __unicode__(self):
+        return 'API Token for {}'.format(self.user.username)
+
+    def __str__(self):
+        return 'API Token for {}'.format(self.user.username)
+
+
+class _EncodedJSON(type(u'')):
+    """JSON text, possibly compressed, as stored in the database
+
+    Returned by CompressedJSONField.from_db_value() so that values are
+    only decoded when they are accessed, and values that are saved again
+    without being accessed are written back without being encoded again.
+    """
+
+
+class _CompressedJSONDescriptor(object):
+    def __init__(self, field):
+        self.field = field
+
+    def __get__(self, obj, type=None):
+        if obj is None:
+            return self
+        if self.field.attname not in obj.__dict__:
+            # The field was deferred
+            obj.refresh_from_db(fields=[self.field.attname])
+        value = obj.__dict__[self.field.attname]
+        if isinstance(value, _EncodedJSON):
+            value = obj.__dict__[self.field.attname] = decode_json(value)
+        return value
+
+    def __set__(self, obj, value):
+        obj.__dict__[self.field.attname] = value
+
+
+class CompressedJSONField(models.TextField):
+    """Field for JSON values that compresses large values
+
+    Values whose JSON encoding is at least TURKLE_COMPRESSION_THRESHOLD
+    characters long are stored compressed with zlib (see encode_json()).
+    Values are decoded when they are first accessed, so that loading a
+    model instance does not decompress values that are never used.
+    """
+    descriptor_class = _CompressedJSONDescriptor
+
+    def contribute_to_class(self, cls, name, **kwargs):
+        super(CompressedJSONField, self).contribute_to_class(cls, name, **kwargs)
+        setattr(cls, self.name, self.descriptor_class(self))
+
+    def from_db_value(self, value, expression, connection, context):
+        if value is None:
+            return value
+        return _EncodedJSON(value)
+
+    def to_python(self, value):
+        # Used by the deserializer for fixtures, which store JSON text
+        if isinstance(value, (bytes, type(u''))):
+            return decode_json(value)
+        return value
+
+    def get_prep_value(self, value):
+        if value is None and self.null:
+            return None
+        if isinstance(value, _EncodedJSON):
+            return type(u'')(value)
+        return encode_json(value)
+
+    def pre_save(self, model_instance, add):
+        # Not getattr(), which would decode values that were never accessed
+        return model_instance.__dict__[self.attname]
+
+    def value_to_string(self, obj):
+        return json.dumps(getattr(obj, self.attname), separators=(',', ':'))
+
+
+class _TaskInputDescriptor(_CompressedJSONDescriptor):
+    def __get__(self, obj, type=None):
+        value = super(_TaskInputDescriptor, self).__get__(obj, type)
+        if obj is None or not isinstance(value, list):
+            return value
+        if '_input_csv_fields_cache' not in obj.__dict__:
+            obj.__dict__['_input_csv_fields_cache'] = \
+                dict(zip(obj.batch.input_csv_header, value))
+        return obj.__dict__['_input_csv_fields_cache']
+
+    def __set__(self, obj, value):
+        obj.__dict__.pop('_input_csv_fields_cache', None)
+        super(_TaskInputDescriptor, self).__set__(obj, value)
+
+
+class TaskInputField(CompressedJSONField):
+    """CompressedJSONField for a Task's input, stored as a dict or as a list of values
+
+    Tasks of Batches with an input_csv_header store a list of values in
+    the order of the header, instead of repeating every fieldname in
+    every Task.  Task.input_csv_fields always returns a dict; the list
+    is only used when the Task is saved.
+    """
+    descriptor_class = _TaskInputDescriptor
+
 
 class Task(models.Model):
     """Human Intelligence Task
@@ -25,7 +181,16 @@ class Task(models.Model):
 
     batch = models.ForeignKey('Batch', on_delete=models.CASCADE)
     completed = models.BooleanField(default=False)
-    input_csv_fields = JSONField()
+    # Duplicate Tasks have the same input as an earlier Task, are never
+    # assigned to Workers, and share the results of the earlier Task
+    duplicate = models.BooleanField(default=False)
+    input_csv_fields = TaskInputField()
+    input_hash = models.CharField(blank=True, db_index=True, max_length=64)
+
+    def save(self, *args, **kwargs):
+        if not self.input_hash:
+            self.input_hash = hash_input_csv_fields(self.input_csv_fields)
+        super(Task, self).save(*args, **kwargs)
 
     def __unicode__(self):
         return 'Task id:{}'.format(self.id)
@@ -41,44 +206,77 @@ class Task(models.Model):
             this Task, with all template variables replaced with the template
             variable values stored in this Task's input_csv_fields.
         """
-        result = self.batch.project.html_template
-        for field in self.input_csv_fields.keys():
+        result = self.batch.project.html_template_with_asset_urls()
+        input_csv_fields = self.resolved_input_csv_fields()
+        for field in input_csv_fields.keys():
             result = result.replace(
                 r'${' + field + r'}',
-                self.input_csv_fields[field]
+                input_csv_fields[field]
             )
         return result
 
+    def resolved_input_csv_fields(self):
+        """Returns this Task's input_csv_fields, with values kept in the blob store read back
+
+        Large values may be stored out of line (see turkle.blobs), in
+        which case input_csv_fields only holds references to them.
+        """
+        return resolve_values(self.input_csv_fields)
+
 
 class TaskAssignment(models.Model):
     """Task Assignment
     """
     class Meta:
+        # Used to find the results saved after a (saved_at, id) cursor
+        index_together = (('completed', 'saved_at', 'id'),)
         verbose_name = "Task Assignment"
 
-    answers = JSONField(blank=True)
+    answers = CompressedJSONField(blank=True)
     assigned_to = models.ForeignKey(User, db_index=True, null=True, on_delete=models.CASCADE)
     completed = models.BooleanField(db_index=True, default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     expires_at = models.DateTimeField(null=True)
+    # The time the row was last written.  Unlike updated_at, which is the
+    # submission time of journaled answers, it is never set to an earlier time.
+    saved_at = models.DateTimeField(auto_now=True)
     task = models.ForeignKey(Task, on_delete=models.CASCADE)
     updated_at = models.DateTimeField(auto_now=True)
 
     @classmethod
     def expire_all_abandoned(cls):
-        return cls.objects.\
+        result = cls.objects.\
             filter(completed=False).\
             filter(expires_at__lt=timezone.now()).\
             delete()
+        if result[0]:
+            bump_availability_version()
+        return result
+
+    def delete(self, *args, **kwargs):
+        result = super(TaskAssignment, self).delete(*args, **kwargs)
+        # The Task may be available again
+        bump_availability_version()
+        return result
 
     def save(self, *args, **kwargs):
+        if not TaskAssignment.task.is_cached(self):
+            # The Task's input is not needed here
+            self.task = Task.objects.defer('input_csv_fields').\
+                select_related('batch__project').\
+                get(id=self.task_id)
         self.expires_at = timezone.now() + \
             datetime.timedelta(hours=self.task.batch.allotted_assignment_time)
 
-        if 'csrfmiddlewaretoken' in self.answers:
+        # Deferred answers were not changed, and are not saved
+        if 'answers' not in self.get_deferred_fields() and \
+           'csrfmiddlewaretoken' in self.answers:
             del self.answers['csrfmiddlewaretoken']
         super(TaskAssignment, self).save(*args, **kwargs)
 
+        if self.completed and self.task.batch.project.reuse_answers:
+            CachedAnswer.add_task_assignments([self])
+
         # Mark Task as completed if all Assignments have been completed
         if self.task.taskassignment_set.filter(completed=True).count() >= \
            self.task.batch.assignments_per_task:
@@ -91,15 +289,75 @@ class Batch(models.Model):
         verbose_name = "Batch"
         verbose_name_plural = "Batches"
 
+    # How rows with the same input as an existing Task are handled
+    KEEP_DUPLICATES = 'keep'
+    SKIP_BATCH_DUPLICATES = 'skip_batch'
+    SKIP_PROJECT_DUPLICATES = 'skip_project'
+    LINK_BATCH_DUPLICATES = 'link_batch'
+    LINK_PROJECT_DUPLICATES = 'link_project'
+    DUPLICATE_TASKS_CHOICES = (
+        (KEEP_DUPLICATES, 'Create a Task for every row'),
+        (SKIP_BATCH_DUPLICATES, 'Skip rows that duplicate a Task in this Batch'),
+        (SKIP_PROJECT_DUPLICATES, 'Skip rows that duplicate a Task in this Project'),
+        (LINK_BATCH_DUPLICATES, 'Link rows that duplicate a Task in this Batch'),
+        (LINK_PROJECT_DUPLICATES, 'Link rows that duplicate a Task in this Project'),
+    )
+
     active = models.BooleanField(db_index=True, default=True)
     allotted_assignment_time = models.IntegerField(default=24)
     assignments_per_task = models.IntegerField(default=1, verbose_name='Assignments per Task')
     created_at = models.DateTimeField(auto_now_add=True)
     created_by = models.ForeignKey(User, null=True)
+    duplicate_rows = models.IntegerField(default=0, verbose_name='Number of duplicate rows')
+    duplicate_tasks = models.CharField(choices=DUPLICATE_TASKS_CHOICES, default=KEEP_DUPLICATES,
+                                       max_length=16, verbose_name='Duplicate rows')
     filename = models.CharField(max_length=1024)
+    # Fieldnames of the Tasks that store their input as a list of values
+    input_csv_header = JSONField(blank=True, default=list)
     project = models.ForeignKey('Project', on_delete=models.CASCADE)
     name = models.CharField(max_length=1024)
 
+    def append_tasks_from_csv(self, csv_fh, filename=None, max_errors=None):
+        """Create Tasks for the rows of a file that are added to an existing Batch
+
+        The file must have the same fieldnames as the Tasks already in
+        the Batch, and must include all fieldnames used by the Project's
+        HTML template.  Only the rows of the new file are read.
+
+        Tasks cannot be appended while the Batch's BatchIngestJob has not
+        completed, because the job deletes the Batch's Tasks when it
+        starts or fails.
+
+        Args:
+            csv_fh (file-like object): File handle for CSV (or other format) input
+            filename (str): Optional filename used to detect the format
+            max_errors (int): Maximum number of row errors reported
+
+        Returns:
+            Number of Tasks created from the file
+        """
+        if not self.is_ingested():
+            raise ValidationError(u'Tasks cannot be added to Batch {} until the Tasks from its '
+                                  u'original file have been created'.format(self.name))
+        first_task = self.task_set.order_by('id').only('input_csv_fields').first()
+        existing_fieldnames = first_task.input_csv_fields.keys() if first_task else None
+
+        def validate_header(header):
+            errors = []
+            missing_fields = set(self.project.fieldnames).difference(header)
+            if missing_fields:
+                errors.append('The file is missing fields that are in the HTML template. '
+                              'These missing fields are: %s' % ', '.join(sorted(missing_fields)))
+            if existing_fieldnames is not None and set(header) != set(existing_fieldnames):
+                errors.append('The fields in the file (%s) do not match the fields of the '
+                              'Tasks in the Batch (%s)' %
+                              (', '.join(header), ', '.join(sorted(existing_fieldnames))))
+            if errors:
+                raise ValidationError(errors)
+
+        return self.create_tasks_from_csv(csv_fh, max_errors=max_errors, filename=filename,
+                                          validate_header=validate_header)
+
     def available_tasks_for(self, user):
         """Retrieve a list of all Tasks in this batch available for the user.
 
@@ -110,12 +368,12 @@ class Batch(models.Model):
             user (User|AnonymousUser):
 
         Returns:
-            QuerySet of Task objects
+            QuerySet of Task objects, with input_csv_fields deferred
         """
         if not user.is_authenticated and self.project.login_required:
             return Task.objects.none()
 
-        hs = self.task_set.filter(completed=False)
+        hs = self.task_set.filter(completed=False).defer('input_csv_fields')
 
         # Exclude Tasks that have already been assigned to this user.
         if user.is_authenticated:
@@ -123,15 +381,106 @@ class Batch(models.Model):
             # and the query below would exclude all uncompleted Tasks.
             hs = hs.exclude(taskassignment__assigned_to_id=user.id)
 
-        # Only include Tasks whose total (possibly incomplete) assignments < assignments_per_task
-        hs = hs.annotate(ac=models.Count('taskassignment')).\
-            filter(ac__lt=self.assignments_per_task)
+        # Only include Tasks whose total (possibly incomplete) assignments < assignments_per_task.
+        # The assignments are counted in a subquery grouped by task_id, instead of annotating
+        # the Tasks, which on some backends groups by every Task column including the input.
+        full_task_ids = TaskAssignment.objects.\
+            filter(task__batch_id=self.id).\
+            values('task_id').\
+            annotate(ac=models.Count('id')).\
+            filter(ac__gte=self.assignments_per_task).\
+            values('task_id')
+        hs = hs.exclude(id__in=full_task_ids)
 
         return hs
 
     def available_task_ids_for(self, user):
         return self.available_tasks_for(user).values_list('id', flat=True)
 
+    def bulk_submit_answers(self, user, records, max_errors=100):
+        """Create completed Task Assignments for the user from answer records
+
+        Task Assignments are created using bulk inserts, and the Task
+        completion status is updated using one set-based update per
+        chunk of records, all in a single transaction.  A record is
+        skipped if the user has already completed the Task, or if the
+        Task already has assignments_per_task Task Assignments.  An
+        uncompleted Task Assignment the user holds for the Task is
+        replaced by the submitted one.
+
+        Args:
+            user (User):
+            records (iterable): Iterable of dicts with the keys
+                'task_id' (an int) and 'answers' (a dict), as returned
+                by utils.read_answer_records()
+            max_errors (int): Maximum number of error messages returned
+
+        Returns:
+            A dict with the number of 'submitted' and 'skipped' records,
+            and a list of at most max_errors 'errors' messages
+        """
+        summary = {'submitted': 0, 'skipped': 0, 'errors': []}
+
+        def skip(message):
+            summary['skipped'] += 1
+            if len(summary['errors']) < max_errors:
+                summary['errors'].append(message)
+
+        with transaction.atomic():
+            for chunk in _chunks(records, BULK_CHUNK_SIZE):
+                answers_by_task_id = {}
+                for record in chunk:
+                    task_id = record['task_id']
+                    if task_id in answers_by_task_id:
+                        skip(u'Duplicate answers for Task with ID {}'.format(task_id))
+                    else:
+                        answers_by_task_id[task_id] = record['answers']
+
+                task_ids = set(self.task_set.filter(id__in=answers_by_task_id.keys()).
+                               values_list('id', flat=True))
+                own_assignments = dict(
+                    TaskAssignment.objects.filter(task_id__in=task_ids, assigned_to=user).
+                    values_list('task_id', 'completed'))
+                assignment_counts = dict(
+                    TaskAssignment.objects.filter(task_id__in=task_ids).
+                    values('task_id').annotate(ac=models.Count('id')).
+                    values_list('task_id', 'ac'))
+
+                now = timezone.now()
+                expires_at = now + datetime.timedelta(hours=self.allotted_assignment_time)
+                new_assignments = []
+                replaced_task_ids = []
+                for task_id, answers in answers_by_task_id.items():
+                    if task_id not in task_ids:
+                        skip(u'Cannot find Task with ID {} in Batch {}'.format(task_id, self.id))
+                    elif own_assignments.get(task_id):
+                        skip(u'The Task with ID {} has already been completed by {}'.format(
+                            task_id, user.username))
+                    elif task_id not in own_assignments and \
+                            assignment_counts.get(task_id, 0) >= self.assignments_per_task:
+                        skip(u'The Task with ID {} is no longer available'.format(task_id))
+                    else:
+                        if task_id in own_assignments:
+                            replaced_task_ids.append(task_id)
+                        answers = dict(answers)
+                        answers.pop('csrfmiddlewaretoken', None)
+                        new_assignments.append(TaskAssignment(
+                            answers=answers,
+                            assigned_to=user,
+                            completed=True,
+                            expires_at=expires_at,
+                            task_id=task_id,
+                        ))
+
+                TaskAssignment.objects.filter(task_id__in=replaced_task_ids, assigned_to=user,
+                                              completed=False).delete()
+                TaskAssignment.objects.bulk_create(new_assignments)
+                self.update_completed_tasks([ta.task_id for ta in new_assignments])
+                CachedAnswer.add_task_assignments(new_assignments)
+                summary['submitted'] += len(new_assignments)
+
+        return summary
+
     def clean(self):
         # Without this guard condition for project_id, a
         # RelatedObjectDoesNotExist exception is thrown before a
@@ -145,43 +494,192 @@ class Batch(models.Model):
                 raise ValidationError('When login is not required to access a Project, ' +
                                       'the number of Assignments per Task must be 1')
 
+    def clone(self, name=None, created_by=None, **kwargs):
+        """Create an inactive copy of this Batch with a copy of each of its Tasks
+
+        The Tasks are copied by the database using a single
+        INSERT ... SELECT statement, so the input data of the Tasks is
+        never transferred to or from the server.  Task Assignments are
+        not copied.  The copy uses the same media files as this Batch.
+
+        Args:
+            name (str): Name of the new Batch.  Defaults to this
+                Batch's name followed by ' (copy)'
+            created_by (User): Optional User that created the new Batch
+            kwargs: Other Batch fields to change for the new Batch, e.g.
+                assignments_per_task or allotted_assignment_time
+
+        Returns:
+            The new Batch
+        """
+        fields = {
+            'allotted_assignment_time': self.allotted_assignment_time,
+            'assignments_per_task': self.assignments_per_task,
+            'duplicate_rows': self.duplicate_rows,
+            'duplicate_tasks': self.duplicate_tasks,
+            'filename': self.filename,
+            'input_csv_header': self.input_csv_header,
+            'project_id': self.project_id,
+        }
+        fields.update(kwargs)
+        batch = Batch(active=False, created_by=created_by,
+                      name=name or u'{} (copy)'.format(self.name), **fields)
+        batch.clean()
+
+        # Duplicate Tasks are never assigned, so they are always completed
+        qn = connection.ops.quote_name
+        sql = 'INSERT INTO {table} ({batch_id}, {completed}, {duplicate}, {input_csv_fields}, ' \
+              '{input_hash}) SELECT %s, {duplicate}, {duplicate}, {input_csv_fields}, ' \
+              '{input_hash} FROM {table} WHERE {batch_id} = %s ORDER BY {id}'.format(
+                  table=qn(Task._meta.db_table), batch_id=qn('batch_id'),
+                  completed=qn('completed'), duplicate=qn('duplicate'),
+                  input_csv_fields=qn('input_csv_fields'), input_hash=qn('input_hash'),
+                  id=qn('id'))
+        with transaction.atomic():
+            batch.save()
+            with connection.cursor() as cursor:
+                cursor.execute(sql, [batch.id, self.id])
+            # The media files themselves are shared with this Batch
+            for chunk in _chunks(self.batchmedia_set.all(), BULK_CHUNK_SIZE):
+                for batch_media in chunk:
+                    batch_media.id = None
+                    batch_media.batch = batch
+                BatchMedia.objects.bulk_create(chunk)
+        return batch
+
+    def csv_chunks(self, lineterminator='\r\n'):
+        """Yield the CSV output of to_csv() as blocks of bytes, for streaming responses
+        """
+        fieldnames, rows = self._results_data(self.task_set.all())
+        return csv_chunks(fieldnames, rows, lineterminator)
+
     def csv_results_filename(self):
         """Returns filename for CSV results file for this Batch
         """
-        batch_filename, extension = os.path.splitext(os.path.basename(self.filename))
+        batch_filename, extension = split_batch_filename(os.path.basename(self.filename))
 
         # We are following Mechanical Turk's naming conventions for results files
         return "{}-Batch_{}_results{}".format(batch_filename, self.id, extension)
 
-    def create_tasks_from_csv(self, csv_fh):
+    def jsonl_results_filename(self):
+        """Returns filename for JSON Lines results file for this Batch
         """
+        batch_filename, _ = split_batch_filename(os.path.basename(self.filename))
+        return "{}-Batch_{}_results.jsonl".format(batch_filename, self.id)
+
+    def create_tasks_from_csv(self, csv_fh, progress_callback=None, max_errors=None,
+                              filename=None, validate_header=None):
+        """
+        The file is read in a single pass.  Besides CSV files, TSV and
+        JSON Lines files (optionally compressed with gzip or bzip2) are
+        accepted; see turkle.formats for how the format is detected.
+        Tasks are inserted in chunks of BULK_CHUNK_SIZE rows, and each
+        chunk is committed in its own transaction.
+
+        If the number of fields in any row does not match the number of
+        fields in the header, or the file cannot be read to the end (e.g.
+        a truncated gzip file), no more Tasks are inserted, the Tasks that
+        were already inserted are deleted, and a ValidationError listing
+        the first max_errors errors is raised.
+
+        The hash of each row's input fields is computed in the same pass,
+        and rows with the same input as an existing Task are skipped or
+        linked as configured by duplicate_tasks.  Values that are the
+        path of one of the Batch's media files are replaced with the URL
+        of the file before they are hashed.  Values that are too
+        large to store in the Task table are moved to the blob store (see
+        turkle.blobs).  If the Project reuses answers, cached answers are
+        then copied to the new Tasks.
+
         Args:
             csv_fh (file-like object): File handle for CSV input
+            progress_callback (function): Optional function called with
+                the number of Tasks created and the number of bytes of
+                the file read so far after each chunk
+            max_errors (int): Maximum number of row errors reported,
+                defaults to the TURKLE_MAX_CSV_ERRORS setting
+            filename (str): Optional filename used to detect the format
+            validate_header (function): Optional function called with
+                the header fieldnames before any Tasks are created, which
+                raises a ValidationError if the header is not valid
 
         Returns:
             Number of Tasks created from CSV file
         """
-        header, data_rows = self._parse_csv(csv_fh)
-
+        if max_errors is None:
+            max_errors = getattr(settings, 'TURKLE_MAX_CSV_ERRORS', 20)
+
+        try:
+            header, data_rows = open_batch_file(csv_fh, filename)
+        except ValueError as ex:
+            raise ValidationError(str(ex))
+        if validate_header:
+            validate_header(header)
+        expected_fields = len(header)
+        errors = []
+
+        def valid_rows():
+            try:
+                for (i, row) in enumerate(data_rows):
+                    if isinstance(row, RowError) or len(row) != expected_fields:
+                        if len(errors) == max_errors:
+                            errors.append(CSV_TOO_MANY_ERRORS % max_errors)
+                            return
+                        if isinstance(row, RowError):
+                            errors.append(row.message)
+                        else:
+                            errors.append(CSV_ROW_WIDTH_ERROR % (expected_fields, i+2, len(row)))
+                    elif not errors:
+                        yield row
+            except ValueError as ex:
+                # The file is truncated, corrupt or not valid UTF-8
+                errors.append(str(ex))
+
+        columns = self._input_csv_columns(header)
+        media_urls = self.media_urls()
+        task_id_ranges = []
         num_created_tasks = 0
-        for row in data_rows:
-            if not row:
-                continue
-            task = Task(
-                batch=self,
-                input_csv_fields=dict(zip(header, row)),
-            )
-            task.save()
-            num_created_tasks += 1
-
+        num_duplicate_rows = 0
+        for chunk in _chunks(valid_rows(), BULK_CHUNK_SIZE):
+            input_rows = []
+            for row in chunk:
+                if media_urls:
+                    row = [media_urls.get(value, value) for value in row]
+                input_csv_fields = dict(zip(header, row))
+                input_hash = hash_input_csv_fields(input_csv_fields)
+                input_csv_fields = store_large_values(input_csv_fields)
+                input_rows.append((input_hash,
+                                   [input_csv_fields[c] for c in columns] if columns
+                                   else input_csv_fields))
+            (task_rows, num_duplicates) = self._deduplicate_rows(input_rows)
+            task_id_ranges.append(self._insert_tasks(lambda: Task.objects.bulk_create([
+                Task(batch=self, completed=duplicate, duplicate=duplicate,
+                     input_csv_fields=input_csv_fields, input_hash=input_hash)
+                for (input_hash, input_csv_fields, duplicate) in task_rows
+            ])))
+            num_created_tasks += len(task_rows)
+            num_duplicate_rows += num_duplicates
+            if progress_callback:
+                progress_callback(num_created_tasks, csv_fh.tell())
+
+        if errors:
+            self.task_set.filter(_in_task_id_ranges(task_id_ranges)).delete()
+            raise ValidationError(errors)
+
+        self._add_duplicate_rows(num_duplicate_rows)
+        self.reuse_cached_answers(task_id_ranges)
+        if num_created_tasks and self.active:
+            bump_availability_version()
         return num_created_tasks
 
     def expire_assignments(self):
-        TaskAssignment.objects.\
+        (total_deleted, _) = TaskAssignment.objects.\
             filter(completed=False).\
             filter(task__batch_id=self.id).\
             filter(expires_at__lt=timezone.now()).\
             delete()
+        if total_deleted:
+            bump_availability_version()
 
     def finished_tasks(self):
         """
@@ -200,6 +698,23 @@ class Batch(models.Model):
         return TaskAssignment.objects.filter(task__batch_id=self.id)\
                                      .filter(completed=True)
 
+    def is_ingested(self):
+        """
+        Returns:
+            False if the Tasks of the Batch are still being created (or
+            failed to be created) by a BatchIngestJob
+        """
+        try:
+            return self.ingest_job.status == BatchIngestJob.COMPLETED
+        except BatchIngestJob.DoesNotExist:
+            return True
+
+    def media_urls(self):
+        """Returns a dict mapping the paths of this Batch's media files to their URLs
+        """
+        return dict((batch_media.filename, batch_media.url())
+                    for batch_media in self.batchmedia_set.only('digest', 'filename'))
+
     def next_available_task_for(self, user):
         """Returns next available Task for the user, or None if no Tasks available
 
@@ -211,6 +726,73 @@ class Batch(models.Model):
         """
         return self.available_tasks_for(user).first()
 
+    def reuse_cached_answers(self, task_id_ranges=None):
+        """Complete Task Assignments for new Tasks using the Project's cached answers
+
+        If the Project reuses answers, each cached answer for the input
+        of a Task (up to assignments_per_task answers) is copied to a
+        completed Task Assignment for the Task.  Tasks with enough
+        cached answers are completed, and the other Tasks need fewer
+        Assignments from Workers.  The cache is queried once for each
+        chunk of BULK_CHUNK_SIZE Tasks, using its (project, input_hash)
+        index.
+
+        Args:
+            task_id_ranges (list): Optional (first_id, last_id) ranges
+                returned by _insert_tasks().  If set, only the Tasks
+                created in those ranges are checked.
+
+        Returns:
+            Number of Task Assignments created from cached answers
+        """
+        if not self.project.reuse_answers:
+            return 0
+
+        tasks = self.task_set.filter(duplicate=False)
+        if task_id_ranges is not None:
+            tasks = tasks.filter(_in_task_id_ranges(task_id_ranges))
+        after_task_id = 0
+        total_reused = 0
+        while True:
+            task_rows = list(tasks.
+                             filter(id__gt=after_task_id).
+                             order_by('id').
+                             values_list('id', 'input_hash')[:BULK_CHUNK_SIZE])
+            if not task_rows:
+                break
+            after_task_id = task_rows[-1][0]
+
+            # The most recent answers are used first
+            cached_answers_by_hash = {}
+            for cached_answer in CachedAnswer.objects.\
+                    filter(project_id=self.project_id,
+                           input_hash__in=set(h for (_, h) in task_rows)).\
+                    order_by('-id'):
+                cached_answers_by_hash.setdefault(cached_answer.input_hash, []).\
+                    append(cached_answer)
+
+            new_assignments = []
+            for (task_id, input_hash) in task_rows:
+                cached_answers = cached_answers_by_hash.get(input_hash, [])
+                for cached_answer in cached_answers[:self.assignments_per_task]:
+                    new_assignments.append(TaskAssignment(
+                        answers=cached_answer.answers,
+                        assigned_to_id=cached_answer.assigned_to_id,
+                        completed=True,
+                        task_id=task_id,
+                    ))
+            with transaction.atomic():
+                TaskAssignment.objects.bulk_create(new_assignments)
+                self.update_completed_tasks(list(set(ta.task_id for ta in new_assignments)))
+            total_reused += len(new_assignments)
+        return total_reused
+
+    def save(self, *args, **kwargs):
+        super(Batch, self).save(*args, **kwargs)
+        # The Batch may have just been published
+        if self.active:
+            bump_availability_version()
+
     def total_available_tasks_for(self, user):
         """Returns number of Tasks available for the user
 
@@ -247,6 +829,160 @@ class Batch(models.Model):
         for row in rows:
             writer.writerow(row)
 
+    def results_jsonl(self):
+        """Yield the results of the Batch as lines of JSON text
+
+        There is one JSON object per completed Task Assignment (and per
+        duplicate Task that shares it), with the fields of the CSV
+        results file, except that the input and answers are nested in
+        "input" and "answers" objects.  Rows are read as JSON text
+        instead of model instances, and the text of the answers, and of
+        inputs stored as objects, is copied into the output without
+        being decoded and encoded again.
+        """
+        # Fields that are the same for every Task Assignment of the Batch
+        prefix = u'{{"HITTypeId":{},"Title":{},"CreationTime":{},"MaxAssignments":{},' \
+            u'"AssignmentDurationInSeconds":{},'.format(
+                self.project_id, json.dumps(self.project.name),
+                json.dumps(self.created_at.isoformat()), self.assignments_per_task,
+                self.allotted_assignment_time * 3600)
+        key_prefixes = [json.dumps(k) + u':' for k in self.input_csv_header]
+
+        def jsonl_row(task_id, input_text, task_assignment_id, assigned_to_id, created_at,
+                      updated_at, answers_text):
+            return u'{}"HITId":{},"AssignmentId":{},"WorkerId":{},"AcceptTime":"{}",' \
+                u'"SubmitTime":"{}","WorkTimeInSeconds":{},"input":{},"answers":{}}}\n'.format(
+                    prefix, task_id, task_assignment_id, json.dumps(assigned_to_id),
+                    created_at.isoformat(), updated_at.isoformat(),
+                    int((updated_at - created_at).total_seconds()),
+                    _input_json_text(input_text, key_prefixes),
+                    decompress_json(answers_text) or u'{}')
+
+        task_assignments = TaskAssignment.objects.\
+            filter(task__batch_id=self.id, completed=True).\
+            order_by('id').\
+            values_list('task_id', 'task__input_csv_fields', 'id', 'assigned_to_id',
+                        'created_at', 'updated_at', 'answers')
+        for values in task_assignments.iterator():
+            yield jsonl_row(*values)
+
+        # Duplicate Tasks share the Task Assignments of the Task they duplicate
+        duplicate_tasks = list(self.task_set.filter(duplicate=True).order_by('id').
+                               values_list('id', 'input_csv_fields', 'input_hash'))
+        if duplicate_tasks:
+            assignments_by_hash = {}
+            original_assignments = self._original_assignments(
+                set(input_hash for (_, _, input_hash) in duplicate_tasks)).\
+                order_by('id').\
+                values_list('task__input_hash', 'id', 'assigned_to_id', 'created_at',
+                            'updated_at', 'answers')
+            for values in original_assignments:
+                assignments_by_hash.setdefault(values[0], []).append(values[1:])
+            for (task_id, input_text, input_hash) in duplicate_tasks:
+                for values in assignments_by_hash.get(input_hash, []):
+                    yield jsonl_row(task_id, input_text, *values)
+
+    def results_since(self, cursor=None, limit=None):
+        """Returns the results of the Task Assignments saved after a cursor
+
+        The Task Assignments are found using an index on their
+        (saved_at, id) fields, so the cost is proportional to the
+        number of new results.  Task Assignments are saved when they are
+        completed, so polling with the returned cursor returns each new
+        result once.
+
+        saved_at is set when a row is written, not when its transaction
+        commits, so a slow transaction can commit a row that is older
+        than a cursor that was already returned.  Rows saved less than
+        TURKLE_RESULTS_CURSOR_LAG seconds ago (10 by default) are
+        therefore left for a later call.  Rows committed more than that
+        long after they were written may be missed.
+
+        Args:
+            cursor (tuple): Optional (saved_at, id) cursor returned by
+                an earlier call.  If None, all results are returned.
+            limit (int): Optional maximum number of Task Assignments
+
+        Returns:
+            A (fieldnames, rows, cursor) tuple, where fieldnames and rows
+            are in the format of the results CSV file, and cursor is the
+            cursor for the next call
+        """
+        lag = getattr(settings, 'TURKLE_RESULTS_CURSOR_LAG', 10)
+        before = timezone.now() - datetime.timedelta(seconds=lag) if lag else None
+        results = self._results(self.task_set.all(), after=cursor, before=before, limit=limit)
+        input_field_set = set()
+        answer_field_set = set()
+        rows = []
+        for (task, task_assignment) in results:
+            input_field_set.update(task.input_csv_fields.keys())
+            answer_field_set.update(task_assignment.answers.keys())
+            rows.append(Batch._result_row(task, task_assignment))
+        cursors = [_cursor(task_assignment) for (_, task_assignment) in results]
+        if cursor:
+            cursors.append(cursor)
+        return (self._csv_fieldnames(input_field_set, answer_field_set), rows,
+                max(cursors) if cursors else None)
+
+    def results_since_to_csv(self, csv_fh, cursor=None, limit=None, lineterminator='\r\n'):
+        """Write CSV output to file handle for the results saved after a cursor
+
+        Args:
+            csv_fh (file-like object): File handle for CSV output
+            cursor (tuple): See results_since()
+            limit (int): See results_since()
+
+        Returns:
+            The cursor for the next call
+        """
+        (fieldnames, rows, cursor) = self.results_since(cursor, limit)
+        writer = unicodecsv.DictWriter(csv_fh, fieldnames, lineterminator=lineterminator,
+                                       quoting=unicodecsv.QUOTE_ALL)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+        return cursor
+
+    def top_up_assignments(self, assignments_per_task):
+        """Raise the number of Assignments per Task, reopening completed Tasks
+
+        Tasks that no longer have enough completed Task Assignments are
+        marked as not completed using a single set-based UPDATE.  The
+        Batch row is locked while the Tasks are updated, so that the
+        number of Assignments per Task cannot be changed concurrently.
+
+        Args:
+            assignments_per_task (int): New number of Assignments per Task,
+                which cannot be less than the current number
+
+        Returns:
+            Number of Tasks that were reopened
+        """
+        with transaction.atomic():
+            batch = Batch.objects.select_for_update().get(id=self.id)
+            if assignments_per_task < batch.assignments_per_task:
+                raise ValidationError('The number of Assignments per Task cannot be reduced '
+                                      'from %d to %d' %
+                                      (batch.assignments_per_task, assignments_per_task))
+            batch.assignments_per_task = assignments_per_task
+            batch.clean()
+            Batch.objects.filter(id=self.id).update(assignments_per_task=assignments_per_task)
+            self.assignments_per_task = assignments_per_task
+
+            completed_task_ids = TaskAssignment.objects.\
+                filter(task__batch_id=self.id, completed=True).\
+                values('task_id').\
+                annotate(cac=models.Count('id')).\
+                filter(cac__gte=assignments_per_task).\
+                values('task_id')
+            total_reopened = self.task_set.filter(completed=True, duplicate=False).\
+                exclude(id__in=completed_task_ids).\
+                update(completed=False)
+
+        if total_reopened and self.active:
+            bump_availability_version()
+        return total_reopened
+
     def unfinished_tasks(self):
         """
         Returns:
@@ -255,25 +991,124 @@ class Batch(models.Model):
         """
         return self.task_set.filter(completed=False).order_by('id')
 
-    def _parse_csv(self, csv_fh):
+    def update_completed_tasks(self, task_ids):
+        """Mark Tasks as completed if enough of their Assignments have been completed
+
+        Uses a single set-based UPDATE instead of checking each Task.
+
+        Args:
+            task_ids (list): IDs of Tasks in this Batch to check
+
+        Returns:
+            Number of Tasks marked as completed
+        """
+        if not task_ids:
+            return 0
+        completed_task_ids = TaskAssignment.objects.\
+            filter(task_id__in=task_ids, completed=True).\
+            values('task_id').\
+            annotate(cac=models.Count('id')).\
+            filter(cac__gte=self.assignments_per_task).\
+            values('task_id')
+        return self.task_set.filter(completed=False, id__in=completed_task_ids).\
+            update(completed=True)
+
+    def _add_duplicate_rows(self, num_duplicate_rows):
+        if num_duplicate_rows:
+            Batch.objects.filter(id=self.id).update(
+                duplicate_rows=models.F('duplicate_rows') + num_duplicate_rows)
+            self.duplicate_rows += num_duplicate_rows
+
+    def _input_csv_columns(self, header):
+        """Returns the fieldnames used to store the input of new Tasks as lists of values
+
+        The header of the file used to create the first Tasks of a
+        Batch is saved as the Batch's input_csv_header.  Tasks created
+        from rows with the same fieldnames (in any order) store a list
+        of values in the order of the input_csv_header.
+
+        Returns:
+            The Batch's input_csv_header, or None if the Tasks should
+            store a dict (if the fieldnames do not match the header, if
+            the Batch already has Tasks stored as dicts, or if the
+            TURKLE_COLUMNAR_TASK_INPUTS setting is False)
+        """
+        if not getattr(settings, 'TURKLE_COLUMNAR_TASK_INPUTS', True):
+            return None
+        if not self.task_set.exists():
+            self.input_csv_header = list(OrderedDict.fromkeys(header))
+            Batch.objects.filter(id=self.id).update(input_csv_header=self.input_csv_header)
+        elif not self.input_csv_header or set(header) != set(self.input_csv_header):
+            return None
+        return self.input_csv_header
+
+    def _insert_tasks(self, insert):
+        """Create Tasks for the Batch in a transaction, and return the range of their IDs
+
+        The Batch is locked while the Tasks are inserted, so that Tasks
+        created for the Batch at the same time by another ingest or
+        append are not mistaken for them.
+
+        Args:
+            insert (function): Function that inserts the Tasks
+
+        Returns:
+            A (first_id, last_id) tuple.  The inserted Tasks are the
+            Tasks of the Batch with an ID greater than first_id and at
+            most last_id.
         """
+        with transaction.atomic():
+            list(Batch.objects.select_for_update().filter(id=self.id).values_list('id'))
+            first_id = self.task_set.aggregate(models.Max('id'))['id__max'] or 0
+            insert()
+            last_id = self.task_set.aggregate(models.Max('id'))['id__max'] or 0
+        return (first_id, last_id)
+
+    def _deduplicate_rows(self, input_rows):
+        """Find the rows of an uploaded file that duplicate the input of an existing Task
+
+        Existing Tasks are looked up with a single query on the indexed
+        input_hash field.  Rows that duplicate an earlier row in
+        input_rows are also duplicates.
+
         Args:
-            csv_fh (file-like object): File handle for CSV output
+            input_rows (list): (input_hash, value) tuples, in file order
 
         Returns:
-            A tuple where the first value is a list of strings for the
-            header fieldnames, and the second value is an iterable
-            that returns a list of values for the rest of the roww in
-            the CSV file.
+            A tuple where the first value is a list of (input_hash, value,
+            duplicate) tuples for the Tasks that should be created, and
+            the second value is the number of duplicate rows
         """
-        rows = unicodecsv.reader(csv_fh)
-        header = next(rows)
-        return header, rows
+        if self.duplicate_tasks == Batch.KEEP_DUPLICATES:
+            return ([(input_hash, value, False) for (input_hash, value) in input_rows], 0)
 
-    def _get_csv_fieldnames(self, task_queryset):
+        if self.duplicate_tasks in (Batch.SKIP_BATCH_DUPLICATES, Batch.LINK_BATCH_DUPLICATES):
+            tasks = self.task_set.all()
+        else:
+            tasks = Task.objects.filter(batch__project_id=self.project_id)
+        seen_hashes = set(tasks.
+                          filter(input_hash__in=set(h for (h, _) in input_rows)).
+                          values_list('input_hash', flat=True))
+        link = self.duplicate_tasks in (Batch.LINK_BATCH_DUPLICATES,
+                                        Batch.LINK_PROJECT_DUPLICATES)
+        task_rows = []
+        num_duplicates = 0
+        for (input_hash, value) in input_rows:
+            if input_hash in seen_hashes:
+                num_duplicates += 1
+                if link:
+                    task_rows.append((input_hash, value, True))
+            else:
+                seen_hashes.add(input_hash)
+                task_rows.append((input_hash, value, False))
+        return (task_rows, num_duplicates)
+
+    def _get_csv_fieldnames(self, task_queryset, duplicate_results=()):
         """
         Args:
             task_queryset (QuerySet):
+            duplicate_results (list): (Task, TaskAssignment) tuples for
+                the results shared by duplicate Tasks
 
         Returns:
             A tuple of strings specifying the fieldnames to be used in
@@ -287,9 +1122,16 @@ class Batch(models.Model):
         for task_assignment in task_assignments:
             input_field_set.update(task_assignment.task.input_csv_fields.keys())
 
-            # If the answers JSONField is empty, it evaluates as a string instead of a dict
+            # If the answers field is empty, it evaluates as a string instead of a dict
             if task_assignment.answers != u'':
                 answer_field_set.update(task_assignment.answers.keys())
+        for (task, task_assignment) in duplicate_results:
+            input_field_set.update(task.input_csv_fields.keys())
+            answer_field_set.update(task_assignment.answers.keys())
+        return self._csv_fieldnames(input_field_set, answer_field_set)
+
+    @staticmethod
+    def _csv_fieldnames(input_field_set, answer_field_set):
         return tuple(
             [u'HITId', u'HITTypeId', u'Title', u'CreationTime', u'MaxAssignments',
              u'AssignmentDurationInSeconds', u'AssignmentId', u'WorkerId',
@@ -298,49 +1140,171 @@ class Batch(models.Model):
             [u'Answer.' + k for k in sorted(answer_field_set)]
         )
 
-    def _results_data(self, task_queryset):
+    def _results_data(self, task_queryset, results=None):
         """
         All completed Tasks must come from the same project so that they have the
         same field names.
 
         Args:
             task_queryset (QuerySet):
+            results (list): Optional (Task, TaskAssignment) tuples
+                returned by _results() for task_queryset
 
         Returns:
             A tuple where the first value is a list of fieldname strings, and
             the second value is a list of dicts, where the keys to these
             dicts are the values of the fieldname strings.
         """
-        rows = []
-        time_format = '%a %b %m %H:%M:%S %Z %Y'
+        if results is None:
+            results = self._results(task_queryset)
+        rows = [Batch._result_row(task, task_assignment) for (task, task_assignment) in results]
+        duplicate_results = [(task, task_assignment) for (task, task_assignment) in results
+                             if task.duplicate]
+        return self._get_csv_fieldnames(task_queryset, duplicate_results), rows
+
+    def _results(self, task_queryset, after=None, before=None, limit=None):
+        """
+        Args:
+            task_queryset (QuerySet):
+            after (tuple): Optional (saved_at, id) cursor.  Only the
+                Task Assignments that were last saved after the cursor
+                are returned.
+            before (datetime): Optional time.  Only the Task Assignments
+                that were last saved before it are returned.
+            limit (int): Optional maximum number of Task Assignments.
+                If set, the results are sorted by (saved_at, id), and
+                only the results of the first limit Task Assignments
+                saved after the cursor are returned.
+
+        Returns:
+            A list of (Task, TaskAssignment) tuples for the completed
+            Task Assignments of the Tasks, including the results shared
+            by duplicate Tasks
+        """
+        results = []
+        # The (saved_at, id) cursors of the last Task Assignments of the
+        # queries that were truncated by the limit
+        limit_cursors = []
         task_assignments = TaskAssignment.objects.\
             filter(task__in=task_queryset).\
             filter(completed=True).\
             prefetch_related(Prefetch('task', queryset=task_queryset))
+        if after:
+            task_assignments = task_assignments.filter(_after_cursor(after))
+        if before:
+            task_assignments = task_assignments.filter(saved_at__lt=before)
+        if limit:
+            task_assignments = list(task_assignments.order_by('saved_at', 'id')[:limit])
+            if len(task_assignments) == limit:
+                limit_cursors.append(_cursor(task_assignments[-1]))
         for task_assignment in task_assignments:
-            task = task_assignment.task
-            batch = task.batch
-            project = task.batch.project
-
-            row = {
-                'HITId': task.id,
-                'HITTypeId': project.id,
-                'Title': project.name,
-                'CreationTime': batch.created_at.strftime(time_format),
-                'MaxAssignments': batch.assignments_per_task,
-                'AssignmentDurationInSeconds': batch.allotted_assignment_time * 3600,
-                'AssignmentId': task_assignment.id,
-                'WorkerId': task_assignment.assigned_to_id,
-                'AcceptTime': task_assignment.created_at.strftime(time_format),
-                'SubmitTime': task_assignment.updated_at.strftime(time_format),
-                'WorkTimeInSeconds': int((task_assignment.updated_at -
-                                          task_assignment.created_at).total_seconds()),
-            }
-            row.update({u'Input.' + k: v for k, v in task.input_csv_fields.items()})
-            row.update({u'Answer.' + k: v for k, v in task_assignment.answers.items()})
-            rows.append(row)
-
-        return self._get_csv_fieldnames(task_queryset), rows
+            results.append((task_assignment.task, task_assignment))
+
+        # Duplicate Tasks share the Task Assignments of the Task they duplicate
+        duplicate_tasks = list(task_queryset.filter(duplicate=True).select_related('batch'))
+        if duplicate_tasks:
+            original_assignments = self._original_assignments(
+                set(t.input_hash for t in duplicate_tasks)).\
+                select_related('task').\
+                only('answers', 'assigned_to_id', 'created_at', 'saved_at',
+                     'task__input_hash', 'updated_at')
+            if after:
+                original_assignments = original_assignments.filter(_after_cursor(after))
+            if before:
+                original_assignments = original_assignments.filter(saved_at__lt=before)
+            if limit:
+                original_assignments = list(
+                    original_assignments.order_by('saved_at', 'id')[:limit])
+                if len(original_assignments) == limit:
+                    limit_cursors.append(_cursor(original_assignments[-1]))
+            assignments_by_hash = {}
+            for task_assignment in original_assignments:
+                assignments_by_hash.setdefault(task_assignment.task.input_hash, []).\
+                    append(task_assignment)
+            for task in duplicate_tasks:
+                for task_assignment in assignments_by_hash.get(task.input_hash, []):
+                    results.append((task, task_assignment))
+
+        if limit:
+            results.sort(key=lambda result: _cursor(result[1]))
+            if limit_cursors:
+                # Later Task Assignments may be missing from the other query
+                last_cursor = min(limit_cursors)
+                results = [r for r in results if _cursor(r[1]) <= last_cursor]
+        return results
+
+    def _original_assignments(self, input_hashes):
+        """
+        Returns:
+            A QuerySet of the completed Task Assignments whose results are
+            shared by duplicate Tasks with the given input hashes
+        """
+        if self.duplicate_tasks == Batch.LINK_BATCH_DUPLICATES:
+            original_assignments = TaskAssignment.objects.filter(task__batch_id=self.id)
+        else:
+            original_assignments = TaskAssignment.objects.filter(
+                task__batch__project_id=self.project_id)
+        return original_assignments.filter(completed=True, task__duplicate=False,
+                                           task__input_hash__in=input_hashes)
+
+    def _results_state(self):
+        """Describes the current results of the Batch without reading them
+
+        Returns:
+            A (row_count, cursor) tuple, where row_count is the number of
+            rows in the results CSV file, and cursor is the (saved_at, id)
+            tuple of the last saved Task Assignment in the results, or
+            None if there are no results
+        """
+        task_assignments = TaskAssignment.objects.filter(task__batch_id=self.id, completed=True)
+        row_count = task_assignments.count()
+        cursors = [task_assignments.order_by('-saved_at', '-id').
+                   values_list('saved_at', 'id').first()]
+
+        duplicate_counts = dict(self.task_set.filter(duplicate=True).
+                                values_list('input_hash').annotate(c=models.Count('id')).
+                                order_by())
+        if duplicate_counts:
+            original_assignments = self._original_assignments(duplicate_counts.keys())
+            for (input_hash, count) in original_assignments.values_list('task__input_hash').\
+                    annotate(c=models.Count('id')).order_by():
+                row_count += count * duplicate_counts[input_hash]
+            cursors.append(original_assignments.order_by('-saved_at', '-id').
+                           values_list('saved_at', 'id').first())
+
+        cursors = [c for c in cursors if c]
+        return (row_count, max(cursors) if cursors else None)
+
+    def _results_signature(self):
+        """Returns a digest of the Batch and Project fields copied into every results row
+        """
+        return hashlib.sha1(json.dumps([
+            self.project.name, self.created_at.isoformat(), self.assignments_per_task,
+            self.allotted_assignment_time]).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def _result_row(task, task_assignment):
+        batch = task.batch
+        project = task.batch.project
+        time_format = '%a %b %m %H:%M:%S %Z %Y'
+
+        row = {
+            'HITId': task.id,
+            'HITTypeId': project.id,
+            'Title': project.name,
+            'CreationTime': batch.created_at.strftime(time_format),
+            'MaxAssignments': batch.assignments_per_task,
+            'AssignmentDurationInSeconds': batch.allotted_assignment_time * 3600,
+            'AssignmentId': task_assignment.id,
+            'WorkerId': task_assignment.assigned_to_id,
+            'AcceptTime': task_assignment.created_at.strftime(time_format),
+            'SubmitTime': task_assignment.updated_at.strftime(time_format),
+            'WorkTimeInSeconds': int((task_assignment.updated_at -
+                                      task_assignment.created_at).total_seconds()),
+        }
+        row.update({u'Input.' + k: v for k, v in task.resolved_input_csv_fields().items()})
+        row.update({u'Answer.' + k: v for k, v in task_assignment.answers.items()})
+        return row
 
     def __unicode__(self):
         return 'Batch: {}'.format(self.name)
@@ -349,6 +1313,398 @@ class Batch(models.Model):
         return 'Batch: {}'.format(self.name)
 
 
+class BatchExport(models.Model):
+    """Results CSV file of a Batch that is kept in the export directory
+
+    The Task Assignments in the file are tracked with the number of
+    rows and the (saved_at, id) cursor of the last saved Task
+    Assignment, so that new results can be appended to the file (see
+    turkle.exports).
+    """
+    class Meta:
+        unique_together = (('batch', 'lineterminator'),)
+
+    batch = models.ForeignKey(Batch, on_delete=models.CASCADE)
+    cursor_id = models.IntegerField(default=0)
+    cursor_saved_at = models.DateTimeField(null=True)
+    fieldnames = JSONField(default=list)
+    lineterminator = models.CharField(max_length=2)
+    row_count = models.IntegerField(default=0)
+    signature = models.CharField(max_length=40)
+    size = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    version = models.IntegerField(default=0)
+
+    @classmethod
+    def get_current(cls, batch, lineterminator='\r\n'):
+        """Returns the export of a Batch, after bringing its file up to date
+
+        Checking whether the file is up to date only counts the
+        completed Task Assignments of the Batch.  New results are
+        appended to the file when possible, and the file is rebuilt
+        otherwise.
+
+        Returns:
+            A BatchExport, or None if cached exports are disabled
+        """
+        if not get_export_dir():
+            return None
+        (row_count, cursor) = batch._results_state()
+        signature = batch._results_signature()
+        with transaction.atomic():
+            (export, created) = cls.objects.select_for_update().\
+                get_or_create(batch=batch, lineterminator=lineterminator)
+            if not created and export.signature == signature and \
+               os.path.exists(export.path()):
+                if export.row_count == row_count and export.cursor() == cursor:
+                    return export
+                if export._append(batch, row_count):
+                    return export
+            export._rebuild(batch, signature)
+        return export
+
+    def cursor(self):
+        """Returns the (saved_at, id) cursor of the last Task Assignment in the file
+        """
+        if self.cursor_saved_at is None:
+            return None
+        return (self.cursor_saved_at, self.cursor_id)
+
+    def etag(self):
+        return '"{}-{}"'.format(self.id, self.version)
+
+    def path(self):
+        return export_path(get_export_dir(), self.batch_id, self.lineterminator)
+
+    def _append(self, batch, row_count):
+        """Append the results saved after the cursor to the file
+
+        Returns:
+            False if the file is stale and must be rebuilt instead
+        """
+        results = batch._results(batch.task_set.all(), after=self.cursor())
+        if not results or self.row_count + len(results) != row_count:
+            return False
+        rows = [Batch._result_row(task, task_assignment) for (task, task_assignment) in results]
+        fieldnames = set(self.fieldnames)
+        if any(set(row.keys()) - fieldnames for row in rows):
+            return False
+        self.size = append_export(self.path(), self.size, self.fieldnames, rows,
+                                  self.lineterminator)
+        self._update(results, self.row_count + len(results))
+        return True
+
+    def _rebuild(self, batch, signature):
+        task_queryset = batch.task_set.all()
+        results = batch._results(task_queryset)
+        (fieldnames, rows) = batch._results_data(task_queryset, results)
+        self.fieldnames = list(fieldnames)
+        self.signature = signature
+        self.cursor_saved_at = None
+        self.cursor_id = 0
+        self.size = write_export(self.path(), fieldnames, rows, self.lineterminator)
+        self._update(results, len(results))
+
+    def _update(self, results, row_count):
+        cursors = [_cursor(task_assignment) for (_, task_assignment) in results]
+        if self.cursor():
+            cursors.append(self.cursor())
+        if cursors:
+            (self.cursor_saved_at, self.cursor_id) = max(cursors)
+        self.row_count = row_count
+        self.version += 1
+        self.save()
+
+
+class BatchIngestJob(models.Model):
+    """Background job that creates the Tasks for a Batch from an uploaded CSV file
+
+    The CSV file is spooled to disk when the Batch is uploaded, and the
+    job is run either immediately or by the ingest_worker management
+    command (if TURKLE_BACKGROUND_INGEST is set).  The Batch cannot be
+    published until the job is COMPLETED.
+    """
+    class Meta:
+        verbose_name = "Batch Ingest Job"
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    COMPLETED = 'completed'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (COMPLETED, 'Completed'),
+        (FAILED, 'Failed'),
+    )
+
+    activate_on_completion = models.BooleanField(default=False)
+    batch = models.OneToOneField(Batch, on_delete=models.CASCADE, related_name='ingest_job')
+    bytes_processed = models.BigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    csv_path = models.CharField(max_length=1024)
+    error = models.TextField(blank=True)
+    status = models.CharField(choices=STATUS_CHOICES, db_index=True, default=PENDING,
+                              max_length=16)
+    tasks_created = models.IntegerField(default=0)
+    total_bytes = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Cancelled(Exception):
+        pass
+
+    @classmethod
+    def claim_next(cls):
+        """Claim the oldest pending job for this process
+
+        Running jobs that have not reported progress for
+        TURKLE_INGEST_STALE_SECONDS are assumed to belong to a worker
+        that died, and are claimed again.
+
+        Returns:
+            The claimed BatchIngestJob, or None if there are no jobs to run
+        """
+        stale_seconds = getattr(settings, 'TURKLE_INGEST_STALE_SECONDS', 600)
+        stale_before = timezone.now() - datetime.timedelta(seconds=stale_seconds)
+        candidates = cls.objects.\
+            filter(models.Q(status=cls.PENDING) |
+                   models.Q(status=cls.RUNNING, updated_at__lt=stale_before)).\
+            order_by('id')
+        for job in candidates:
+            # Another worker may claim the same job first
+            claimed = cls.objects.\
+                filter(id=job.id, status=job.status, updated_at=job.updated_at).\
+                update(status=cls.RUNNING, updated_at=timezone.now())
+            if claimed:
+                job.status = cls.RUNNING
+                return job
+        return None
+
+    def progress(self):
+        """
+        Returns:
+            Dictionary describing the progress of the job
+        """
+        return {
+            'bytes_processed': self.bytes_processed,
+            'error': self.error,
+            'status': self.status,
+            'tasks_created': self.tasks_created,
+            'total_bytes': self.total_bytes,
+        }
+
+    def run(self):
+        """Create the Tasks for the Batch from the spooled CSV file
+
+        Tasks left behind by a previous, interrupted run are deleted
+        first.  If ingestion fails, all Tasks created by the job are
+        deleted and the job is marked as FAILED.  If the
+        TURKLE_INGEST_PROCESSES setting is greater than 1, uncompressed
+        CSV files are parsed by a pool of worker processes, unless the
+        job is run inside a transaction (e.g. by the admin when
+        TURKLE_BACKGROUND_INGEST is not set).
+        """
+        from turkle.ingest import create_tasks_in_parallel
+
+        def update_progress(tasks_created, bytes_processed):
+            updated = BatchIngestJob.objects.filter(id=self.id).update(
+                bytes_processed=bytes_processed,
+                tasks_created=tasks_created,
+                updated_at=timezone.now())
+            if not updated:
+                # The Batch was deleted while the job was running
+                raise BatchIngestJob.Cancelled()
+
+        batch = self.batch
+        batch.task_set.all().delete()
+        Batch.objects.filter(id=batch.id).update(duplicate_rows=0)
+        batch.duplicate_rows = 0
+        processes = getattr(settings, 'TURKLE_INGEST_PROCESSES', 1)
+        try:
+            with open(self.csv_path, 'rb') as csv_fh:
+                # Only uncompressed CSV files can be split for parallel parsing
+                if processes > 1 and not connection.in_atomic_block and \
+                   detect_format(csv_fh, batch.filename) == (None, CSV):
+                    self.tasks_created = create_tasks_in_parallel(
+                        batch, self.csv_path, processes, progress_callback=update_progress)
+                else:
+                    self.tasks_created = batch.create_tasks_from_csv(
+                        csv_fh, progress_callback=update_progress, filename=batch.filename)
+        except BatchIngestJob.Cancelled:
+            return
+        except Exception as ex:
+            batch.task_set.all().delete()
+            if isinstance(ex, ValidationError):
+                self.error = '\n'.join(ex.messages)
+            else:
+                self.error = str(ex)
+            self.status = BatchIngestJob.FAILED
+            self.tasks_created = 0
+        else:
+            self.bytes_processed = self.total_bytes
+            self.status = BatchIngestJob.COMPLETED
+            if self.activate_on_completion:
+                batch.active = True
+                batch.save()
+        self.save()
+        self.remove_csv_file()
+
+    def remove_csv_file(self):
+        try:
+            os.remove(self.csv_path)
+        except OSError:
+            pass
+
+    def __unicode__(self):
+        return 'Ingest Job for Batch {}'.format(self.batch_id)
+
+    def __str__(self):
+        return 'Ingest Job for Batch {}'.format(self.batch_id)
+
+
+class BatchMedia(models.Model):
+    """Media file (image, audio...) uploaded with a Batch in a media archive
+
+    The content of the file is kept in the media store (see turkle.media),
+    and CSV values that are the path of the file in the archive are
+    replaced with the URL of the file when Tasks are created.
+    """
+    class Meta:
+        unique_together = (('batch', 'filename'),)
+        verbose_name = "Batch Media"
+        verbose_name_plural = "Batch Media"
+
+    batch = models.ForeignKey(Batch, on_delete=models.CASCADE)
+    content_type = models.CharField(max_length=255, blank=True)
+    digest = models.CharField(db_index=True, max_length=64)
+    filename = models.CharField(max_length=255)
+    size = models.BigIntegerField(default=0)
+
+    @classmethod
+    def add_archive(cls, batch, archive_fh):
+        """Store the files of a zip or tar media archive for a Batch
+
+        Files are added to the media store one at a time, so the memory
+        used does not depend on the size of the archive.  A file with the
+        same path as a file from an earlier archive replaces it.
+
+        Returns:
+            Number of files in the archive
+
+        Raises:
+            ValidationError if media archives are disabled, or the file
+            is not a zip or tar archive
+        """
+        media_dir = get_media_dir()
+        if not media_dir:
+            raise ValidationError('Media archives cannot be uploaded, because the '
+                                  'TURKLE_MEDIA_DIR setting is not set')
+        batch_media = OrderedDict()
+        try:
+            for (filename, member_fh) in read_media_archive(archive_fh):
+                if len(filename) > cls._meta.get_field('filename').max_length:
+                    raise ValidationError(u'The path of the media file "{}" is too long'.
+                                          format(filename))
+                (digest, size) = store_media_file(media_dir, member_fh)
+                batch_media[filename] = cls(
+                    batch=batch,
+                    content_type=mimetypes.guess_type(filename)[0] or 'application/octet-stream',
+                    digest=digest,
+                    filename=filename,
+                    size=size)
+        except ValueError as ex:
+            raise ValidationError(str(ex))
+
+        with transaction.atomic():
+            for chunk in _chunks(batch_media.keys(), BULK_CHUNK_SIZE):
+                cls.objects.filter(batch=batch, filename__in=chunk).delete()
+            for chunk in _chunks(batch_media.values(), BULK_CHUNK_SIZE):
+                cls.objects.bulk_create(chunk)
+        return len(batch_media)
+
+    def path(self):
+        return media_path(get_media_dir(), self.digest)
+
+    def url(self):
+        return reverse('batch_media', kwargs={'digest': self.digest,
+                                              'filename': self.filename})
+
+    def __unicode__(self):
+        return self.filename
+
+    def __str__(self):
+        return self.filename
+
+
+class CachedAnswer(models.Model):
+    """Answers submitted for a Task input, which can be reused for Tasks with the same input
+
+    Only answers for the Tasks of Projects that reuse answers are
+    cached.  The cache is keyed by the Project and the Task's
+    input_hash, and holds the most recent answers of each Worker.
+    """
+    class Meta:
+        index_together = (('project', 'input_hash'),)
+        verbose_name = "Cached Answer"
+
+    answers = CompressedJSONField(blank=True)
+    assigned_to = models.ForeignKey(User, null=True, on_delete=models.CASCADE)
+    created_at = models.DateTimeField(auto_now_add=True)
+    input_hash = models.CharField(max_length=64)
+    project = models.ForeignKey('Project', on_delete=models.CASCADE)
+
+    @classmethod
+    def add_task_assignments(cls, task_assignments):
+        """Add the answers of completed Task Assignments to the cache
+
+        The previous answers of the Workers for the same inputs are
+        replaced using one DELETE for each Project and Worker.
+
+        Args:
+            task_assignments (list): Completed TaskAssignment objects
+        """
+        task_ids = set(ta.task_id for ta in task_assignments)
+        if not task_ids:
+            return
+        task_rows = dict((task_id, (input_hash, project_id)) for (task_id, input_hash, project_id)
+                         in Task.objects.
+                         filter(id__in=task_ids, batch__project__reuse_answers=True).
+                         values_list('id', 'input_hash', 'batch__project_id'))
+        if not task_rows:
+            return
+
+        cached_answers = []
+        # Index in cached_answers of the last answers of each Worker for an input
+        worker_answer_index = {}
+        for task_assignment in task_assignments:
+            if task_assignment.task_id not in task_rows:
+                continue
+            (input_hash, project_id) = task_rows[task_assignment.task_id]
+            if task_assignment.assigned_to_id:
+                key = (project_id, task_assignment.assigned_to_id, input_hash)
+                if key in worker_answer_index:
+                    cached_answers[worker_answer_index[key]] = None
+                worker_answer_index[key] = len(cached_answers)
+            cached_answers.append(cls(answers=task_assignment.answers,
+                                      assigned_to_id=task_assignment.assigned_to_id,
+                                      input_hash=input_hash, project_id=project_id))
+
+        # Replaces the Workers' previous answers for the same inputs
+        input_hashes = {}
+        for (project_id, assigned_to_id, input_hash) in worker_answer_index:
+            input_hashes.setdefault((project_id, assigned_to_id), set()).add(input_hash)
+        for ((project_id, assigned_to_id), hashes) in input_hashes.items():
+            cls.objects.filter(project_id=project_id, assigned_to_id=assigned_to_id,
+                               input_hash__in=hashes).delete()
+        cls.objects.bulk_create([ca for ca in cached_answers if ca is not None])
+
+    def __unicode__(self):
+        return 'Cached Answer id:{}'.format(self.id)
+
+    def __str__(self):
+        return 'Cached Answer id:{}'.format(self.id)
+
+
 class Project(models.Model):
     class Meta:
         permissions = (
@@ -366,6 +1722,7 @@ class Project(models.Model):
     html_template_has_submit_button = models.BooleanField(default=False)
     login_required = models.BooleanField(db_index=True, default=True)
     name = models.CharField(max_length=1024)
+    reuse_answers = models.BooleanField(default=False)
     updated_at = models.DateTimeField(auto_now=True)
     updated_by = models.ForeignKey(User, null=True, related_name='updated_projects')
 
@@ -386,8 +1743,21 @@ class Project(models.Model):
         if not user.is_authenticated:
             projects = projects.filter(login_required=False)
 
-        projects = [p for p in projects if p.available_for(user)]
-        return projects
+        # Only the Projects with custom permissions are loaded, so that
+        # callers still get a QuerySet of every available Project
+        custom_projects = list(projects.filter(custom_permissions=True))
+        if not custom_projects:
+            return projects
+        if user.is_authenticated:
+            # Fetch the permissions for all of the Projects with two queries,
+            # instead of two queries per Project
+            checker = ObjectPermissionChecker(user)
+            checker.prefetch_perms(custom_projects)
+            unavailable_ids = [p.id for p in custom_projects
+                               if not checker.has_perm('can_work_on', p)]
+        else:
+            unavailable_ids = [p.id for p in custom_projects if not p.available_for(user)]
+        return projects.exclude(id__in=unavailable_ids)
 
     def available_for(self, user):
         """
@@ -420,6 +1790,24 @@ class Project(models.Model):
             raise ValidationError('When login is not required to access the Project, ' +
                                   'the number of Assignments per Task must be 1')
 
+    def html_template_with_asset_urls(self):
+        """Return HTML template with ${asset:<filename>} tokens replaced by asset URLs
+
+        The Project's assets are only retrieved from the database if the
+        template references at least one asset.
+        """
+        if u'${asset:' not in self.html_template:
+            return self.html_template
+
+        asset_urls = dict((asset.filename, asset.url())
+                          for asset in self.projectasset_set.defer('content'))
+
+        def asset_url(match):
+            # Leave tokens for unknown assets untouched, so the problem is visible
+            return asset_urls.get(match.group(1), match.group(0))
+
+        return ASSET_TOKEN_RE.sub(asset_url, self.html_template)
+
     def save(self, *args, **kwargs):
         soup = BeautifulSoup(self.html_template, 'html.parser')
         self.html_template_has_submit_button = bool(soup.select('input[type=submit]'))
@@ -447,6 +1835,15 @@ class Project(models.Model):
                 for row in rows:
                     writer.writerow(row)
 
+    def results_jsonl(self):
+        """Yield the results of every Batch of the Project as lines of JSON text
+
+        See Batch.results_jsonl()
+        """
+        for batch in self.batch_set.order_by('id'):
+            for line in batch.results_jsonl():
+                yield line
+
     def _get_csv_fieldnames(self, batches):
         """
         Args:
@@ -476,3 +1873,158 @@ class Project(models.Model):
 
     def __str__(self):
         return self.name
+
+
+class ProjectAsset(models.Model):
+    """Static file (JavaScript, CSS, image...) shared by all Tasks of a Project
+
+    Assets are referenced from the Project's HTML template using tokens
+    like ${asset:style.css}, and are served from a versioned URL, so
+    that browsers can cache them across Tasks instead of receiving
+    the same inlined code with every Task.
+    """
+    class Meta:
+        unique_together = (('project', 'filename'),)
+        verbose_name = "Project Asset"
+
+    content = models.BinaryField()
+    content_type = models.CharField(max_length=255, blank=True)
+    digest = models.CharField(max_length=40, editable=False)
+    filename = models.CharField(max_length=255)
+    project = models.ForeignKey(Project, on_delete=models.CASCADE)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def save(self, *args, **kwargs):
+        # The digest of the content is used as the version in the asset URL
+        self.digest = hashlib.sha1(self.content).hexdigest()
+        if not self.content_type:
+            self.content_type = mimetypes.guess_type(self.filename)[0] or \
+                'application/octet-stream'
+        super(ProjectAsset, self).save(*args, **kwargs)
+
+    def url(self):
+        return reverse('project_asset', kwargs={'project_id': self.project_id,
+                                                'digest': self.digest,
+                                                'filename': self.filename})
+
+    def __unicode__(self):
+        return self.filename
+
+    def __str__(self):
+        return self.filename
+
+
+def hash_input_csv_fields(input_csv_fields):
+    """Returns a hash of a Task's input fields that does not depend on the order of the fields
+    """
+    encoded = json.dumps(input_csv_fields, separators=(',', ':'), sort_keys=True)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+def encode_json(value):
+    """Encode a value as JSON text in the format stored by CompressedJSONField
+
+    If the JSON text is at least TURKLE_COMPRESSION_THRESHOLD characters
+    long, it is compressed with zlib and stored as base64 after the
+    'zlib:' prefix, unless compressing it does not make it shorter.
+    JSON text never starts with the prefix, so both forms can be read
+    without knowing which one was used.
+    """
+    return compress_json(json.dumps(value, separators=(',', ':')))
+
+
+def compress_json(text):
+    """Compress JSON text as described in encode_json(), if it is long enough
+    """
+    threshold = getattr(settings, 'TURKLE_COMPRESSION_THRESHOLD', 1024)
+    if threshold is None or len(text) < threshold or text.startswith(COMPRESSED_JSON_PREFIX):
+        return text
+    compressed = COMPRESSED_JSON_PREFIX + \
+        base64.b64encode(zlib.compress(text.encode('utf-8'))).decode('ascii')
+    return compressed if len(compressed) < len(text) else text
+
+
+def decompress_json(text):
+    """Returns the uncompressed JSON text for text stored by CompressedJSONField
+    """
+    if isinstance(text, bytes):
+        text = text.decode('utf-8')
+    if text.startswith(COMPRESSED_JSON_PREFIX):
+        text = zlib.decompress(base64.b64decode(text[len(COMPRESSED_JSON_PREFIX):])).\
+            decode('utf-8')
+    return text
+
+
+def decode_json(text):
+    """Decode JSON text stored by CompressedJSONField, which may be compressed
+    """
+    text = decompress_json(text)
+    if not text:
+        return text
+    return json.loads(text)
+
+
+def _input_json_text(text, key_prefixes):
+    """Returns the JSON object text for a Task's input as stored in the database
+
+    Inputs stored as JSON objects are copied, unless they refer to the
+    blob store.  Inputs stored as lists of values are joined with the
+    JSON-encoded keys of the Batch's input_csv_header.
+    """
+    text = decompress_json(text)
+    if text.startswith(u'{') and BLOB_KEY not in text:
+        return text
+    value = json.loads(text)
+    if isinstance(value, dict):
+        return json.dumps(resolve_values(value), separators=(',', ':'))
+    return u'{' + u','.join(
+        key_prefix + json.dumps(read_blob(get_blob_dir(), v[BLOB_KEY])
+                                if is_blob_reference(v) else v)
+        for (key_prefix, v) in zip(key_prefixes, value)) + u'}'
+
+
+def _chunks(iterable, chunk_size):
+    """Yield successive lists of at most chunk_size items from iterable
+    """
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _in_task_id_ranges(task_id_ranges):
+    """Returns a Q object for the Tasks in (first_id, last_id] ranges from Batch._insert_tasks()
+
+    Consecutive ranges are merged, so that the condition stays short.
+    """
+    merged = []
+    for (first_id, last_id) in sorted(task_id_ranges):
+        if first_id == last_id:
+            continue
+        if merged and merged[-1][1] == first_id:
+            merged[-1] = (merged[-1][0], last_id)
+        else:
+            merged.append((first_id, last_id))
+    if not merged:
+        return models.Q(id__in=[])
+    return reduce(operator.or_, [models.Q(id__gt=first_id, id__lte=last_id)
+                                 for (first_id, last_id) in merged])
+
+
+def _cursor(task_assignment):
+    return (task_assignment.saved_at, task_assignment.id)
+
+
+def _after_cursor(cursor):
+    """Returns a Q object for the Task Assignments saved after a (saved_at, id) cursor
+
+    The condition is written as a range on saved_at, so that it can use
+    the (completed, saved_at, id) index of Task Assignments.
+    """
+    (saved_at, task_assignment_id) = cursor
+    return models.Q(saved_at__gte=saved_at) & \
+        ~models.Q(saved_at=saved_at, id__lte=task_assignment_id)
@@ -0,0 +1,246 @@
+"""Write-behind buffer for submitted answers
+
+On SQLite, every submitted Task Assignment needs the database's single
+write lock, so at peak times submissions queue up behind each other.
+When the TURKLE_SUBMISSION_JOURNAL setting is set to a file path,
+submitted answers are instead appended to a local journal file (and
+fsync'ed) and acknowledged immediately.  A background writer thread
+periodically moves the journal aside and applies all of the journaled
+submissions to the database in a single transaction ("group commit").
+
+The writer thread of a server process is started when the process
+handles its first request, so management commands never start one.
+If the server crashes, journaled submissions that were not yet
+applied are replayed by the next flush, either by the background
+writer or by running:
+
+    python manage.py flush_submissions
+
+Applying a submission is idempotent, so a journal that was partially
+applied before a crash can safely be replayed.
+"""
+import errno
+import fcntl
+import io
+import json
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from turkle import metrics
+
+logger = logging.getLogger(__name__)
+
+_writer_lock = threading.Lock()
+_writer_pid = None
+
+
+def get_submission_journal():
+    """Returns the configured SubmissionJournal, or None if journaling is disabled
+    """
+    path = getattr(settings, 'TURKLE_SUBMISSION_JOURNAL', None)
+    if not path:
+        return None
+    return SubmissionJournal(path)
+
+
+def start_writer():
+    """Start the background writer thread for this process, if journaling is enabled
+
+    The writer flushes the journal every TURKLE_SUBMISSION_JOURNAL_FLUSH_INTERVAL
+    seconds.  If the interval is 0, no writer is started, and the journal must
+    be flushed using the flush_submissions management command.
+    """
+    global _writer_pid
+    if _writer_pid == os.getpid():
+        return
+    journal = get_submission_journal()
+    interval = getattr(settings, 'TURKLE_SUBMISSION_JOURNAL_FLUSH_INTERVAL', 1.0)
+    if journal is None or not interval:
+        return
+    with _writer_lock:
+        # Threads do not survive a fork(), so each server process needs its own writer
+        if _writer_pid == os.getpid():
+            return
+        _writer_pid = os.getpid()
+        thread = threading.Thread(target=_run_writer, args=(journal, interval),
+                                  name='turkle-submission-writer')
+        thread.daemon = True
+        thread.start()
+
+
+def start_writer_on_request(sender, **kwargs):
+    """request_started signal handler that starts the writer in server processes
+    """
+    start_writer()
+
+
+def _run_writer(journal, interval):
+    while True:
+        try:
+            journal.flush()
+        except Exception:
+            logger.exception('Failed to flush submission journal %s', journal.path)
+        finally:
+            connection.close()
+        time.sleep(interval)
+
+
+class SubmissionJournal(object):
+    """Append-only file of submitted answers, one JSON record per line
+
+    Files used, for a journal at 'path':
+    - path: journal that submissions are appended to
+    - path + '.pending': journal that is being applied to the database
+    - path + '.lock': lock serializing appends and journal rotation
+    - path + '.flushlock': lock ensuring only one process applies the journal
+    """
+    def __init__(self, path):
+        self.path = path
+        self.pending_path = path + '.pending'
+
+    def append(self, task_assignment, answers):
+        """Durably record the submitted answers for a Task Assignment
+
+        Like TaskAssignment.save(), the CSRF token of the submitted
+        form is not stored with the answers.
+        """
+        answers = dict(answers)
+        answers.pop('csrfmiddlewaretoken', None)
+        record = {
+            'task_assignment_id': task_assignment.id,
+            'task_id': task_assignment.task_id,
+            'assigned_to_id': task_assignment.assigned_to_id,
+            'created_at': task_assignment.created_at.isoformat(),
+            'submitted_at': timezone.now().isoformat(),
+            'answers': answers,
+        }
+        line = (json.dumps(record, separators=(',', ':')) + '\n').encode('utf-8')
+        with _FileLock(self.path + '.lock'):
+            with io.open(self.path, 'ab') as fh:
+                fh.write(line)
+                fh.flush()
+                os.fsync(fh.fileno())
+        metrics.increment('submission_journal.appended')
+        start_writer()
+
+    def flush(self):
+        """Apply all journaled submissions to the database
+
+        Returns:
+            Number of submissions applied, or None if another process
+            is already flushing the journal
+        """
+        with _FileLock(self.path + '.flushlock', blocking=False) as flush_lock:
+            if not flush_lock.acquired:
+                return None
+
+            # A pending journal left by a crash is applied before rotating again
+            if not os.path.exists(self.pending_path):
+                with _FileLock(self.path + '.lock'):
+                    try:
+                        os.rename(self.path, self.pending_path)
+                    except OSError as ex:
+                        if ex.errno != errno.ENOENT:
+                            raise
+                        return 0
+
+            with io.open(self.pending_path, 'rb') as fh:
+                records = [json.loads(line.decode('utf-8')) for line in fh if line.strip()]
+            apply_submissions(records)
+            os.remove(self.pending_path)
+            metrics.increment('submission_journal.flushed', len(records))
+            return len(records)
+
+
+def apply_submissions(records):
+    """Save journaled submissions as completed Task Assignments in one transaction
+    """
+    from turkle.models import Batch, CachedAnswer, Task, TaskAssignment
+
+    if not records:
+        return
+
+    # Later submissions for the same Task Assignment win
+    records_by_id = dict((r['task_assignment_id'], r) for r in records)
+
+    with transaction.atomic():
+        existing_ids = set(TaskAssignment.objects.filter(id__in=records_by_id.keys()).
+                           values_list('id', flat=True))
+        recreated = []
+        for task_assignment_id, record in records_by_id.items():
+            # Journals written before the CSRF token was removed by append()
+            record['answers'].pop('csrfmiddlewaretoken', None)
+            answers = record['answers']
+            if task_assignment_id in existing_ids:
+                TaskAssignment.objects.filter(id=task_assignment_id).update(
+                    answers=answers,
+                    completed=True,
+                    saved_at=timezone.now(),
+                    updated_at=parse_datetime(record['submitted_at']))
+            else:
+                # The uncompleted Task Assignment expired before the journal was applied
+                recreated.append(TaskAssignment(
+                    id=task_assignment_id,
+                    answers=answers,
+                    assigned_to_id=record['assigned_to_id'],
+                    completed=True,
+                    task_id=record['task_id'],
+                ))
+        if recreated:
+            task_ids = set(Task.objects.filter(id__in=[ta.task_id for ta in recreated]).
+                           values_list('id', flat=True))
+            recreated = [ta for ta in recreated if ta.task_id in task_ids]
+            TaskAssignment.objects.bulk_create(recreated)
+            # bulk_create() sets the auto_now fields to the current time, which
+            # is kept for saved_at so that the results cursor sees the rows
+            for task_assignment in recreated:
+                record = records_by_id[task_assignment.id]
+                TaskAssignment.objects.filter(id=task_assignment.id).update(
+                    created_at=parse_datetime(record['created_at']),
+                    updated_at=parse_datetime(record['submitted_at']))
+
+        task_ids_by_batch_id = {}
+        for task_id, batch_id in Task.objects.\
+                filter(id__in=[r['task_id'] for r in records_by_id.values()]).\
+                values_list('id', 'batch_id'):
+            task_ids_by_batch_id.setdefault(batch_id, []).append(task_id)
+        for batch in Batch.objects.filter(id__in=task_ids_by_batch_id.keys()):
+            batch.update_completed_tasks(task_ids_by_batch_id[batch.id])
+
+        CachedAnswer.add_task_assignments([
+            TaskAssignment(answers=r['answers'], assigned_to_id=r['assigned_to_id'],
+                           task_id=r['task_id'])
+            for r in records_by_id.values()])
+
+
+class _FileLock(object):
+    """Context manager for an exclusive advisory lock on a lock file
+    """
+    def __init__(self, path, blocking=True):
+        self.acquired = False
+        self.blocking = blocking
+        self.path = path
+
+    def __enter__(self):
+        self.fh = io.open(self.path, 'ab')
+        flags = fcntl.LOCK_EX if self.blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+        try:
+            fcntl.flock(self.fh.fileno(), flags)
+            self.acquired = True
+        except IOError as ex:
+            if ex.errno not in (errno.EAGAIN, errno.EACCES):
+                self.fh.close()
+                raise
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.acquired:
+            fcntl.flock(self.fh.fileno(), fcntl.LOCK_UN)
+        self.fh.close()
@@ -1,14 +1,23 @@
 # -*- coding: utf-8 -*-
 import datetime
+import gzip
+import io
+import os
 import os.path
+import shutil
+import tempfile
+import zipfile
 
 import django.test
 from django.contrib.auth.models import Group, User
 from django.contrib.messages import get_messages
+from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.urls import reverse
 from django.utils import timezone
 
-from turkle.models import Batch, Project, Task, TaskAssignment
+from turkle import metrics
+from turkle.models import Batch, BatchIngestJob, Project, ProjectAsset, Task, TaskAssignment
 
 # hack to add unicode() to python3 for backward compatibility
 try:
@@ -142,6 +151,121 @@ class TestBatchAdmin(django.test.TestCase):
                          Batch._meta.get_field('allotted_assignment_time').get_default())
         self.assertEqual(matching_batch.created_by, self.user)
 
+    def test_batch_add_skip_duplicates(self):
+        project = Project(name='foo', html_template='<p>${foo}: ${bar}</p>')
+        project.save()
+
+        csv_file = io.BytesIO(b'foo,bar\r\n1,2\r\n1,2\r\n3,4\r\n')
+        csv_file.name = 'tasks.csv'
+        client = django.test.Client()
+        client.login(username='admin', password='secret')
+        response = client.post(
+            u'/admin/turkle/batch/add/',
+            {
+                'assignments_per_task': 1,
+                'duplicate_tasks': Batch.SKIP_BATCH_DUPLICATES,
+                'project': project.id,
+                'name': 'batch_save',
+                'csv_file': csv_file
+            })
+        self.assertEqual(response.status_code, 302)
+        matching_batch = Batch.objects.get(name='batch_save')
+        self.assertEqual(matching_batch.total_tasks(), 2)
+        self.assertEqual(matching_batch.duplicate_rows, 1)
+        messages = list(get_messages(response.wsgi_request))
+        self.assertEqual(str(messages[0]), u'1 rows of the CSV file had the same input as an '
+                         u'existing Task, and were skipped')
+
+    def test_batch_add_gzip_jsonl(self):
+        project = Project(name='foo', html_template='<p>${foo}: ${bar}</p>')
+        project.save()
+
+        jsonl_fh = io.BytesIO()
+        with gzip.GzipFile(fileobj=jsonl_fh, mode='wb') as gzip_fh:
+            gzip_fh.write(b'{"foo": "1", "bar": "2"}\n{"foo": "3", "bar": 4}\n')
+        jsonl_fh.seek(0)
+        jsonl_fh.name = 'tasks.jsonl.gz'
+
+        client = django.test.Client()
+        client.login(username='admin', password='secret')
+        response = client.post(
+            u'/admin/turkle/batch/add/',
+            {
+                'assignments_per_task': 1,
+                'project': project.id,
+                'name': 'batch_save',
+                'csv_file': jsonl_fh
+            })
+        self.assertEqual(response.status_code, 302)
+        matching_batch = Batch.objects.get(name='batch_save')
+        self.assertEqual(matching_batch.filename, u'tasks.jsonl.gz')
+        self.assertEqual(matching_batch.csv_results_filename(),
+                         u'tasks-Batch_{}_results.csv'.format(matching_batch.id))
+        self.assertEqual(
+            [t.input_csv_fields for t in matching_batch.task_set.order_by('id')],
+            [{u'foo': u'1', u'bar': u'2'}, {u'foo': u'3', u'bar': u'4'}])
+
+    def test_batch_add_media_archive(self):
+        project = Project(name='foo', html_template='<img src="${foo}">${bar}')
+        project.save()
+
+        archive_fh = io.BytesIO()
+        with zipfile.ZipFile(archive_fh, 'w') as archive:
+            archive.writestr('images/cat.jpg', b'meow')
+        archive_fh.seek(0)
+        archive_fh.name = 'media.zip'
+        csv_fh = io.BytesIO(b'foo,bar\r\nimages/cat.jpg,1\r\nhttp://example.com/dog.jpg,2\r\n')
+        csv_fh.name = 'tasks.csv'
+
+        media_dir = tempfile.mkdtemp()
+        client = django.test.Client()
+        client.login(username='admin', password='secret')
+        try:
+            with self.settings(TURKLE_MEDIA_DIR=media_dir):
+                response = client.post(
+                    u'/admin/turkle/batch/add/',
+                    {
+                        'assignments_per_task': 1,
+                        'project': project.id,
+                        'name': 'batch_save',
+                        'csv_file': csv_fh,
+                        'media_file': archive_fh,
+                    })
+        finally:
+            shutil.rmtree(media_dir)
+        self.assertEqual(response.status_code, 302)
+        batch = Batch.objects.get(name='batch_save')
+        batch_media = batch.batchmedia_set.get()
+        self.assertEqual(batch_media.filename, 'images/cat.jpg')
+        self.assertEqual(batch_media.content_type, 'image/jpeg')
+        self.assertEqual(
+            [t.input_csv_fields['foo'] for t in batch.task_set.order_by('id')],
+            [batch_media.url(), 'http://example.com/dog.jpg'])
+        self.assertTrue(u'Added 1 media files to Batch batch_save' in
+                        [m.message for m in get_messages(response.wsgi_request)])
+
+    def test_batch_add_media_archive_disabled(self):
+        project = Project(name='foo', html_template='<img src="${foo}">${bar}')
+        project.save()
+        archive_fh = io.BytesIO(b'not an archive')
+        archive_fh.name = 'media.zip'
+
+        client = django.test.Client()
+        client.login(username='admin', password='secret')
+        with open(os.path.abspath('turkle/tests/resources/form_1_vals.csv')) as fp:
+            response = client.post(
+                u'/admin/turkle/batch/add/',
+                {
+                    'assignments_per_task': 1,
+                    'project': project.id,
+                    'name': 'batch_save',
+                    'csv_file': fp,
+                    'media_file': archive_fh,
+                })
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b'TURKLE_MEDIA_DIR setting is not set' in response.content)
+        self.assertFalse(Batch.objects.filter(name='batch_save').exists())
+
     def test_batch_add_csv_with_emoji(self):
         project = Project(name='foo', html_template='<p>${emoji}: ${more_emoji}</p>')
         project.save()
@@ -295,6 +419,7 @@ class TestBatchAdmin(django.test.TestCase):
             response = client.post(
                 u'/admin/turkle/batch/add/',
                 {
+                    'assignments_per_task': 1,
                     'project': project.id,
                     'name': 'batch_save',
                     'csv_file': fp
@@ -303,6 +428,29 @@ class TestBatchAdmin(django.test.TestCase):
         self.assertTrue(b'error' in response.content)
         self.assertTrue(b'line 2 has 2 fields' in response.content)
         self.assertTrue(b'line 4 has 4 fields' in response.content)
+        self.assertFalse(Batch.objects.filter(name='batch_save').exists())
+        self.assertFalse(Task.objects.exists())
+
+    @django.test.override_settings(TURKLE_MAX_CSV_ERRORS=1)
+    def test_batch_add_validation_variable_fields_per_row_max_errors(self):
+        project = Project(name='foo', html_template='<p>${f1} ${f2} ${f3}</p>')
+        project.save()
+
+        client = django.test.Client()
+        client.login(username='admin', password='secret')
+        with open(os.path.abspath('turkle/tests/resources/variable_fields_per_row.csv')) as fp:
+            response = client.post(
+                u'/admin/turkle/batch/add/',
+                {
+                    'assignments_per_task': 1,
+                    'project': project.id,
+                    'name': 'batch_save',
+                    'csv_file': fp
+                })
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b'line 2 has 2 fields' in response.content)
+        self.assertFalse(b'line 4 has 4 fields' in response.content)
+        self.assertTrue(b'Stopped checking the CSV file after 1 errors' in response.content)
 
     def test_batch_change_get_page(self):
         self.test_batch_add()
@@ -559,7 +707,342 @@ class TestProject(django.test.TestCase):
         self.assertFalse(user_for_remove.has_perm('can_work_on', project))
 
 
+class TestProjectAssetAdmin(django.test.TestCase):
+    def setUp(self):
+        User.objects.create_superuser('admin', 'foo@bar.foo', 'secret')
+        self.project = Project.objects.create(name='foo', html_template='<p>${foo}</p>')
+
+    def test_post_add_asset(self):
+        client = django.test.Client()
+        client.login(username='admin', password='secret')
+        with open(os.path.abspath('turkle/tests/resources/sentiment.html')) as fp:
+            response = client.post(reverse('turkle_admin:turkle_projectasset_add'),
+                                   {
+                                       'project': self.project.id,
+                                       'upload': fp,
+                                   })
+        self.assertEqual(response.status_code, 302)
+        asset = ProjectAsset.objects.get(project=self.project)
+        self.assertEqual(asset.filename, u'sentiment.html')
+        self.assertEqual(asset.content_type, u'text/html')
+        with open(os.path.abspath('turkle/tests/resources/sentiment.html'), 'rb') as fp:
+            self.assertEqual(bytes(asset.content), fp.read())
+
+    def test_post_add_asset_missing_file(self):
+        client = django.test.Client()
+        client.login(username='admin', password='secret')
+        response = client.post(reverse('turkle_admin:turkle_projectasset_add'),
+                               {
+                                   'project': self.project.id,
+                                   'filename': 'app.js',
+                               })
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b'This field is required' in response.content)
+        self.assertFalse(ProjectAsset.objects.exists())
+
+    def test_project_change_lists_assets(self):
+        ProjectAsset.objects.create(project=self.project, filename='app.js', content=b'1;')
+        client = django.test.Client()
+        client.login(username='admin', password='secret')
+        response = client.get(reverse('turkle_admin:turkle_project_change',
+                                      args=(self.project.id,)))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b'${asset:app.js}' in response.content)
+
+
+class TestMetrics(django.test.TestCase):
+    def setUp(self):
+        User.objects.create_superuser('admin', 'foo@bar.foo', 'secret')
+        metrics.reset_counters()
+
+    def test_metrics(self):
+        metrics.increment('throttled.ip.index')
+        metrics.increment('throttled.ip.index')
+        client = django.test.Client()
+        client.login(username='admin', password='secret')
+        response = client.get(reverse('turkle_admin:metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'counters': {'throttled.ip.index': 2}})
+
+        response = client.post(reverse('turkle_admin:metrics'), {'reset': 'true'})
+        self.assertEqual(response.json(), {'counters': {}})
+
+
+class TestAppendTasks(django.test.TestCase):
+    def setUp(self):
+        User.objects.create_superuser('admin', 'foo@bar.foo', 'secret')
+        project = Project(name='foo', html_template='<p>${foo}: ${bar}</p>')
+        project.save()
+        self.batch = Batch(project=project, name='MY_BATCH_NAME')
+        self.batch.save()
+        Task(batch=self.batch, input_csv_fields={'foo': '1', 'bar': '2'}).save()
+        self.client = django.test.Client()
+        self.client.login(username='admin', password='secret')
+        self.url = reverse('turkle_admin:append_tasks', kwargs={'batch_id': self.batch.id})
+
+    def post_csv(self, csv_text):
+        csv_file = io.BytesIO(csv_text)
+        csv_file.name = 'more.csv'
+        return self.client.post(self.url, {'csv_file': csv_file})
+
+    def test_get(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b'MY_BATCH_NAME' in response.content)
+
+    def test_append(self):
+        response = self.post_csv(b'foo,bar\r\n3,4\r\n5,6\r\n')
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response['Location'], reverse('turkle_admin:turkle_batch_change',
+                                                       args=[self.batch.id]))
+        messages = list(get_messages(response.wsgi_request))
+        self.assertEqual(str(messages[0]), u'Added 2 Tasks to Batch MY_BATCH_NAME')
+        self.assertEqual(self.batch.total_tasks(), 3)
+
+    def test_append_invalid_file(self):
+        response = self.post_csv(b'foo,bar\r\n3,4\r\n5\r\n')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b'line 3 has 1 fields' in response.content)
+        self.assertEqual(self.batch.total_tasks(), 1)
+
+    def test_append_command(self):
+        (csv_fd, csv_path) = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(csv_fd, 'wb') as csv_fh:
+            csv_fh.write(b'foo,bar\r\n3,4\r\n')
+        try:
+            call_command('append_tasks', self.batch.id, csv_path)
+        finally:
+            os.remove(csv_path)
+        self.assertEqual(self.batch.total_tasks(), 2)
+
+    def test_append_before_ingest_completed(self):
+        BatchIngestJob(batch=self.batch, csv_path='/nonexistent.csv', total_bytes=0,
+                       status=BatchIngestJob.RUNNING).save()
+        response = self.post_csv(b'foo,bar\r\n3,4\r\n')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b'cannot be added to Batch MY_BATCH_NAME' in response.content)
+        self.assertEqual(self.batch.total_tasks(), 1)
+
+        (csv_fd, csv_path) = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(csv_fd, 'wb') as csv_fh:
+            csv_fh.write(b'foo,bar\r\n3,4\r\n')
+        try:
+            with self.assertRaisesMessage(CommandError, 'cannot be added to Batch'):
+                call_command('append_tasks', self.batch.id, csv_path)
+        finally:
+            os.remove(csv_path)
+        self.assertEqual(self.batch.total_tasks(), 1)
+
+
+class TestCloneBatch(django.test.TestCase):
+    def setUp(self):
+        User.objects.create_superuser('admin', 'foo@bar.foo', 'secret')
+        project = Project(name='foo', html_template='<p>${foo}: ${bar}</p>')
+        project.save()
+        self.batch = Batch(project=project, name='MY_BATCH_NAME')
+        self.batch.save()
+        Task(batch=self.batch, input_csv_fields={'foo': '1', 'bar': '2'}).save()
+        self.client = django.test.Client()
+        self.client.login(username='admin', password='secret')
+        self.url = reverse('turkle_admin:clone_batch', kwargs={'batch_id': self.batch.id})
+
+    def test_get(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b'MY_BATCH_NAME (copy)' in response.content)
+
+    def test_clone(self):
+        response = self.client.post(self.url, {
+            'allotted_assignment_time': 2,
+            'assignments_per_task': 1,
+            'name': 'CLONED',
+        })
+        clone = Batch.objects.get(name='CLONED')
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response['Location'], reverse('turkle_admin:review_batch',
+                                                       kwargs={'batch_id': clone.id}))
+        messages = list(get_messages(response.wsgi_request))
+        self.assertEqual(str(messages[0]), u'Created Batch CLONED with 1 Tasks')
+        self.assertEqual(clone.allotted_assignment_time, 2)
+        self.assertEqual(clone.created_by.username, 'admin')
+        self.assertFalse(clone.active)
+        self.assertEqual(clone.task_set.get().input_csv_fields, {'foo': '1', 'bar': '2'})
+
+    def test_clone_invalid_settings(self):
+        self.batch.project.login_required = False
+        self.batch.project.save()
+        response = self.client.post(self.url, {
+            'allotted_assignment_time': 2,
+            'assignments_per_task': 2,
+            'name': 'CLONED',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b'the number of Assignments per Task must be 1' in response.content)
+        self.assertFalse(Batch.objects.filter(name='CLONED').exists())
+
+
+class TestTopUpAssignments(django.test.TestCase):
+    def setUp(self):
+        admin = User.objects.create_superuser('admin', 'foo@bar.foo', 'secret')
+        project = Project(name='foo', html_template='<p>${foo}</p>', login_required=True)
+        project.save()
+        self.batch = Batch(project=project, name='MY_BATCH_NAME')
+        self.batch.save()
+        task = Task(batch=self.batch, completed=True, input_csv_fields={'foo': '1'})
+        task.save()
+        TaskAssignment(assigned_to=admin, completed=True, task=task).save()
+        self.client = django.test.Client()
+        self.client.login(username='admin', password='secret')
+        self.url = reverse('turkle_admin:top_up_assignments',
+                           kwargs={'batch_id': self.batch.id})
+
+    def test_get(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b'MY_BATCH_NAME' in response.content)
+
+    def test_top_up(self):
+        response = self.client.post(self.url, {'assignments_per_task': 3})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response['Location'], reverse('turkle_admin:turkle_batch_change',
+                                                       args=[self.batch.id]))
+        messages = list(get_messages(response.wsgi_request))
+        self.assertEqual(str(messages[0]), u'Batch MY_BATCH_NAME now has 3 Assignments per '
+                         u'Task. Reopened 1 completed Tasks')
+        self.assertEqual(Batch.objects.get(id=self.batch.id).assignments_per_task, 3)
+        self.assertEqual(self.batch.total_finished_tasks(), 0)
+
+    def test_top_up_cannot_reduce(self):
+        self.batch.top_up_assignments(2)
+        response = self.client.post(self.url, {'assignments_per_task': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b'cannot be reduced from 2 to 1' in response.content)
+
+
+@django.test.override_settings(TURKLE_BACKGROUND_INGEST=True)
+class TestBatchIngestJob(django.test.TestCase):
+    def setUp(self):
+        User.objects.create_superuser('admin', 'foo@bar.foo', 'secret')
+        self.project = Project(name='foo', html_template='<p>${foo}: ${bar}</p>')
+        self.project.save()
+        self.client = django.test.Client()
+        self.client.login(username='admin', password='secret')
+
+    def add_batch(self, extra_data=None):
+        data = {
+            'assignments_per_task': 1,
+            'project': self.project.id,
+            'name': 'batch_save',
+        }
+        data.update(extra_data or {})
+        with open(os.path.abspath('turkle/tests/resources/form_1_vals.csv')) as fp:
+            data['csv_file'] = fp
+            response = self.client.post(u'/admin/turkle/batch/add/', data)
+        self.assertEqual(response.status_code, 302)
+        return Batch.objects.get(name='batch_save')
+
+    def test_batch_add_creates_pending_job(self):
+        batch = self.add_batch()
+        self.assertEqual(batch.total_tasks(), 0)
+        self.assertEqual(batch.ingest_job.status, BatchIngestJob.PENDING)
+        self.assertTrue(os.path.exists(batch.ingest_job.csv_path))
+
+        response = self.client.get(reverse('turkle_admin:review_batch',
+                                           kwargs={'batch_id': batch.id}))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b'Creating Tasks from CSV file' in response.content)
+
+        response = self.client.get(reverse('turkle_admin:batch_ingest_progress',
+                                           kwargs={'batch_id': batch.id}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], BatchIngestJob.PENDING)
+        self.assertEqual(response.json()['tasks_created'], 0)
+        batch.ingest_job.remove_csv_file()
+
+    def test_batch_publish_before_ingest_completed(self):
+        batch = self.add_batch()
+        response = self.client.post(reverse('turkle_admin:publish_batch',
+                                            kwargs={'batch_id': batch.id}))
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response['Location'], reverse('turkle_admin:review_batch',
+                                                       kwargs={'batch_id': batch.id}))
+        messages = list(get_messages(response.wsgi_request))
+        self.assertEqual(len(messages), 1)
+        self.assertTrue(u'cannot be published' in str(messages[0]))
+        batch.refresh_from_db()
+        self.assertFalse(batch.active)
+        batch.ingest_job.remove_csv_file()
+
+    def test_batch_change_cannot_activate_before_ingest_completed(self):
+        batch = self.add_batch()
+        change_url = reverse('turkle_admin:turkle_batch_change', args=(batch.id,))
+        response = self.client.get(change_url)
+        self.assertFalse(b'name="active"' in response.content)
+        response = self.client.post(change_url, {
+            'active': 'on',
+            'allotted_assignment_time': batch.allotted_assignment_time,
+            'duplicate_tasks': batch.duplicate_tasks,
+            'name': batch.name,
+            'project': self.project.id,
+        })
+        self.assertEqual(response.status_code, 302)
+        batch.refresh_from_db()
+        self.assertFalse(batch.active)
+        batch.ingest_job.remove_csv_file()
+
+    def test_ingest_worker(self):
+        batch = self.add_batch({'active': True})
+        self.assertFalse(batch.active)
+        csv_path = batch.ingest_job.csv_path
+
+        call_command('ingest_worker', once=True)
+        batch.refresh_from_db()
+        self.assertTrue(batch.active)
+        self.assertEqual(batch.total_tasks(), 1)
+        ingest_job = BatchIngestJob.objects.get(batch=batch)
+        self.assertEqual(ingest_job.status, BatchIngestJob.COMPLETED)
+        self.assertEqual(ingest_job.tasks_created, 1)
+        self.assertFalse(os.path.exists(csv_path))
+
+        response = self.client.get(reverse('turkle_admin:review_batch',
+                                           kwargs={'batch_id': batch.id}))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b'Publish Batch' in response.content)
+
+    @django.test.override_settings(FILE_UPLOAD_MAX_MEMORY_SIZE=1)
+    def test_batch_add_spooled_upload(self):
+        batch = self.add_batch()
+        with open(os.path.abspath('turkle/tests/resources/form_1_vals.csv'), 'rb') as fp:
+            csv_text = fp.read()
+        with open(batch.ingest_job.csv_path, 'rb') as fp:
+            self.assertEqual(fp.read(), csv_text)
+        self.assertEqual(batch.ingest_job.total_bytes, len(csv_text))
+        batch.ingest_job.remove_csv_file()
+
+    def test_batch_cancel_removes_csv_file(self):
+        batch = self.add_batch()
+        csv_path = batch.ingest_job.csv_path
+        self.client.post(reverse('turkle_admin:cancel_batch', kwargs={'batch_id': batch.id}))
+        self.assertFalse(Batch.objects.filter(id=batch.id).exists())
+        self.assertFalse(BatchIngestJob.objects.exists())
+        self.assertFalse(os.path.exists(csv_path))
+
+
 class TestReviewBatch(django.test.TestCase):
+    def test_batch_review_no_tasks(self):
+        User.objects.create_superuser('admin', 'foo@bar.foo', 'secret')
+        project = Project(name='foo', html_template='<p>${foo}</p>')
+        project.save()
+        batch = Batch(project=project, name='empty')
+        batch.save()
+        client = django.test.Client()
+        client.login(username='admin', password='secret')
+        response = client.get(reverse('turkle_admin:review_batch', kwargs={'batch_id': batch.id}))
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response['Location'], reverse('turkle_admin:turkle_batch_changelist'))
+        messages = list(get_messages(response.wsgi_request))
+        self.assertEqual(str(messages[0]), u'Batch empty has no Tasks to review')
+
     def test_batch_review_bad_batch_id(self):
         User.objects.create_superuser('admin', 'foo@bar.foo', 'secret')
         batch_id = 666
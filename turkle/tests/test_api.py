@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import tempfile
+
+import django.test
+from django.contrib.auth.models import Group, User
+from django.core.management import call_command
+from django.urls import reverse
+from guardian.shortcuts import assign_perm
+
+from turkle.api import _claim_next_task
+from turkle.models import ApiToken, Batch, Project, Task, TaskAssignment
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+
+class ApiTestCase(django.test.TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('testuser', password='secret')
+        self.token = ApiToken.objects.create(user=self.user)
+        self.project = Project(name='foo', html_template='<p>${foo}: ${bar}</p>')
+        self.project.save()
+        self.batch = Batch(project=self.project, name='foo', filename='foo.csv')
+        self.batch.save()
+        self.task_1 = Task(batch=self.batch, input_csv_fields={'foo': 'fufu', 'bar': 'baba'})
+        self.task_1.save()
+        self.task_2 = Task(batch=self.batch, input_csv_fields={'foo': 'fifi', 'bar': 'bibi'})
+        self.task_2.save()
+        self.client = django.test.Client(HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+    def json(self, response):
+        return json.loads(response.content.decode('utf-8'))
+
+
+class TestApiAuthentication(ApiTestCase):
+    def test_missing_token(self):
+        response = django.test.Client().get(reverse('api_batches'))
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(self.json(response), {'error': 'Missing API Token'})
+
+    def test_invalid_token(self):
+        client = django.test.Client(HTTP_AUTHORIZATION='Token 1234')
+        response = client.get(reverse('api_batches'))
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(self.json(response), {'error': 'Invalid API Token'})
+
+    def test_create_api_token_command(self):
+        other_user = User.objects.create_user('otheruser', password='secret')
+        out = StringIO()
+        call_command('create_api_token', 'otheruser', stdout=out)
+        self.assertEqual(out.getvalue().strip(), ApiToken.objects.get(user=other_user).key)
+
+
+class TestApiBatches(ApiTestCase):
+    def test_batches(self):
+        response = self.client.get(reverse('api_batches'))
+        self.assertEqual(response.status_code, 200)
+        batches = self.json(response)['batches']
+        self.assertEqual(len(batches), 1)
+        self.assertEqual(batches[0]['id'], self.batch.id)
+        self.assertEqual(batches[0]['project_name'], 'foo')
+
+    def test_batches_custom_permissions(self):
+        self.project.custom_permissions = True
+        self.project.save()
+        response = self.client.get(reverse('api_batches'))
+        self.assertEqual(self.json(response)['batches'], [])
+
+        group = Group.objects.create(name='testgroup')
+        self.user.groups.add(group)
+        assign_perm('can_work_on', group, self.project)
+        response = self.client.get(reverse('api_batches'))
+        self.assertEqual(len(self.json(response)['batches']), 1)
+
+    def test_batches_constant_queries(self):
+        group = Group.objects.create(name='testgroup')
+        self.user.groups.add(group)
+        self.project.custom_permissions = True
+        self.project.save()
+        assign_perm('can_work_on', group, self.project)
+        with self.assertNumQueries(5):
+            response = self.client.get(reverse('api_batches'))
+        self.assertEqual(len(self.json(response)['batches']), 1)
+
+        for project_number in range(5):
+            project = Project(name='bar', custom_permissions=True,
+                              html_template='<p>${foo}: ${bar}</p>')
+            project.save()
+            assign_perm('can_work_on', self.user, project)
+            Batch(project=project, name='bar', filename='bar.csv').save()
+        with self.assertNumQueries(5):
+            response = self.client.get(reverse('api_batches'))
+        self.assertEqual(len(self.json(response)['batches']), 6)
+
+
+class TestApiClaimNextTask(ApiTestCase):
+    def test_claim_next_task(self):
+        response = self.client.post(reverse('api_claim_next_task',
+                                            kwargs={'batch_id': self.batch.id}))
+        self.assertEqual(response.status_code, 200)
+        data = self.json(response)
+        self.assertEqual(data['task_id'], self.task_1.id)
+        self.assertEqual(data['input'], {'foo': 'fufu', 'bar': 'baba'})
+        self.assertEqual(data['html'], '<p>fufu: baba</p>')
+        task_assignment = TaskAssignment.objects.get(id=data['task_assignment_id'])
+        self.assertEqual(task_assignment.assigned_to, self.user)
+
+        response = self.client.post(reverse('api_claim_next_task',
+                                            kwargs={'batch_id': self.batch.id}))
+        self.assertEqual(self.json(response)['task_id'], self.task_2.id)
+
+        response = self.client.post(reverse('api_claim_next_task',
+                                            kwargs={'batch_id': self.batch.id}))
+        self.assertEqual(response.status_code, 404)
+
+    def test_claim_next_task_constant_queries(self):
+        for task_number in range(10):
+            Task(batch=self.batch, input_csv_fields={'foo': 'a', 'bar': 'b'}).save()
+        url = reverse('api_claim_next_task', kwargs={'batch_id': self.batch.id})
+        with self.assertNumQueries(9):
+            self.client.post(url)
+        with self.assertNumQueries(9):
+            self.client.post(url)
+
+    def test_claim_next_task_rechecks_assignments(self):
+        # The first Task was found available before another Worker claimed it
+        other_user = User.objects.create_user('otheruser', password='secret')
+        TaskAssignment(assigned_to=other_user, task=self.task_1).save()
+        self.batch.available_task_ids_for = lambda user: \
+            self.batch.task_set.order_by('id').values_list('id', flat=True)
+        task_assignment = _claim_next_task(self.user, self.batch)
+        self.assertEqual(task_assignment.task_id, self.task_2.id)
+        self.assertEqual(self.task_1.taskassignment_set.count(), 1)
+
+        TaskAssignment(assigned_to=other_user, task=self.task_2).save()
+        self.assertIsNone(_claim_next_task(self.user, self.batch))
+
+    def test_claim_next_task_no_permission(self):
+        self.project.custom_permissions = True
+        self.project.save()
+        response = self.client.post(reverse('api_claim_next_task',
+                                            kwargs={'batch_id': self.batch.id}))
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(TaskAssignment.objects.count(), 0)
+
+    def test_claim_next_task_inactive_batch(self):
+        self.batch.active = False
+        self.batch.save()
+        response = self.client.post(reverse('api_claim_next_task',
+                                            kwargs={'batch_id': self.batch.id}))
+        self.assertEqual(response.status_code, 403)
+
+    def test_claim_next_task_get_not_allowed(self):
+        response = self.client.get(reverse('api_claim_next_task',
+                                           kwargs={'batch_id': self.batch.id}))
+        self.assertEqual(response.status_code, 405)
+
+
+class TestApiTaskAssignment(ApiTestCase):
+    def setUp(self):
+        super(TestApiTaskAssignment, self).setUp()
+        self.task_assignment = TaskAssignment(assigned_to=self.user, task=self.task_1)
+        self.task_assignment.save()
+
+    def test_submit_json(self):
+        response = self.client.post(
+            reverse('api_submit_task_assignment',
+                    kwargs={'task_assignment_id': self.task_assignment.id}),
+            json.dumps({'answer': 'yes'}), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.task_assignment.refresh_from_db()
+        self.assertTrue(self.task_assignment.completed)
+        self.assertEqual(self.task_assignment.answers, {'answer': 'yes'})
+        self.task_1.refresh_from_db()
+        self.assertTrue(self.task_1.completed)
+
+    def test_submit_form_encoded(self):
+        response = self.client.post(
+            reverse('api_submit_task_assignment',
+                    kwargs={'task_assignment_id': self.task_assignment.id}),
+            {'answer': 'no'})
+        self.assertEqual(response.status_code, 200)
+        self.task_assignment.refresh_from_db()
+        self.assertEqual(self.task_assignment.answers, {'answer': 'no'})
+
+    def test_submit_twice(self):
+        url = reverse('api_submit_task_assignment',
+                      kwargs={'task_assignment_id': self.task_assignment.id})
+        self.client.post(url, {'answer': 'no'})
+        response = self.client.post(url, {'answer': 'yes'})
+        self.assertEqual(response.status_code, 409)
+
+    def test_submit_invalid_json(self):
+        response = self.client.post(
+            reverse('api_submit_task_assignment',
+                    kwargs={'task_assignment_id': self.task_assignment.id}),
+            '[1, 2', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_submit_other_users_assignment(self):
+        other_user = User.objects.create_user('otheruser', password='secret')
+        other_token = ApiToken.objects.create(user=other_user)
+        client = django.test.Client(HTTP_AUTHORIZATION='Token ' + other_token.key)
+        response = client.post(
+            reverse('api_submit_task_assignment',
+                    kwargs={'task_assignment_id': self.task_assignment.id}),
+            {'answer': 'no'})
+        self.assertEqual(response.status_code, 403)
+        self.task_assignment.refresh_from_db()
+        self.assertFalse(self.task_assignment.completed)
+
+    def test_return(self):
+        response = self.client.post(
+            reverse('api_return_task_assignment',
+                    kwargs={'task_assignment_id': self.task_assignment.id}))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(TaskAssignment.objects.filter(id=self.task_assignment.id).exists())
+
+    def test_skip(self):
+        response = self.client.post(
+            reverse('api_skip_task_assignment',
+                    kwargs={'task_assignment_id': self.task_assignment.id}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.json(response)['task_id'], self.task_2.id)
+        self.assertFalse(TaskAssignment.objects.filter(id=self.task_assignment.id).exists())
+
+
+class TestApiSubmitAnswers(ApiTestCase):
+    def test_submit_answers(self):
+        body = '\n'.join([
+            json.dumps({'task_id': self.task_1.id, 'answers': {'answer': 'yes'}}),
+            '',
+            json.dumps({'task_id': self.task_2.id, 'answers': {'answer': 'no'}}),
+        ])
+        response = self.client.post(reverse('api_submit_answers',
+                                            kwargs={'batch_id': self.batch.id}),
+                                    body, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.json(response), {'submitted': 2, 'skipped': 0, 'errors': []})
+        self.assertEqual(self.batch.total_finished_tasks(), 2)
+
+    def test_submit_answers_invalid_record(self):
+        body = '\n'.join([
+            json.dumps({'task_id': self.task_1.id, 'answers': {'answer': 'yes'}}),
+            json.dumps({'task_id': self.task_2.id}),
+        ])
+        response = self.client.post(reverse('api_submit_answers',
+                                            kwargs={'batch_id': self.batch.id}),
+                                    body, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue('Line 2' in self.json(response)['error'])
+        # All answers are rolled back
+        self.assertEqual(TaskAssignment.objects.count(), 0)
+
+    def test_submit_answers_invalid_task_id(self):
+        for task_id in (None, [self.task_1.id], 'abc', True):
+            body = '\n'.join([
+                json.dumps({'task_id': self.task_1.id, 'answers': {'answer': 'yes'}}),
+                json.dumps({'task_id': task_id, 'answers': {'answer': 'no'}}),
+            ])
+            response = self.client.post(reverse('api_submit_answers',
+                                                kwargs={'batch_id': self.batch.id}),
+                                        body, content_type='application/x-ndjson')
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(self.json(response)['error'],
+                             'Line 2: "task_id" must be an integer')
+            self.assertEqual(TaskAssignment.objects.count(), 0)
+
+    def test_submit_answers_string_task_id(self):
+        body = json.dumps({'task_id': str(self.task_1.id), 'answers': {'answer': 'yes'}})
+        response = self.client.post(reverse('api_submit_answers',
+                                            kwargs={'batch_id': self.batch.id}),
+                                    body, content_type='application/x-ndjson')
+        self.assertEqual(self.json(response)['submitted'], 1)
+
+    def test_submit_answers_command(self):
+        fd, path = tempfile.mkstemp(suffix='.jsonl')
+        with os.fdopen(fd, 'w') as fh:
+            fh.write(json.dumps({'task_id': self.task_1.id, 'answers': {'answer': 'yes'}}))
+        try:
+            call_command('submit_answers', str(self.batch.id), 'testuser', path)
+        finally:
+            os.remove(path)
+        self.task_1.refresh_from_db()
+        self.assertTrue(self.task_1.completed)
+        self.assertEqual(self.task_1.taskassignment_set.first().assigned_to, self.user)
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+"""Benchmarks for uploading very large Batches
+
+These tests are slow and need several GB of free disk space, so they
+are skipped unless the TURKLE_BENCHMARKS environment variable is set:
+
+    TURKLE_BENCHMARKS=1 python manage.py test turkle.tests.test_benchmarks
+
+The size of the synthetic CSV file uploaded by TestBatchUploadMemory
+can be changed with the TURKLE_BENCHMARK_CSV_MB environment variable
+(default: 500), the number of rows ingested by TestIngestThroughput
+with TURKLE_BENCHMARK_INGEST_ROWS (default: 1000000), and the number
+of rows of the wide CSV file used by TestColumnarTaskInputs with
+TURKLE_BENCHMARK_WIDE_ROWS (default: 100000).
+"""
+import io
+import multiprocessing
+import os
+import tempfile
+import time
+import unittest
+
+import django.test
+from django.contrib.auth.models import User
+from django.db import connection
+
+from turkle.ingest import create_tasks_in_parallel
+from turkle.models import Batch, BatchIngestJob, Project
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+RUN_BENCHMARKS = bool(os.environ.get('TURKLE_BENCHMARKS'))
+
+BOUNDARY = 'TurkleBenchmarkBoundary'
+
+
+class SyntheticUpload(object):
+    """Request body for a multipart/form-data Batch upload, generated while it is read
+
+    The CSV file has a header and num_rows rows of row_bytes bytes each.
+    """
+    def __init__(self, fields, num_rows, row_bytes):
+        prefix = b''
+        for (name, value) in fields.items():
+            prefix += (u'--%s\r\nContent-Disposition: form-data; name="%s"\r\n\r\n%s\r\n' %
+                       (BOUNDARY, name, value)).encode('utf-8')
+        prefix += (u'--%s\r\nContent-Disposition: form-data; name="csv_file"; '
+                   u'filename="benchmark.csv"\r\nContent-Type: text/csv\r\n\r\n' %
+                   BOUNDARY).encode('utf-8')
+        prefix += b'id,text\r\n'
+        self.prefix = prefix
+        self.suffix = (u'\r\n--%s--\r\n' % BOUNDARY).encode('utf-8')
+        self.num_rows = num_rows
+        self.row_bytes = row_bytes
+        self.length = len(self.prefix) + num_rows * row_bytes + len(self.suffix)
+        self._pending = self.prefix
+        self._rows_generated = 0
+
+    def _row(self, i):
+        row_id = u'%d,' % i
+        return (row_id + u'x' * (self.row_bytes - len(row_id) - 2) + u'\r\n').encode('ascii')
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.length
+        while len(self._pending) < size:
+            if self._rows_generated < self.num_rows:
+                rows = [self._row(i) for i in range(
+                    self._rows_generated, min(self.num_rows, self._rows_generated + 1000))]
+                self._rows_generated += len(rows)
+                self._pending += b''.join(rows)
+            elif self.suffix:
+                self._pending += self.suffix
+                self.suffix = b''
+            else:
+                break
+        data, self._pending = self._pending[:size], self._pending[size:]
+        return data
+
+
+@unittest.skipUnless(RUN_BENCHMARKS, 'Set TURKLE_BENCHMARKS=1 to run benchmarks')
+@unittest.skipIf(tracemalloc is None, 'Requires tracemalloc (Python 3)')
+class TestBatchUploadMemory(django.test.TestCase):
+    def test_upload_large_csv_file(self):
+        User.objects.create_superuser('admin', 'foo@bar.foo', 'secret')
+        project = Project(name='foo', html_template='<p>${id}: ${text}</p>')
+        project.save()
+        client = django.test.Client()
+        client.login(username='admin', password='secret')
+
+        csv_megabytes = int(os.environ.get('TURKLE_BENCHMARK_CSV_MB', 500))
+        row_bytes = 10 * 1024
+        body = SyntheticUpload(
+            {'assignments_per_task': 1, 'name': 'benchmark', 'project': project.id},
+            csv_megabytes * 1024 * 1024 // row_bytes, row_bytes)
+
+        # tracemalloc only counts memory allocated by Python, and not
+        # the memory used by the in-memory SQLite test database
+        tracemalloc.start()
+        try:
+            response = client.request(**{
+                'CONTENT_LENGTH': str(body.length),
+                'CONTENT_TYPE': 'multipart/form-data; boundary=%s' % BOUNDARY,
+                'PATH_INFO': '/admin/turkle/batch/add/',
+                'REQUEST_METHOD': 'POST',
+                'wsgi.input': body,
+            })
+            (_, peak_bytes) = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        self.assertEqual(response.status_code, 302)
+        batch = Batch.objects.get(name='benchmark')
+        self.assertEqual(batch.ingest_job.status, BatchIngestJob.COMPLETED)
+        self.assertEqual(batch.total_tasks(), body.num_rows)
+        print('Uploaded {} MB CSV file, peak memory {:.1f} MB'.format(
+            csv_megabytes, peak_bytes / (1024.0 * 1024)))
+        self.assertLess(peak_bytes, 100 * 1024 * 1024)
+
+
+@unittest.skipUnless(RUN_BENCHMARKS, 'Set TURKLE_BENCHMARKS=1 to run benchmarks')
+class TestIngestThroughput(django.test.TransactionTestCase):
+    def setUp(self):
+        self.num_rows = int(os.environ.get('TURKLE_BENCHMARK_INGEST_ROWS', 1000000))
+        (csv_fd, self.csv_path) = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(csv_fd, 'wb') as csv_fh:
+            csv_fh.write(b'id,name,"description",url,label\r\n')
+            for i in range(self.num_rows):
+                csv_fh.write((u'%d,item %d,"a ""quoted""\nmultiline value",'
+                              u'http://example.com/%d.png,\r\n' % (i, i, i)).encode('utf-8'))
+        self.project = Project(name='foo', html_template='<p>${id} ${name}</p>')
+        self.project.save()
+
+    def tearDown(self):
+        os.remove(self.csv_path)
+
+    def ingest(self, processes):
+        batch = Batch(project=self.project)
+        batch.save()
+        start = time.time()
+        if processes > 1:
+            num_tasks = create_tasks_in_parallel(batch, self.csv_path, processes)
+        else:
+            with open(self.csv_path, 'rb') as csv_fh:
+                num_tasks = batch.create_tasks_from_csv(csv_fh)
+        elapsed = time.time() - start
+        self.assertEqual(num_tasks, self.num_rows)
+        print('Ingested {} rows with {} processes: {:.0f} rows/second'.format(
+            self.num_rows, processes, self.num_rows / elapsed))
+        return elapsed
+
+    def test_ingest_throughput(self):
+        serial_elapsed = self.ingest(1)
+        processes = multiprocessing.cpu_count()
+        if processes > 1:
+            parallel_elapsed = self.ingest(processes)
+            self.assertLess(parallel_elapsed, serial_elapsed)
+
+
+@unittest.skipUnless(RUN_BENCHMARKS, 'Set TURKLE_BENCHMARKS=1 to run benchmarks')
+@django.test.override_settings(TURKLE_COMPRESSION_THRESHOLD=None)
+class TestColumnarTaskInputs(django.test.TestCase):
+    """Compare uncompressed Task inputs stored as JSON objects and as lists of values"""
+    def setUp(self):
+        self.num_rows = int(os.environ.get('TURKLE_BENCHMARK_WIDE_ROWS', 100000))
+        fieldnames = [u'annotation_field_%02d' % i for i in range(40)]
+        lines = [u','.join(fieldnames)]
+        for i in range(self.num_rows):
+            lines.append(u','.join(u'%d' % (i * j) for j in range(len(fieldnames))))
+        self.csv_text = (u'\r\n'.join(lines) + u'\r\n').encode('utf-8')
+        self.project = Project(name='foo', html_template=u'<p>${annotation_field_00}</p>')
+        self.project.save()
+
+    def ingest(self, columnar):
+        batch = Batch(project=self.project)
+        batch.save()
+        with self.settings(TURKLE_COLUMNAR_TASK_INPUTS=columnar):
+            batch.create_tasks_from_csv(io.BytesIO(self.csv_text))
+
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT SUM(LENGTH(input_csv_fields)) FROM turkle_task '
+                           'WHERE batch_id = %s', [batch.id])
+            stored_bytes = cursor.fetchone()[0]
+
+        start = time.time()
+        for task in batch.task_set.all().iterator():
+            task.input_csv_fields[u'annotation_field_00']
+        elapsed = time.time() - start
+
+        print('{}: {:.1f} MB of Task inputs, read {:.0f} Tasks/second'.format(
+            'Lists of values' if columnar else 'JSON objects',
+            stored_bytes / (1024.0 * 1024), self.num_rows / elapsed))
+        return (stored_bytes, elapsed)
+
+    def test_columnar_task_inputs(self):
+        # Reading Tasks is dominated by the ORM, so only the size is checked
+        (dict_bytes, _) = self.ingest(False)
+        (columnar_bytes, _) = self.ingest(True)
+        self.assertLess(columnar_bytes, dict_bytes / 2)
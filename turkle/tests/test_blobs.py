@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+try:
+    from cStringIO import StringIO
+except ImportError:
+    try:
+        from StringIO import StringIO
+    except ImportError:
+        from io import BytesIO
+        StringIO = BytesIO
+import os
+import os.path
+import shutil
+import tempfile
+
+from django.contrib.auth.models import User
+import django.test
+
+from turkle.blobs import BLOB_KEY, blob_path, read_blob, store_large_values, write_blob
+from turkle.ingest import create_tasks_in_parallel
+from turkle.models import Batch, Project, Task, TaskAssignment, hash_input_csv_fields
+
+
+# Tasks are not created in parallel inside the transaction of a TestCase
+class BlobTestCase(django.test.TransactionTestCase):
+    def setUp(self):
+        self.blob_dir = tempfile.mkdtemp()
+        self.document = u'Très long document. ' * 100
+
+    def tearDown(self):
+        shutil.rmtree(self.blob_dir)
+
+
+class TestBlobStore(BlobTestCase):
+    def test_write_and_read(self):
+        digest = write_blob(self.blob_dir, self.document)
+        self.assertTrue(os.path.exists(blob_path(self.blob_dir, digest)))
+        self.assertEqual(read_blob(self.blob_dir, digest), self.document)
+
+        # Values are stored once
+        self.assertEqual(write_blob(self.blob_dir, self.document), digest)
+        self.assertEqual(len(os.listdir(os.path.dirname(blob_path(self.blob_dir, digest)))), 1)
+
+    def test_store_large_values(self):
+        with self.settings(TURKLE_BLOB_DIR=self.blob_dir, TURKLE_BLOB_THRESHOLD=100):
+            stored = store_large_values({'a': self.document, 'b': 'short'})
+        self.assertEqual(stored['b'], 'short')
+        self.assertEqual(read_blob(self.blob_dir, stored['a'][BLOB_KEY]), self.document)
+
+    def test_blob_store_disabled(self):
+        input_csv_fields = {'a': self.document}
+        with self.settings(TURKLE_BLOB_DIR=None, TURKLE_BLOB_THRESHOLD=100):
+            self.assertEqual(store_large_values(input_csv_fields), input_csv_fields)
+        self.assertEqual(os.listdir(self.blob_dir), [])
+
+
+class TestBatchBlobs(BlobTestCase):
+    def setUp(self):
+        super(TestBatchBlobs, self).setUp()
+        project = Project(name='test', html_template='<p>${a}</p><p>${b}</p>')
+        project.save()
+        self.batch = Batch(project=project)
+        self.batch.save()
+        self.csv_data = u'a,b\r\n"{}",short\r\n'.format(self.document).encode('utf-8')
+
+    def check_task(self):
+        task = Task.objects.get()
+        self.assertEqual(task.input_csv_fields['b'], 'short')
+        self.assertTrue(BLOB_KEY in task.input_csv_fields['a'])
+        self.assertEqual(task.input_hash,
+                         hash_input_csv_fields({'a': self.document, 'b': 'short'}))
+        self.assertEqual(task.populate_html_template(),
+                         u'<p>{}</p><p>short</p>'.format(self.document))
+
+        user = User.objects.create_user('testuser', password='secret')
+        TaskAssignment(answers={'c': '1'}, assigned_to=user, completed=True, task=task).save()
+        csv_output = StringIO()
+        self.batch.to_csv(csv_output)
+        self.assertTrue(u'"{}","short","1"'.format(self.document) in
+                        csv_output.getvalue().decode('utf-8'))
+
+    def test_create_tasks(self):
+        with self.settings(TURKLE_BLOB_DIR=self.blob_dir, TURKLE_BLOB_THRESHOLD=100):
+            self.batch.create_tasks_from_csv(StringIO(self.csv_data))
+            self.check_task()
+
+    def test_create_tasks_in_parallel(self):
+        (csv_fd, csv_path) = tempfile.mkstemp(suffix='.csv', dir=self.blob_dir)
+        with os.fdopen(csv_fd, 'wb') as csv_fh:
+            csv_fh.write(self.csv_data)
+        with self.settings(TURKLE_BLOB_DIR=self.blob_dir, TURKLE_BLOB_THRESHOLD=100):
+            create_tasks_in_parallel(self.batch, csv_path, 2)
+            self.check_task()
@@ -116,6 +116,11 @@ class TestClient(django.test.LiveServerTestCase):
             self.client.download(tmpdir)
             self.assertTrue(os.path.exists(os.path.join(tmpdir, "sent-Batch_1_results.csv")))
 
+    def test_download_gzip(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            self.client.download(tmpdir, gzip=True)
+            self.assertTrue(os.path.exists(os.path.join(tmpdir, "sent-Batch_1_results.csv.gz")))
+
     def test_upload(self):
         options = argparse.Namespace()
         options.login = 0
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+import django.test
+from django.db import connection, transaction
+from django.db.utils import OperationalError
+
+from turkle import metrics
+from turkle.db import configure_sqlite_connection, retry_on_db_lock
+
+
+class TestConfigureSqliteConnection(django.test.TransactionTestCase):
+    @django.test.override_settings(TURKLE_SQLITE_PRAGMAS={'synchronous': 'NORMAL',
+                                                          'busy_timeout': 1234})
+    def test_pragmas(self):
+        configure_sqlite_connection(None, connection)
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            # NORMAL
+            self.assertEqual(cursor.fetchone()[0], 1)
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 1234)
+
+
+@django.test.override_settings(TURKLE_DB_LOCK_RETRIES=2, TURKLE_DB_LOCK_RETRY_DELAY=0.001)
+class TestRetryOnDbLock(django.test.TransactionTestCase):
+    def setUp(self):
+        metrics.reset_counters()
+        self.calls = 0
+
+    def locked_then_ok(self, failures):
+        @retry_on_db_lock
+        def func():
+            self.calls += 1
+            if self.calls <= failures:
+                raise OperationalError('database is locked')
+            return 'ok'
+        return func
+
+    def test_retry_succeeds(self):
+        self.assertEqual(self.locked_then_ok(2)(), 'ok')
+        self.assertEqual(self.calls, 3)
+        self.assertEqual(metrics.get_counters(), {'db_lock.retries': 2})
+
+    def test_retry_gives_up(self):
+        with self.assertRaises(OperationalError):
+            self.locked_then_ok(3)()
+        self.assertEqual(self.calls, 3)
+        self.assertEqual(metrics.get_counters(), {'db_lock.failures': 1,
+                                                  'db_lock.retries': 2})
+
+    def test_no_retry_inside_transaction(self):
+        with self.assertRaises(OperationalError):
+            with transaction.atomic():
+                self.locked_then_ok(1)()
+        self.assertEqual(self.calls, 1)
+
+    def test_no_retry_for_other_errors(self):
+        @retry_on_db_lock
+        def func():
+            self.calls += 1
+            raise OperationalError('no such table: foo')
+
+        with self.assertRaises(OperationalError):
+            func()
+        self.assertEqual(self.calls, 1)
@@ -0,0 +1,391 @@
+# -*- coding: utf-8 -*-
+try:
+    from cStringIO import StringIO
+except ImportError:
+    try:
+        from StringIO import StringIO
+    except ImportError:
+        from io import BytesIO
+        StringIO = BytesIO
+import datetime
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+
+from django.contrib.auth.models import User
+import django.test
+from django.urls import reverse
+from django.utils import timezone
+
+from turkle.exports import format_cursor, gzip_chunks, parse_cursor
+from turkle.models import Batch, BatchExport, Project, Task, TaskAssignment
+from turkle.submission_journal import apply_submissions
+
+
+class ExportTestCase(django.test.TestCase):
+    def setUp(self):
+        self.export_dir = tempfile.mkdtemp()
+        self.settings_override = self.settings(TURKLE_EXPORT_DIR=self.export_dir)
+        self.settings_override.enable()
+
+        self.project = Project(name='foo', html_template='<p>${foo}</p>')
+        self.project.save()
+        self.batch = Batch(project=self.project, name='foo', filename='foo.csv')
+        self.batch.save()
+        self.tasks = []
+        for foo in ('a', 'b', 'c'):
+            task = Task(batch=self.batch, input_csv_fields={'foo': foo})
+            task.save()
+            self.tasks.append(task)
+        self.complete(self.tasks[0], {'bar': '1'})
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.export_dir)
+
+    def complete(self, task, answers):
+        task_assignment = TaskAssignment(answers=answers, assigned_to=None, completed=True,
+                                         task=task)
+        task_assignment.save()
+        return task_assignment
+
+    def read_export(self, export):
+        with open(export.path(), 'rb') as fh:
+            return fh.read()
+
+    def to_csv(self):
+        csv_output = StringIO()
+        self.batch.to_csv(csv_output)
+        return csv_output.getvalue()
+
+
+class TestBatchExport(ExportTestCase):
+    def test_disabled(self):
+        with self.settings(TURKLE_EXPORT_DIR=None):
+            self.assertEqual(BatchExport.get_current(self.batch), None)
+
+    def test_build(self):
+        export = BatchExport.get_current(self.batch)
+        self.assertEqual(self.read_export(export), self.to_csv())
+        self.assertEqual(export.size, os.path.getsize(export.path()))
+        self.assertEqual(export.row_count, 1)
+
+        # The file is not updated if there are no new results
+        self.assertEqual(BatchExport.get_current(self.batch).version, export.version)
+
+    def test_line_endings(self):
+        export = BatchExport.get_current(self.batch, '\n')
+        self.assertEqual(self.read_export(export), self.to_csv().replace(b'\r\n', b'\n'))
+        self.assertNotEqual(export.path(), BatchExport.get_current(self.batch).path())
+
+    def test_append(self):
+        export = BatchExport.get_current(self.batch)
+        self.complete(self.tasks[1], {'bar': '2'})
+        self.complete(self.tasks[2], {'bar': '3'})
+        appended = BatchExport.get_current(self.batch)
+        self.assertEqual(appended.version, export.version + 1)
+        self.assertEqual(appended.row_count, 3)
+        self.assertEqual(sorted(self.read_export(appended).splitlines()),
+                         sorted(self.to_csv().splitlines()))
+
+    def test_append_discards_partial_rows(self):
+        export = BatchExport.get_current(self.batch)
+        with open(export.path(), 'ab') as fh:
+            fh.write(b'"partial')
+        self.complete(self.tasks[1], {'bar': '2'})
+        self.assertEqual(sorted(self.read_export(BatchExport.get_current(self.batch)).
+                                splitlines()),
+                         sorted(self.to_csv().splitlines()))
+
+    def test_rebuild_for_new_answer_field(self):
+        BatchExport.get_current(self.batch)
+        self.complete(self.tasks[1], {'bar': '2', 'baz': '3'})
+        export = BatchExport.get_current(self.batch)
+        self.assertEqual(export.fieldnames[-2:], ['Answer.bar', 'Answer.baz'])
+        self.assertEqual(self.read_export(export), self.to_csv())
+
+    def test_rebuild_for_deleted_results(self):
+        BatchExport.get_current(self.batch)
+        self.complete(self.tasks[1], {'bar': '2'})
+        self.tasks[0].delete()
+        export = BatchExport.get_current(self.batch)
+        self.assertEqual(export.row_count, 1)
+        self.assertEqual(self.read_export(export), self.to_csv())
+
+    def test_rebuild_for_renamed_project(self):
+        BatchExport.get_current(self.batch)
+        self.project.name = 'renamed'
+        self.project.save()
+        self.batch.refresh_from_db()
+        export = BatchExport.get_current(self.batch)
+        self.assertTrue(b'"renamed"' in self.read_export(export))
+
+    def test_duplicate_tasks(self):
+        self.batch.duplicate_tasks = Batch.LINK_BATCH_DUPLICATES
+        self.batch.save()
+        duplicate = Task(batch=self.batch, duplicate=True, input_csv_fields={'foo': 'a'},
+                         input_hash=self.tasks[0].input_hash)
+        duplicate.save()
+        export = BatchExport.get_current(self.batch)
+        self.assertEqual(export.row_count, 2)
+
+        self.complete(self.tasks[0], {'bar': '4'})
+        export = BatchExport.get_current(self.batch)
+        self.assertEqual(export.row_count, 4)
+        self.assertEqual(sorted(self.read_export(export).splitlines()),
+                         sorted(self.to_csv().splitlines()))
+
+
+class TestDownloadBatchExport(ExportTestCase):
+    def setUp(self):
+        super(TestDownloadBatchExport, self).setUp()
+        User.objects.create_superuser('admin', 'foo@bar.foo', 'secret')
+        self.client = django.test.Client()
+        self.client.login(username='admin', password='secret')
+        self.download_url = reverse('download_batch_csv', kwargs={'batch_id': self.batch.id})
+
+    def test_download(self):
+        response = self.client.get(self.download_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.to_csv())
+        self.assertEqual(response['Content-Disposition'],
+                         'attachment; filename="%s"' % self.batch.csv_results_filename())
+        self.assertTrue(response.has_header('Last-Modified'))
+
+    def test_not_modified(self):
+        etag = self.client.get(self.download_url)['ETag']
+        self.assertEqual(self.client.get(self.download_url, HTTP_IF_NONE_MATCH=etag).
+                         status_code, 304)
+
+        self.complete(self.tasks[1], {'bar': '2'})
+        response = self.client.get(self.download_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class TestCursor(django.test.TestCase):
+    def test_format_and_parse(self):
+        cursor = (datetime.datetime(2019, 3, 14, 15, 30, 0, 123456, tzinfo=timezone.utc), 42)
+        self.assertEqual(format_cursor(cursor), '20190314T153000123456-42')
+        self.assertEqual(parse_cursor(format_cursor(cursor)), cursor)
+        self.assertEqual(parse_cursor(''), None)
+        self.assertEqual(format_cursor(None), '')
+
+    def test_parse_invalid(self):
+        for cursor_string in ('42', '20191314T153000123456-42', 'x20190314T153000123456-42'):
+            with self.assertRaises(ValueError):
+                parse_cursor(cursor_string)
+
+
+@django.test.override_settings(TURKLE_RESULTS_CURSOR_LAG=0)
+class TestResultsSince(ExportTestCase):
+    def test_results_since(self):
+        (fieldnames, rows, cursor) = self.batch.results_since()
+        self.assertEqual(fieldnames[-2:], ('Input.foo', 'Answer.bar'))
+        self.assertEqual([row['Answer.bar'] for row in rows], ['1'])
+
+        (_, rows, next_cursor) = self.batch.results_since(cursor)
+        self.assertEqual((rows, next_cursor), ([], cursor))
+
+        self.complete(self.tasks[1], {'baz': '2'})
+        (fieldnames, rows, cursor) = self.batch.results_since(cursor)
+        self.assertEqual(fieldnames[-2:], ('Input.foo', 'Answer.baz'))
+        self.assertEqual([row['Input.foo'] for row in rows], ['b'])
+
+    def test_limit(self):
+        self.complete(self.tasks[1], {'bar': '2'})
+        self.complete(self.tasks[2], {'bar': '3'})
+        answers = []
+        cursor = None
+        while True:
+            (_, rows, cursor) = self.batch.results_since(cursor, limit=2)
+            if not rows:
+                break
+            self.assertTrue(len(rows) <= 2)
+            answers.extend(row['Answer.bar'] for row in rows)
+        self.assertEqual(answers, ['1', '2', '3'])
+
+    def test_duplicate_tasks(self):
+        self.batch.duplicate_tasks = Batch.LINK_BATCH_DUPLICATES
+        self.batch.save()
+        Task(batch=self.batch, duplicate=True, input_csv_fields={'foo': 'b'},
+             input_hash=self.tasks[1].input_hash).save()
+        (_, _, cursor) = self.batch.results_since()
+        self.complete(self.tasks[1], {'bar': '2'})
+        (_, rows, _) = self.batch.results_since(cursor, limit=1)
+        self.assertEqual([row['Input.foo'] for row in rows], ['b', 'b'])
+
+    def test_committed_after_cursor_with_earlier_updated_at(self):
+        task_assignment = TaskAssignment(assigned_to=None, task=self.tasks[1])
+        task_assignment.save()
+        submitted_at = timezone.now()
+        self.complete(self.tasks[2], {'bar': '3'})
+        (_, _, cursor) = self.batch.results_since()
+
+        # The journaled submission is applied after the cursor was returned,
+        # with the earlier time it was submitted
+        apply_submissions([{
+            'task_assignment_id': task_assignment.id,
+            'task_id': self.tasks[1].id,
+            'assigned_to_id': None,
+            'created_at': task_assignment.created_at.isoformat(),
+            'submitted_at': submitted_at.isoformat(),
+            'answers': {'bar': '2'},
+        }])
+        task_assignment.refresh_from_db()
+        self.assertTrue(task_assignment.updated_at < cursor[0])
+        (_, rows, _) = self.batch.results_since(cursor)
+        self.assertEqual([row['Answer.bar'] for row in rows], ['2'])
+
+    @django.test.override_settings(TURKLE_RESULTS_CURSOR_LAG=60)
+    def test_lag(self):
+        TaskAssignment.objects.update(saved_at=timezone.now() - datetime.timedelta(minutes=5))
+        (_, _, cursor) = self.batch.results_since()
+        self.assertTrue(cursor)
+        task_assignment = self.complete(self.tasks[1], {'bar': '2'})
+        # The Task Assignment may belong to a transaction that has not committed
+        self.assertEqual(self.batch.results_since(cursor)[1:], ([], cursor))
+        TaskAssignment.objects.filter(id=task_assignment.id).update(
+            saved_at=timezone.now() - datetime.timedelta(minutes=2))
+        (_, rows, _) = self.batch.results_since(cursor)
+        self.assertEqual([row['Answer.bar'] for row in rows], ['2'])
+
+
+@django.test.override_settings(TURKLE_RESULTS_CURSOR_LAG=0)
+class TestDownloadBatchChanges(ExportTestCase):
+    def setUp(self):
+        super(TestDownloadBatchChanges, self).setUp()
+        User.objects.create_superuser('admin', 'foo@bar.foo', 'secret')
+        self.client = django.test.Client()
+        self.client.login(username='admin', password='secret')
+        self.changes_url = reverse('download_batch_changes', kwargs={'batch_id': self.batch.id})
+
+    def test_download(self):
+        response = self.client.get(self.changes_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, self.to_csv())
+
+        self.complete(self.tasks[1], {'bar': '2'})
+        response = self.client.get(self.changes_url, {'cursor': response['X-Turkle-Cursor']})
+        self.assertEqual(response.content.splitlines()[1:],
+                         self.to_csv().splitlines()[2:])
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get(self.changes_url, {'cursor': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get(self.changes_url, {'limit': '-1'}).status_code, 400)
+
+
+class TestResultsJsonl(ExportTestCase):
+    def results(self, obj):
+        return [json.loads(line) for line in obj.results_jsonl()]
+
+    def test_batch(self):
+        self.complete(self.tasks[1], {'bar': u'Très "quoted"\n'})
+        results = self.results(self.batch)
+        self.assertEqual([(r['input'], r['answers']) for r in results],
+                         [({'foo': 'a'}, {'bar': '1'}),
+                          ({'foo': 'b'}, {'bar': u'Très "quoted"\n'})])
+        self.assertEqual(results[0]['HITId'], self.tasks[0].id)
+        self.assertEqual(results[0]['Title'], 'foo')
+        self.assertEqual(results[0]['WorkerId'], None)
+
+    def test_columnar_input(self):
+        batch = Batch(project=self.project, name='bar', filename='bar.csv')
+        batch.save()
+        with self.settings(TURKLE_COLUMNAR_TASK_INPUTS=True, TURKLE_COMPRESSION_THRESHOLD=10):
+            batch.create_tasks_from_csv(StringIO(b'foo,baz\r\n1,2\r\n'))
+            self.complete(batch.task_set.get(), {'bar': 'x' * 100})
+        self.assertTrue(TaskAssignment.objects.filter(answers__startswith='zlib:').exists())
+        self.assertEqual([(r['input'], r['answers']) for r in self.results(batch)],
+                         [({'foo': '1', 'baz': '2'}, {'bar': 'x' * 100})])
+
+    def test_blob_input(self):
+        with self.settings(TURKLE_BLOB_DIR=self.export_dir, TURKLE_BLOB_THRESHOLD=10):
+            batch = Batch(project=self.project, name='bar', filename='bar.csv')
+            batch.save()
+            batch.create_tasks_from_csv(StringIO(b'foo\r\n' + b'y' * 20 + b'\r\n'))
+            self.complete(batch.task_set.get(), {'bar': '1'})
+            self.assertEqual([r['input'] for r in self.results(batch)], [{'foo': 'y' * 20}])
+
+    def test_duplicate_tasks(self):
+        self.batch.duplicate_tasks = Batch.LINK_BATCH_DUPLICATES
+        self.batch.save()
+        duplicate = Task(batch=self.batch, duplicate=True, input_csv_fields={'foo': 'a'},
+                         input_hash=self.tasks[0].input_hash)
+        duplicate.save()
+        self.assertEqual([(r['HITId'], r['answers']) for r in self.results(self.batch)],
+                         [(self.tasks[0].id, {'bar': '1'}), (duplicate.id, {'bar': '1'})])
+
+    def test_project(self):
+        batch = Batch(project=self.project, name='bar', filename='bar.csv')
+        batch.save()
+        task = Task(batch=batch, input_csv_fields={'foo': 'd'})
+        task.save()
+        self.complete(task, {'bar': '2'})
+        self.assertEqual([r['input'] for r in self.results(self.project)],
+                         [{'foo': 'a'}, {'foo': 'd'}])
+
+    def test_download(self):
+        User.objects.create_superuser('admin', 'foo@bar.foo', 'secret')
+        client = django.test.Client()
+        client.login(username='admin', password='secret')
+        response = client.get(reverse('download_batch_jsonl',
+                                      kwargs={'batch_id': self.batch.id}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Disposition'],
+                         'attachment; filename="foo-Batch_%d_results.jsonl"' % self.batch.id)
+        self.assertEqual(b''.join(response.streaming_content).decode('utf-8'),
+                         u''.join(self.batch.results_jsonl()))
+
+        response = client.get(reverse('download_project_jsonl',
+                                      kwargs={'project_id': self.project.id}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(b''.join(response.streaming_content).splitlines()), 1)
+
+
+class TestGzipDownloads(ExportTestCase):
+    def setUp(self):
+        super(TestGzipDownloads, self).setUp()
+        User.objects.create_superuser('admin', 'foo@bar.foo', 'secret')
+        self.client = django.test.Client()
+        self.client.login(username='admin', password='secret')
+        self.download_url = reverse('download_batch_csv', kwargs={'batch_id': self.batch.id})
+
+    def get_gzip(self, url, **headers):
+        response = self.client.get(url, {'gzip': '1'}, **headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        return (response, gzip.GzipFile(fileobj=io.BytesIO(
+            b''.join(response.streaming_content))).read())
+
+    def test_gzip_chunks(self):
+        lines = [u'{"line": %d, "text": "Très"}\n' % i for i in range(10000)]
+        compressed = b''.join(gzip_chunks(iter(lines)))
+        self.assertEqual(gzip.GzipFile(fileobj=io.BytesIO(compressed)).read().decode('utf-8'),
+                         u''.join(lines))
+
+    def test_csv(self):
+        (response, content) = self.get_gzip(self.download_url)
+        self.assertEqual(content, self.to_csv())
+        self.assertEqual(response['Content-Disposition'],
+                         'attachment; filename="%s.gz"' % self.batch.csv_results_filename())
+
+        # The compressed file has its own ETag
+        uncompressed_etag = self.client.get(self.download_url)['ETag']
+        self.assertNotEqual(response['ETag'], uncompressed_etag)
+        self.assertEqual(self.client.get(self.download_url, {'gzip': '1'},
+                                         HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_csv_without_export_dir(self):
+        with self.settings(TURKLE_EXPORT_DIR=None):
+            (_, content) = self.get_gzip(self.download_url)
+        self.assertEqual(content, self.to_csv())
+
+    def test_jsonl(self):
+        (response, content) = self.get_gzip(
+            reverse('download_batch_jsonl', kwargs={'batch_id': self.batch.id}))
+        self.assertEqual(content.decode('utf-8'), u''.join(self.batch.results_jsonl()))
+        self.assertTrue(response['Content-Disposition'].endswith('.jsonl.gz"'))
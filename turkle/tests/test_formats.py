@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+import bz2
+import gzip
+import io
+import sys
+import unittest
+
+from turkle.formats import (BZIP2, CSV, GZIP, JSONL, TSV, RowError, detect_format,
+                            open_batch_file, split_batch_filename)
+
+
+def gzip_compress(data):
+    fh = io.BytesIO()
+    with gzip.GzipFile(fileobj=fh, mode='wb') as gzip_fh:
+        gzip_fh.write(data)
+    return fh.getvalue()
+
+
+class TestDetectFormat(unittest.TestCase):
+    def test_extension(self):
+        fh = io.BytesIO(b'a,b\n')
+        self.assertEqual(detect_format(fh, 'tasks.csv'), (None, CSV))
+        self.assertEqual(detect_format(fh, 'tasks.TSV'), (None, TSV))
+        self.assertEqual(detect_format(fh, 'tasks.jsonl.gz'), (GZIP, JSONL))
+        self.assertEqual(detect_format(fh, 'tasks.ndjson.bz2'), (BZIP2, JSONL))
+
+    def test_magic_bytes(self):
+        self.assertEqual(detect_format(io.BytesIO(gzip_compress(b'{"a": 1}\n'))), (GZIP, JSONL))
+        self.assertEqual(detect_format(io.BytesIO(bz2.compress(b'a,b\n'))), (BZIP2, CSV))
+        self.assertEqual(detect_format(io.BytesIO(b'  {"a": 1}\n'), 'tasks.txt'), (None, JSONL))
+
+    def test_position_unchanged(self):
+        fh = io.BytesIO(gzip_compress(b'a,b\n'))
+        detect_format(fh)
+        self.assertEqual(fh.tell(), 0)
+
+
+class TestOpenBatchFile(unittest.TestCase):
+    def test_csv(self):
+        (header, rows) = open_batch_file(io.BytesIO(b'a,b\r\n1,"2\r\n3"\r\n'), 'tasks.csv')
+        self.assertEqual(header, [u'a', u'b'])
+        self.assertEqual(list(rows), [[u'1', u'2\r\n3']])
+
+    def test_gzip_tsv(self):
+        data = gzip_compress(u'a\tb\n1\t😀\n'.encode('utf-8'))
+        (header, rows) = open_batch_file(io.BytesIO(data), 'tasks.tsv.gz')
+        self.assertEqual(header, [u'a', u'b'])
+        self.assertEqual(list(rows), [[u'1', u'😀']])
+
+    def test_concatenated_gzip(self):
+        data = gzip_compress(b'a,b\n1,2\n') + gzip_compress(b'3,4\n')
+        (header, rows) = open_batch_file(io.BytesIO(data))
+        self.assertEqual(list(rows), [[u'1', u'2'], [u'3', u'4']])
+
+    def test_bzip2_csv(self):
+        data = bz2.compress(b'a,b\n' + b'1,2\n' * 100000)
+        (header, rows) = open_batch_file(io.BytesIO(data), 'tasks.csv.bz2')
+        self.assertEqual(header, [u'a', u'b'])
+        self.assertEqual(sum(1 for _ in rows), 100000)
+
+    @unittest.skipIf(sys.version_info < (3,), 'Truncation is only detected on Python 3')
+    def test_truncated(self):
+        rows = b'a,b\n' + b''.join(b'%d,%d\n' % (i, i * i) for i in range(10000))
+        for data in (gzip_compress(rows), bz2.compress(rows)):
+            with self.assertRaisesRegexp(ValueError, 'truncated'):
+                (header, rows_iter) = open_batch_file(io.BytesIO(data[:len(data) // 2]))
+                list(rows_iter)
+
+    def test_corrupt(self):
+        data = gzip_compress(b'a,b\n1,2\n') + b'not gzip'
+        (header, rows) = open_batch_file(io.BytesIO(data))
+        with self.assertRaisesRegexp(ValueError, 'corrupt'):
+            list(rows)
+
+    def test_jsonl(self):
+        data = (b'{"b": "x", "a": 1}\n\n{"a": [1, 2], "b": "\\u00e9"}\nnot json\n'
+                b'{"a": 1}\n[1]\n')
+        (header, rows) = open_batch_file(io.BytesIO(data), 'tasks.jsonl')
+        self.assertEqual(header, [u'b', u'a'])
+        rows = list(rows)
+        self.assertEqual(rows[0], [u'x', u'1'])
+        self.assertEqual(rows[1], [u'\u00e9', u'[1, 2]'])
+        self.assertEqual([row.message for row in rows[2:] if isinstance(row, RowError)], [
+            'Line 4 of the JSON Lines file is not valid JSON',
+            'Line 5 of the JSON Lines file has different fields than line 1',
+            'Line 6 of the JSON Lines file is not a JSON object',
+        ])
+
+    def test_empty_file(self):
+        with self.assertRaises(ValueError):
+            open_batch_file(io.BytesIO(b''), 'tasks.csv')
+        with self.assertRaises(ValueError):
+            open_batch_file(io.BytesIO(b'\n'), 'tasks.jsonl')
+
+
+class TestSplitBatchFilename(unittest.TestCase):
+    def test_split_batch_filename(self):
+        self.assertEqual(split_batch_filename('tasks.csv'), ('tasks', '.csv'))
+        self.assertEqual(split_batch_filename('tasks.CSV'), ('tasks', '.CSV'))
+        self.assertEqual(split_batch_filename('tasks.csv.gz'), ('tasks', '.csv'))
+        self.assertEqual(split_batch_filename('tasks.jsonl.bz2'), ('tasks', '.csv'))
+        self.assertEqual(split_batch_filename('tasks.txt'), ('tasks', '.txt'))
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+import os
+import tempfile
+
+import django.test
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.transaction import TransactionManagementError
+
+from turkle.ingest import create_tasks_in_parallel, split_csv
+from turkle.models import Batch, BatchIngestJob, Project, hash_input_csv_fields
+
+
+# Tasks are not created in parallel inside the transaction of a TestCase
+class IngestTestCase(django.test.TransactionTestCase):
+    def setUp(self):
+        self.csv_paths = []
+
+    def tearDown(self):
+        for csv_path in self.csv_paths:
+            if os.path.exists(csv_path):
+                os.remove(csv_path)
+
+    def write_csv(self, csv_text):
+        (csv_fd, csv_path) = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(csv_fd, 'wb') as csv_fh:
+            csv_fh.write(csv_text)
+        self.csv_paths.append(csv_path)
+        return csv_path
+
+
+class TestSplitCsv(IngestTestCase):
+    def test_split_at_every_record(self):
+        csv_path = self.write_csv(b'a,b\r\n1,2\r\n3,4\r\n5,6')
+        (header, byte_ranges) = split_csv(csv_path, 1)
+        self.assertEqual(header, [u'a', u'b'])
+        self.assertEqual(byte_ranges, [(5, 10), (10, 15), (15, 18)])
+
+    def test_split_with_quoted_newlines(self):
+        csv_text = b'"a\nb",c\n"1\n""2\n",3\n4,"5\n6"\n'
+        csv_path = self.write_csv(csv_text)
+        (header, byte_ranges) = split_csv(csv_path, 1)
+        self.assertEqual(header, [u'a\nb', u'c'])
+        self.assertEqual([csv_text[start:end] for (start, end) in byte_ranges],
+                         [b'"1\n""2\n",3\n', b'4,"5\n6"\n'])
+
+    def test_split_large_ranges(self):
+        csv_path = self.write_csv(b'a\n' + b'1\n' * 100)
+        (header, byte_ranges) = split_csv(csv_path, 50)
+        self.assertEqual(byte_ranges, [(2, 54), (54, 106), (106, 158), (158, 202)])
+
+    def test_header_only(self):
+        csv_path = self.write_csv(b'a,b')
+        self.assertEqual(split_csv(csv_path, 1), ([u'a', u'b'], []))
+
+
+class TestCreateTasksInParallel(IngestTestCase):
+    def setUp(self):
+        super(TestCreateTasksInParallel, self).setUp()
+        project = Project(name='foo', html_template='<p>${a}: ${b}</p>')
+        project.save()
+        self.batch = Batch(project=project)
+        self.batch.save()
+
+    def test_create_tasks(self):
+        csv_path = self.write_csv(b'a,b\r\n' + b''.join(
+            (u'%d,"x\r\n%d"\r\n' % (i, i)).encode('utf-8') for i in range(2000)))
+        progress = []
+        with self.settings(TURKLE_INGEST_PROCESSES=2):
+            self.assertEqual(
+                create_tasks_in_parallel(self.batch, csv_path, 2,
+                                         progress_callback=lambda t, b: progress.append(t)),
+                2000)
+        tasks = list(self.batch.task_set.order_by('id'))
+        self.assertEqual(len(tasks), 2000)
+        self.assertEqual(tasks[0].input_csv_fields, {u'a': u'0', u'b': u'x\r\n0'})
+        self.assertEqual(tasks[1999].input_csv_fields, {u'a': u'1999', u'b': u'x\r\n1999'})
+        self.assertEqual(progress[-1], 2000)
+
+    def test_create_tasks_with_variable_fields_per_row(self):
+        csv_path = self.write_csv(b'a,b\n1,2\n1\n1,2\n1,2,3\n')
+        with self.assertRaises(ValidationError) as cm:
+            create_tasks_in_parallel(self.batch, csv_path, 2)
+        self.assertEqual(cm.exception.messages, [
+            'The CSV file header has 2 fields, but line 3 has 1 fields',
+            'The CSV file header has 2 fields, but line 5 has 3 fields',
+        ])
+        self.assertEqual(self.batch.total_tasks(), 0)
+
+    @django.test.override_settings(TURKLE_INGEST_PROCESSES=2)
+    def test_ingest_job(self):
+        csv_path = self.write_csv(b'a,b\n1,2\n3,4\n')
+        ingest_job = BatchIngestJob(batch=self.batch, csv_path=csv_path, total_bytes=12)
+        ingest_job.save()
+        ingest_job.run()
+        self.assertEqual(ingest_job.status, BatchIngestJob.COMPLETED)
+        self.assertEqual(self.batch.total_tasks(), 2)
+
+    def test_create_tasks_in_transaction(self):
+        csv_path = self.write_csv(b'a,b\n1,2\n')
+        with transaction.atomic():
+            with self.assertRaises(TransactionManagementError):
+                create_tasks_in_parallel(self.batch, csv_path, 2)
+
+    def test_create_tasks_skips_duplicates(self):
+        self.batch.duplicate_tasks = Batch.SKIP_BATCH_DUPLICATES
+        self.batch.save()
+        csv_path = self.write_csv(b'a,b\n1,2\n3,4\n1,2\n3,5\n')
+        self.assertEqual(create_tasks_in_parallel(self.batch, csv_path, 2), 3)
+        self.assertEqual(
+            [t.input_csv_fields for t in self.batch.task_set.order_by('id')],
+            [{u'a': u'1', u'b': u'2'}, {u'a': u'3', u'b': u'4'}, {u'a': u'3', u'b': u'5'}])
+        self.assertEqual(Batch.objects.get(id=self.batch.id).duplicate_rows, 1)
+        self.assertEqual(self.batch.task_set.first().input_hash,
+                         hash_input_csv_fields({u'a': u'1', u'b': u'2'}))
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+try:
+    from cStringIO import StringIO
+except ImportError:
+    try:
+        from StringIO import StringIO
+    except ImportError:
+        from io import BytesIO
+        StringIO = BytesIO
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+import zipfile
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+import django.test
+from django.urls import reverse
+
+from turkle.ingest import create_tasks_in_parallel
+from turkle.media import media_path, read_media_archive, store_media_file
+from turkle.models import Batch, BatchMedia, Project, Task, TaskAssignment
+
+
+def zip_archive(files):
+    archive_fh = io.BytesIO()
+    with zipfile.ZipFile(archive_fh, 'w') as archive:
+        for (path, data) in files:
+            archive.writestr(path, data)
+    archive_fh.seek(0)
+    return archive_fh
+
+
+# Tasks are not created in parallel inside the transaction of a TestCase
+class MediaTestCase(django.test.TransactionTestCase):
+    def setUp(self):
+        self.media_dir = tempfile.mkdtemp()
+        self.settings_override = self.settings(TURKLE_MEDIA_DIR=self.media_dir)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_dir)
+
+
+class TestMediaStore(MediaTestCase):
+    def test_read_zip_archive(self):
+        archive_fh = zip_archive([('a.png', b'1'), ('./sub/b.wav', b'2')])
+        self.assertEqual([(path, fh.read()) for (path, fh) in read_media_archive(archive_fh)],
+                         [('a.png', b'1'), ('sub/b.wav', b'2')])
+
+    def test_read_tar_archive(self):
+        archive_fh = io.BytesIO()
+        with tarfile.open(fileobj=archive_fh, mode='w:gz') as archive:
+            info = tarfile.TarInfo('./sub/a.png')
+            info.size = 3
+            archive.addfile(info, io.BytesIO(b'abc'))
+        archive_fh.seek(0)
+        self.assertEqual([(path, fh.read()) for (path, fh) in read_media_archive(archive_fh)],
+                         [('sub/a.png', b'abc')])
+
+    def test_read_invalid_archive(self):
+        with self.assertRaises(ValueError):
+            list(read_media_archive(io.BytesIO(b'not an archive')))
+
+    def test_store_media_file(self):
+        (digest, size) = store_media_file(self.media_dir, io.BytesIO(b'meow'))
+        self.assertEqual(size, 4)
+        with open(media_path(self.media_dir, digest), 'rb') as fh:
+            self.assertEqual(fh.read(), b'meow')
+
+        # Files are stored once
+        self.assertEqual(store_media_file(self.media_dir, io.BytesIO(b'meow')), (digest, size))
+        self.assertEqual(len(os.listdir(self.media_dir)), 1)
+
+
+class TestBatchMedia(MediaTestCase):
+    def setUp(self):
+        super(TestBatchMedia, self).setUp()
+        self.project = Project(html_template='<img src="${image}">', login_required=False)
+        self.project.save()
+        self.batch = Batch(project=self.project)
+        self.batch.save()
+
+    def test_add_archive(self):
+        self.assertEqual(BatchMedia.add_archive(self.batch, zip_archive(
+            [('cat.jpg', b'meow'), ('dog.jpg', b'woof')])), 2)
+        # Files with the same path are replaced
+        BatchMedia.add_archive(self.batch, zip_archive([('cat.jpg', b'purr')]))
+        self.assertEqual(
+            sorted((m.filename, open(m.path(), 'rb').read()) for m in BatchMedia.objects.all()),
+            [('cat.jpg', b'purr'), ('dog.jpg', b'woof')])
+
+    def test_add_archive_disabled(self):
+        with self.settings(TURKLE_MEDIA_DIR=None):
+            with self.assertRaises(ValidationError):
+                BatchMedia.add_archive(self.batch, zip_archive([('cat.jpg', b'meow')]))
+
+    def test_create_tasks(self):
+        BatchMedia.add_archive(self.batch, zip_archive([('cat.jpg', b'meow')]))
+        url = BatchMedia.objects.get().url()
+        self.batch.create_tasks_from_csv(StringIO(b'image\r\ncat.jpg\r\ndog.jpg\r\n'))
+        self.assertEqual([t.input_csv_fields['image'] for t in Task.objects.order_by('id')],
+                         [url, 'dog.jpg'])
+        self.assertEqual(Task.objects.order_by('id').first().populate_html_template(),
+                         '<img src="{}">'.format(url))
+
+    def test_create_tasks_in_parallel(self):
+        BatchMedia.add_archive(self.batch, zip_archive([('cat.jpg', b'meow')]))
+        (csv_fd, csv_path) = tempfile.mkstemp(suffix='.csv', dir=self.media_dir)
+        with os.fdopen(csv_fd, 'wb') as csv_fh:
+            csv_fh.write(b'image\r\ncat.jpg\r\ndog.jpg\r\n')
+        create_tasks_in_parallel(self.batch, csv_path, 2)
+        self.assertEqual([t.input_csv_fields['image'] for t in Task.objects.order_by('id')],
+                         [BatchMedia.objects.get().url(), 'dog.jpg'])
+
+    def test_clone(self):
+        BatchMedia.add_archive(self.batch, zip_archive([('cat.jpg', b'meow')]))
+        new_batch = self.batch.clone()
+        self.assertEqual(new_batch.media_urls(), self.batch.media_urls())
+
+
+class TestBatchMediaView(MediaTestCase):
+    def setUp(self):
+        super(TestBatchMediaView, self).setUp()
+        self.project = Project(html_template='<img src="${image}">', login_required=False)
+        self.project.save()
+        self.batch = Batch(project=self.project)
+        self.batch.save()
+        self.data = bytes(bytearray(range(256))) * 4
+        BatchMedia.add_archive(self.batch, zip_archive([('image.png', self.data)]))
+        self.media = BatchMedia.objects.get()
+
+    def get(self, **headers):
+        return django.test.Client().get(self.media.url(), **headers)
+
+    def test_get(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.data)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertEqual(response['Content-Length'], str(len(self.data)))
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+
+    def test_not_modified(self):
+        etag = self.get()['ETag']
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_range(self):
+        response = self.get(HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), self.data[10:20])
+        self.assertEqual(response['Content-Range'], 'bytes 10-19/1024')
+        self.assertEqual(response['Content-Length'], '10')
+
+        response = self.get(HTTP_RANGE='bytes=1000-')
+        self.assertEqual(b''.join(response.streaming_content), self.data[1000:])
+        response = self.get(HTTP_RANGE='bytes=-4')
+        self.assertEqual(response['Content-Range'], 'bytes 1020-1023/1024')
+        self.assertEqual(b''.join(response.streaming_content), self.data[-4:])
+
+    def test_range_not_satisfiable(self):
+        response = self.get(HTTP_RANGE='bytes=2000-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */1024')
+
+    def test_if_range_mismatch(self):
+        response = self.get(HTTP_RANGE='bytes=10-19', HTTP_IF_RANGE='"other"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_permission(self):
+        self.project.login_required = True
+        self.project.custom_permissions = True
+        self.project.save()
+        self.assertEqual(self.get().status_code, 404)
+
+    def test_preload_next_task_media(self):
+        self.batch.create_tasks_from_csv(StringIO(b'image\r\nimage.png\r\nother.png\r\n'))
+        (first_task, second_task) = Task.objects.order_by('id')
+        user = User.objects.create_user('testuser', password='secret')
+        task_assignment = TaskAssignment(assigned_to=user, task=second_task)
+        task_assignment.save()
+
+        client = django.test.Client()
+        client.login(username='testuser', password='secret')
+        response = client.get(reverse('task_assignment', kwargs={
+            'task_id': second_task.id, 'task_assignment_id': task_assignment.id}))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue('<link rel="prefetch" href="{}">'.format(self.media.url()).encode() in
+                        response.content)
@@ -7,8 +7,15 @@ except ImportError:
     except ImportError:
         from io import BytesIO
         StringIO = BytesIO
+import base64
 import datetime
+import gzip
+import json
+import os
 import os.path
+import sys
+import tempfile
+import unittest
 
 from django.contrib.auth.models import AnonymousUser, Group, User
 from django.core.exceptions import ValidationError
@@ -16,7 +23,10 @@ import django.test
 from django.utils import timezone
 from guardian.shortcuts import assign_perm
 
-from turkle.models import Task, TaskAssignment, Batch, Project
+from turkle.availability import availability_version
+from turkle.models import (BULK_CHUNK_SIZE, Task, TaskAssignment, Batch, BatchIngestJob,
+                           CachedAnswer, Project, ProjectAsset, decode_json, encode_json,
+                           hash_input_csv_fields)
 
 # hack to add unicode() to python3 for backward compatibility
 try:
@@ -313,6 +323,57 @@ class TestBatch(django.test.TestCase):
         self.assertEqual(tasks[2].input_csv_fields['emoji'], u'🤔')
         self.assertEqual(tasks[2].input_csv_fields['more_emoji'], u'🤭')
 
+    def test_batch_from_csv_with_variable_fields_per_row(self):
+        project = Project(name='test', html_template='<p>${a} - ${b}</p>')
+        project.save()
+        batch = Batch(project=project)
+        batch.save()
+
+        # The first chunk of Tasks is committed before the bad rows are found
+        rows = [b'a,b'] + [b'1,2'] * BULK_CHUNK_SIZE + [b'1', b'1,2', b'1,2,3']
+        csv_fh = StringIO(b'\r\n'.join(rows) + b'\r\n')
+        with self.assertRaises(ValidationError) as cm:
+            batch.create_tasks_from_csv(csv_fh)
+        self.assertEqual(cm.exception.messages, [
+            'The CSV file header has 2 fields, but line %d has 1 fields' % (BULK_CHUNK_SIZE + 2),
+            'The CSV file header has 2 fields, but line %d has 3 fields' % (BULK_CHUNK_SIZE + 4),
+        ])
+        self.assertEqual(batch.total_tasks(), 0)
+
+    def test_batch_from_csv_errors_keep_concurrent_tasks(self):
+        project = Project(name='test', html_template='<p>${a} - ${b}</p>')
+        project.save()
+        batch = Batch(project=project)
+        batch.save()
+
+        # A Task created for the Batch by another append while the file is read
+        def create_concurrent_task(tasks_created, bytes_read):
+            Task(batch=batch, input_csv_fields={'a': 'x', 'b': 'y'}).save()
+
+        rows = [b'a,b'] + [b'1,2'] * BULK_CHUNK_SIZE + [b'1']
+        with self.assertRaises(ValidationError):
+            batch.create_tasks_from_csv(StringIO(b'\r\n'.join(rows) + b'\r\n'),
+                                        progress_callback=create_concurrent_task)
+        self.assertEqual([t.input_csv_fields for t in batch.task_set.all()],
+                         [{'a': 'x', 'b': 'y'}])
+
+    @unittest.skipIf(sys.version_info < (3,), 'Truncation is only detected on Python 3')
+    def test_batch_from_truncated_gzip_file(self):
+        project = Project(name='test', html_template='<p>${a} - ${b}</p>')
+        project.save()
+        batch = Batch(project=project)
+        batch.save()
+
+        gzip_fh = StringIO()
+        with gzip.GzipFile(fileobj=gzip_fh, mode='wb') as fh:
+            fh.write(b'a,b\r\n' + b''.join(b'%d,%d\r\n' % (i, i * i)
+                                           for i in range(BULK_CHUNK_SIZE * 3)))
+        data = gzip_fh.getvalue()
+        with self.assertRaises(ValidationError) as cm:
+            batch.create_tasks_from_csv(StringIO(data[:-100]), filename='tasks.csv.gz')
+        self.assertEqual(cm.exception.messages, ['The compressed file is truncated'])
+        self.assertEqual(batch.total_tasks(), 0)
+
     def test_login_required_validation_1(self):
         # No ValidationError thrown
         project = Project(
@@ -347,6 +408,80 @@ class TestBatch(django.test.TestCase):
             ).clean()
 
 
+class TestBatchBulkSubmitAnswers(django.test.TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('testuser', password='secret')
+        self.other_user = User.objects.create_user('otheruser', password='secret')
+        project = Project(name='foo', html_template='<p>${foo}</p>')
+        project.save()
+        self.batch = Batch(assignments_per_task=2, project=project)
+        self.batch.save()
+        self.tasks = []
+        for i in range(3):
+            task = Task(batch=self.batch, input_csv_fields={'foo': str(i)})
+            task.save()
+            self.tasks.append(task)
+
+    def test_bulk_submit_answers(self):
+        TaskAssignment(assigned_to=self.other_user, completed=True, answers={'a': 'x'},
+                       task=self.tasks[0]).save()
+        summary = self.batch.bulk_submit_answers(self.user, [
+            {'task_id': self.tasks[0].id, 'answers': {'a': 'y', 'csrfmiddlewaretoken': 'z'}},
+            {'task_id': self.tasks[1].id, 'answers': {'a': 'y'}},
+        ])
+        self.assertEqual(summary, {'submitted': 2, 'skipped': 0, 'errors': []})
+        self.tasks[0].refresh_from_db()
+        self.tasks[1].refresh_from_db()
+        self.assertTrue(self.tasks[0].completed)
+        self.assertFalse(self.tasks[1].completed)
+        task_assignment = TaskAssignment.objects.get(task=self.tasks[0], assigned_to=self.user)
+        self.assertTrue(task_assignment.completed)
+        self.assertEqual(task_assignment.answers, {'a': 'y'})
+        self.assertTrue(task_assignment.expires_at is not None)
+
+    def test_bulk_submit_answers_replaces_uncompleted_assignment(self):
+        TaskAssignment(assigned_to=self.user, completed=False, task=self.tasks[0]).save()
+        summary = self.batch.bulk_submit_answers(self.user, [
+            {'task_id': self.tasks[0].id, 'answers': {'a': 'y'}},
+        ])
+        self.assertEqual(summary['submitted'], 1)
+        self.assertEqual(self.tasks[0].taskassignment_set.count(), 1)
+        self.assertTrue(self.tasks[0].taskassignment_set.first().completed)
+
+    def test_bulk_submit_answers_skipped(self):
+        third_user = User.objects.create_user('thirduser', password='secret')
+        TaskAssignment(assigned_to=self.other_user, task=self.tasks[0]).save()
+        TaskAssignment(assigned_to=third_user, task=self.tasks[0]).save()
+        TaskAssignment(assigned_to=self.user, completed=True, task=self.tasks[1]).save()
+        other_batch = Batch(project=self.batch.project)
+        other_batch.save()
+        other_task = Task(batch=other_batch, input_csv_fields={'foo': 'bar'})
+        other_task.save()
+
+        summary = self.batch.bulk_submit_answers(self.user, [
+            {'task_id': self.tasks[0].id, 'answers': {'a': 'y'}},
+            {'task_id': self.tasks[1].id, 'answers': {'a': 'y'}},
+            {'task_id': self.tasks[2].id, 'answers': {'a': 'y'}},
+            {'task_id': self.tasks[2].id, 'answers': {'a': 'z'}},
+            {'task_id': other_task.id, 'answers': {'a': 'y'}},
+        ])
+        self.assertEqual(summary['submitted'], 1)
+        self.assertEqual(summary['skipped'], 4)
+        self.assertEqual(len(summary['errors']), 4)
+        self.assertEqual(TaskAssignment.objects.get(task=self.tasks[2]).answers, {'a': 'y'})
+        self.assertFalse(other_task.taskassignment_set.exists())
+
+    def test_update_completed_tasks(self):
+        for task in self.tasks[:2]:
+            for user in (self.user, self.other_user):
+                ta = TaskAssignment(assigned_to=user, completed=True, task=task)
+                # Bypass TaskAssignment's save(), which updates the Task completion status
+                super(TaskAssignment, ta).save()
+        TaskAssignment(assigned_to=self.user, completed=True, task=self.tasks[2]).save()
+        self.assertEqual(self.batch.update_completed_tasks([t.id for t in self.tasks]), 2)
+        self.assertEqual(self.batch.total_finished_tasks(), 2)
+
+
 class TestBatchAvailableTASKs(django.test.TestCase):
     def setUp(self):
         self.user = User.objects.create_user('testuser', password='secret')
@@ -445,6 +580,46 @@ class TestBatchAvailableTASKs(django.test.TestCase):
         self.assertEqual(len(batch_unprotected.available_tasks_for(user)), 1)
 
 
+class TestAvailabilityVersion(django.test.TestCase):
+    def setUp(self):
+        project = Project(name='foo', html_template='<p>${foo}</p>')
+        project.save()
+        self.batch = Batch(project=project)
+        self.batch.save()
+        self.task = Task(batch=self.batch, input_csv_fields={'foo': 'bar'})
+        self.task.save()
+
+    def test_bumped_by_returned_assignment(self):
+        task_assignment = TaskAssignment(task=self.task)
+        task_assignment.save()
+        version = availability_version()
+        task_assignment.delete()
+        self.assertNotEqual(availability_version(), version)
+
+    def test_bumped_by_expired_assignment(self):
+        task_assignment = TaskAssignment(
+            expires_at=timezone.now() - datetime.timedelta(hours=1), task=self.task)
+        # Bypass TaskAssignment's save(), which updates expires_at
+        super(TaskAssignment, task_assignment).save()
+        version = availability_version()
+        TaskAssignment.expire_all_abandoned()
+        self.assertNotEqual(availability_version(), version)
+
+    def test_not_bumped_by_unchanged_availability(self):
+        version = availability_version()
+        TaskAssignment.expire_all_abandoned()
+        TaskAssignment(task=self.task).save()
+        self.assertEqual(availability_version(), version)
+
+    def test_bumped_by_published_batch(self):
+        self.batch.active = False
+        self.batch.save()
+        version = availability_version()
+        self.batch.active = True
+        self.batch.save()
+        self.assertNotEqual(availability_version(), version)
+
+
 class TestBatchExpireAssignments(django.test.TestCase):
     def test_batch_expire_assignments(self):
         t = timezone.now()
@@ -868,7 +1043,606 @@ class TestGenerateForm(django.test.TestCase):
         self.assertEqual(expect, actual)
 
 
+class TestProjectAsset(django.test.TestCase):
+    def setUp(self):
+        self.project = Project(
+            name='test',
+            html_template=u'<script src="${asset:app.js}"></script><p>${foo}</p>')
+        self.project.save()
+
+    def test_content_type_and_digest(self):
+        asset = ProjectAsset(project=self.project, filename='app.js', content=b'var x = 1;')
+        asset.save()
+        self.assertTrue(asset.content_type.endswith('javascript'))
+        self.assertEqual(len(asset.digest), 40)
+        self.assertTrue(asset.digest in asset.url())
+
+    def test_asset_token_not_a_fieldname(self):
+        self.assertEqual(set(self.project.fieldnames.keys()), set([u'foo']))
+
+    def test_populate_html_template_with_asset(self):
+        asset = ProjectAsset(project=self.project, filename='app.js', content=b'var x = 1;')
+        asset.save()
+        batch = Batch(project=self.project)
+        batch.save()
+        task = Task(batch=batch, input_csv_fields={u'foo': u'bar'})
+        task.save()
+        self.assertEqual(task.populate_html_template(),
+                         u'<script src="{}"></script><p>bar</p>'.format(asset.url()))
+
+    def test_populate_html_template_with_unknown_asset(self):
+        batch = Batch(project=self.project)
+        batch.save()
+        task = Task(batch=batch, input_csv_fields={u'foo': u'bar'})
+        task.save()
+        self.assertEqual(task.populate_html_template(),
+                         u'<script src="${asset:app.js}"></script><p>bar</p>')
+
+
+class TestBatchAppendTasks(django.test.TestCase):
+    def setUp(self):
+        project = Project(name='test', html_template='<p>${a} - ${b}</p>')
+        project.save()
+        self.batch = Batch(project=project)
+        self.batch.save()
+        self.batch.create_tasks_from_csv(StringIO(b'a,b\r\n1,2\r\n'))
+
+    def test_append(self):
+        version = availability_version()
+        self.assertEqual(self.batch.append_tasks_from_csv(StringIO(b'b,a\r\n4,3\r\n6,5\r\n')), 2)
+        self.assertEqual(
+            [t.input_csv_fields for t in self.batch.task_set.order_by('id')],
+            [{u'a': u'1', u'b': u'2'}, {u'a': u'3', u'b': u'4'}, {u'a': u'5', u'b': u'6'}])
+        self.assertNotEqual(availability_version(), version)
+
+    def test_append_to_empty_batch(self):
+        self.batch.task_set.all().delete()
+        self.assertEqual(self.batch.append_tasks_from_csv(StringIO(b'a,b,c\r\n1,2,3\r\n')), 1)
+
+    def test_append_mismatched_fields(self):
+        with self.assertRaises(ValidationError) as cm:
+            self.batch.append_tasks_from_csv(StringIO(b'a,b,c\r\n1,2,3\r\n'))
+        self.assertEqual(cm.exception.messages, [
+            'The fields in the file (a, b, c) do not match the fields of the Tasks in the '
+            'Batch (a, b)'])
+        self.assertEqual(self.batch.total_tasks(), 1)
+
+    def test_append_missing_template_fields(self):
+        with self.assertRaises(ValidationError) as cm:
+            self.batch.append_tasks_from_csv(StringIO(b'a\r\n1\r\n'))
+        self.assertTrue('These missing fields are: b' in cm.exception.messages[0])
+
+    def test_append_before_ingest_completed(self):
+        ingest_job = BatchIngestJob(batch=self.batch, csv_path='/nonexistent.csv',
+                                    total_bytes=0)
+        ingest_job.save()
+        for status in (BatchIngestJob.PENDING, BatchIngestJob.RUNNING, BatchIngestJob.FAILED):
+            ingest_job.status = status
+            ingest_job.save()
+            with self.assertRaisesMessage(ValidationError, 'cannot be added to Batch'):
+                self.batch.append_tasks_from_csv(StringIO(b'a,b\r\n3,4\r\n'))
+        self.assertEqual(self.batch.total_tasks(), 1)
+
+        ingest_job.status = BatchIngestJob.COMPLETED
+        ingest_job.save()
+        self.assertEqual(self.batch.append_tasks_from_csv(StringIO(b'a,b\r\n3,4\r\n')), 1)
+
+    def test_append_variable_fields_per_row(self):
+        with self.assertRaises(ValidationError):
+            self.batch.append_tasks_from_csv(StringIO(b'a,b\r\n3,4\r\n5\r\n'))
+        self.assertEqual(self.batch.total_tasks(), 1)
+
+
+class TestBatchIngestJob(django.test.TestCase):
+    def setUp(self):
+        project = Project(name='foo', html_template='<p>${letter}: ${number}</p>')
+        project.save()
+        self.batch = Batch(active=False, project=project)
+        self.batch.save()
+
+    def create_job(self, csv_text, **kwargs):
+        (csv_fd, csv_path) = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(csv_fd, 'wb') as csv_fh:
+            csv_fh.write(csv_text)
+        ingest_job = BatchIngestJob(batch=self.batch, csv_path=csv_path,
+                                    total_bytes=len(csv_text), **kwargs)
+        ingest_job.save()
+        return ingest_job
+
+    def test_run(self):
+        ingest_job = self.create_job(b'letter,number\r\na,1\r\nb,2\r\n')
+        ingest_job.run()
+        self.assertEqual(ingest_job.status, BatchIngestJob.COMPLETED)
+        self.assertEqual(ingest_job.tasks_created, 2)
+        self.assertEqual(ingest_job.bytes_processed, ingest_job.total_bytes)
+        self.assertEqual(self.batch.total_tasks(), 2)
+        self.assertFalse(self.batch.active)
+        self.assertFalse(os.path.exists(ingest_job.csv_path))
+
+    def test_run_activate_on_completion(self):
+        ingest_job = self.create_job(b'letter,number\r\na,1\r\n', activate_on_completion=True)
+        ingest_job.run()
+        self.batch.refresh_from_db()
+        self.assertTrue(self.batch.active)
+
+    def test_run_failure_deletes_tasks(self):
+        ingest_job = self.create_job(b'letter,number\r\na,1\r\n')
+        ingest_job.csv_path += '.missing'
+        ingest_job.run()
+        self.assertEqual(ingest_job.status, BatchIngestJob.FAILED)
+        self.assertTrue(ingest_job.error)
+        self.assertEqual(self.batch.total_tasks(), 0)
+
+    @unittest.skipIf(sys.version_info < (3,), 'Truncation is only detected on Python 3')
+    def test_run_truncated_gzip_file(self):
+        gzip_fh = StringIO()
+        with gzip.GzipFile(fileobj=gzip_fh, mode='wb') as fh:
+            fh.write(b'letter,number\r\na,1\r\nb,2\r\n')
+        ingest_job = self.create_job(gzip_fh.getvalue()[:-4])
+        ingest_job.run()
+        self.assertEqual(ingest_job.status, BatchIngestJob.FAILED)
+        self.assertEqual(ingest_job.error, 'The compressed file is truncated')
+        self.assertEqual(self.batch.total_tasks(), 0)
+
+    def test_run_deletes_tasks_from_interrupted_run(self):
+        Task(batch=self.batch, input_csv_fields={'letter': 'a', 'number': '1'}).save()
+        ingest_job = self.create_job(b'letter,number\r\na,1\r\n')
+        ingest_job.run()
+        self.assertEqual(self.batch.total_tasks(), 1)
+
+    def test_claim_next(self):
+        ingest_job = self.create_job(b'letter,number\r\na,1\r\n')
+        claimed_job = BatchIngestJob.claim_next()
+        self.assertEqual(claimed_job.id, ingest_job.id)
+        self.assertEqual(claimed_job.status, BatchIngestJob.RUNNING)
+        self.assertIsNone(BatchIngestJob.claim_next())
+
+        # Running jobs that stopped reporting progress are claimed again
+        BatchIngestJob.objects.filter(id=ingest_job.id).update(
+            updated_at=timezone.now() - datetime.timedelta(hours=1))
+        self.assertEqual(BatchIngestJob.claim_next().id, ingest_job.id)
+        ingest_job.remove_csv_file()
+
+
+class TestBatchClone(django.test.TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('testuser', password='secret')
+        project = Project(name='test', html_template='<p>${a} - ${b}</p>', login_required=True)
+        project.save()
+        self.batch = Batch(project=project, name='original', filename='original.csv',
+                           assignments_per_task=2, allotted_assignment_time=5)
+        self.batch.save()
+        self.batch.create_tasks_from_csv(StringIO(b'a,b\r\n1,2\r\n3,4\r\n'))
+        task = self.batch.task_set.first()
+        TaskAssignment(assigned_to=self.user, completed=True, task=task).save()
+        task.completed = True
+        task.save()
+
+    def test_clone(self):
+        clone = self.batch.clone(created_by=self.user)
+        self.assertEqual(clone.name, 'original (copy)')
+        self.assertFalse(clone.active)
+        self.assertEqual(clone.assignments_per_task, 2)
+        self.assertEqual(clone.allotted_assignment_time, 5)
+        self.assertEqual(clone.created_by, self.user)
+        self.assertEqual(clone.filename, 'original.csv')
+        self.assertEqual(clone.project_id, self.batch.project_id)
+        self.assertEqual(
+            [t.input_csv_fields for t in clone.task_set.order_by('id')],
+            [{u'a': u'1', u'b': u'2'}, {u'a': u'3', u'b': u'4'}])
+        self.assertEqual(clone.total_finished_tasks(), 0)
+        self.assertEqual(clone.total_finished_task_assignments(), 0)
+        self.assertEqual(self.batch.total_tasks(), 2)
+
+    def test_clone_with_new_settings(self):
+        clone = self.batch.clone(name='again', assignments_per_task=3)
+        self.assertEqual(clone.name, 'again')
+        self.assertEqual(clone.assignments_per_task, 3)
+        self.assertEqual(clone.total_tasks(), 2)
+
+    def test_clone_invalid_settings(self):
+        self.batch.project.login_required = False
+        self.batch.project.save()
+        with self.assertRaises(ValidationError):
+            self.batch.clone(assignments_per_task=2)
+        self.assertEqual(Batch.objects.count(), 1)
+
+
+class TestBatchTopUpAssignments(django.test.TestCase):
+    def setUp(self):
+        project = Project(name='test', html_template='<p>${a}</p>', login_required=True)
+        project.save()
+        self.batch = Batch(project=project, assignments_per_task=1)
+        self.batch.save()
+        self.batch.create_tasks_from_csv(StringIO(b'a\r\n1\r\n2\r\n3\r\n'))
+        (self.task_1, self.task_2, self.task_3) = self.batch.task_set.order_by('id')
+        for (username, tasks) in (('user1', [self.task_1, self.task_2]), ('user2', [self.task_1])):
+            user = User.objects.create_user(username, password='secret')
+            for task in tasks:
+                TaskAssignment(assigned_to=user, completed=True, task=task).save()
+        self.batch.update_completed_tasks([self.task_1.id, self.task_2.id])
+
+    def test_top_up(self):
+        version = availability_version()
+        self.assertEqual(self.batch.top_up_assignments(2), 1)
+        self.assertEqual(Batch.objects.get(id=self.batch.id).assignments_per_task, 2)
+        self.assertEqual(self.batch.assignments_per_task, 2)
+        # Task 1 already has two completed Task Assignments
+        self.assertEqual(list(self.batch.finished_tasks()), [self.task_1])
+        self.assertEqual(list(self.batch.unfinished_tasks().order_by('id')),
+                         [self.task_2, self.task_3])
+        self.assertNotEqual(availability_version(), version)
+
+    def test_top_up_reopens_all(self):
+        self.assertEqual(self.batch.top_up_assignments(3), 2)
+        self.assertEqual(self.batch.total_finished_tasks(), 0)
+
+    def test_top_up_cannot_reduce(self):
+        self.batch.top_up_assignments(2)
+        with self.assertRaises(ValidationError) as cm:
+            self.batch.top_up_assignments(1)
+        self.assertEqual(cm.exception.messages, [
+            'The number of Assignments per Task cannot be reduced from 2 to 1'])
+        self.assertEqual(Batch.objects.get(id=self.batch.id).assignments_per_task, 2)
+
+    def test_top_up_login_not_required(self):
+        self.batch.project.login_required = False
+        self.batch.project.save()
+        with self.assertRaises(ValidationError):
+            self.batch.top_up_assignments(2)
+        self.assertEqual(Batch.objects.get(id=self.batch.id).assignments_per_task, 1)
+        self.assertEqual(self.batch.total_finished_tasks(), 2)
+
+
+class TestBatchDuplicateTasks(django.test.TestCase):
+    def setUp(self):
+        self.project = Project(name='test', html_template='<p>${a} - ${b}</p>')
+        self.project.save()
+        self.user = User.objects.create_user('testuser', password='secret')
+
+    def create_batch(self, duplicate_tasks, csv_text):
+        batch = Batch(project=self.project, duplicate_tasks=duplicate_tasks)
+        batch.save()
+        batch.create_tasks_from_csv(StringIO(csv_text))
+        return batch
+
+    def test_input_hash(self):
+        self.assertEqual(hash_input_csv_fields({'a': '1', 'b': '2'}),
+                         hash_input_csv_fields({'b': '2', 'a': '1'}))
+        self.assertNotEqual(hash_input_csv_fields({'a': '1', 'b': '2'}),
+                            hash_input_csv_fields({'a': '2', 'b': '1'}))
+        batch = self.create_batch(Batch.KEEP_DUPLICATES, b'a,b\r\n1,2\r\n')
+        self.assertEqual(batch.task_set.get().input_hash,
+                         hash_input_csv_fields({'a': '1', 'b': '2'}))
+
+    def test_input_hash_on_save(self):
+        batch = Batch(project=self.project)
+        batch.save()
+        task = Task(batch=batch, input_csv_fields={'a': '1', 'b': '2'})
+        task.save()
+        self.assertEqual(task.input_hash, hash_input_csv_fields({'a': '1', 'b': '2'}))
+
+    def test_keep_duplicates(self):
+        batch = self.create_batch(Batch.KEEP_DUPLICATES, b'a,b\r\n1,2\r\n1,2\r\n')
+        self.assertEqual(batch.total_tasks(), 2)
+        self.assertEqual(batch.duplicate_rows, 0)
+
+    def test_skip_batch_duplicates(self):
+        self.create_batch(Batch.KEEP_DUPLICATES, b'a,b\r\n5,6\r\n')
+        batch = self.create_batch(Batch.SKIP_BATCH_DUPLICATES,
+                                  b'a,b\r\n1,2\r\n3,4\r\n1,2\r\n5,6\r\n')
+        self.assertEqual(
+            [t.input_csv_fields for t in batch.task_set.order_by('id')],
+            [{'a': '1', 'b': '2'}, {'a': '3', 'b': '4'}, {'a': '5', 'b': '6'}])
+        self.assertEqual(batch.duplicate_rows, 1)
+        self.assertEqual(Batch.objects.get(id=batch.id).duplicate_rows, 1)
+
+        # Rows of appended files are also checked against the existing Tasks
+        batch.append_tasks_from_csv(StringIO(b'a,b\r\n3,4\r\n7,8\r\n'))
+        self.assertEqual(batch.total_tasks(), 4)
+        self.assertEqual(Batch.objects.get(id=batch.id).duplicate_rows, 2)
+
+    def test_skip_duplicates_across_chunks(self):
+        csv_text = b'a,b\r\n' + b'1,2\r\n' * (BULK_CHUNK_SIZE + 1)
+        batch = self.create_batch(Batch.SKIP_BATCH_DUPLICATES, csv_text)
+        self.assertEqual(batch.total_tasks(), 1)
+        self.assertEqual(batch.duplicate_rows, BULK_CHUNK_SIZE)
+
+    def test_skip_project_duplicates(self):
+        self.create_batch(Batch.KEEP_DUPLICATES, b'a,b\r\n1,2\r\n')
+        batch = self.create_batch(Batch.SKIP_PROJECT_DUPLICATES, b'a,b\r\n1,2\r\n3,4\r\n')
+        self.assertEqual([t.input_csv_fields for t in batch.task_set.all()],
+                         [{'a': '3', 'b': '4'}])
+        self.assertEqual(batch.duplicate_rows, 1)
+
+    def test_link_project_duplicates(self):
+        original_batch = self.create_batch(Batch.KEEP_DUPLICATES, b'a,b\r\n1,2\r\n')
+        original_task = original_batch.task_set.get()
+        TaskAssignment(answers={'c': 'yes'}, assigned_to=self.user, completed=True,
+                       task=original_task).save()
+
+        batch = self.create_batch(Batch.LINK_PROJECT_DUPLICATES, b'a,b\r\n1,2\r\n3,4\r\n')
+        (duplicate_task, task) = batch.task_set.order_by('id')
+        self.assertTrue(duplicate_task.duplicate)
+        self.assertTrue(duplicate_task.completed)
+        self.assertFalse(task.duplicate)
+        self.assertEqual(list(batch.available_tasks_for(self.user)), [task])
+        self.assertEqual(batch.duplicate_rows, 1)
+
+        # Duplicate Tasks share the results of the Task they duplicate
+        csv_output = StringIO()
+        batch.to_csv(csv_output)
+        rows = csv_output.getvalue().decode('utf-8').splitlines()
+        self.assertEqual(len(rows), 2)
+        self.assertTrue('"Answer.c"' in rows[0])
+        self.assertTrue('"{}"'.format(duplicate_task.id) in rows[1])
+        self.assertTrue('"yes"' in rows[1])
+
+    def test_link_batch_duplicates(self):
+        batch = self.create_batch(Batch.LINK_BATCH_DUPLICATES, b'a,b\r\n1,2\r\n1,2\r\n')
+        (task, duplicate_task) = batch.task_set.order_by('id')
+        self.assertFalse(task.duplicate)
+        self.assertTrue(duplicate_task.duplicate)
+
+        # Duplicate Tasks are not reopened or copied as uncompleted Tasks
+        self.assertEqual(batch.top_up_assignments(2), 0)
+        clone = batch.clone()
+        self.assertEqual([(t.completed, t.duplicate) for t in clone.task_set.order_by('id')],
+                         [(False, False), (True, True)])
+        self.assertEqual(clone.task_set.last().input_hash, duplicate_task.input_hash)
+
+
+class TestCachedAnswer(django.test.TestCase):
+    def setUp(self):
+        self.project = Project(name='test', html_template='<p>${a}</p>', reuse_answers=True)
+        self.project.save()
+        self.users = [User.objects.create_user('user%d' % i, password='secret')
+                      for i in range(3)]
+        batch = Batch(project=self.project, assignments_per_task=2)
+        batch.save()
+        batch.create_tasks_from_csv(StringIO(b'a\r\n1\r\n'))
+        self.task = batch.task_set.get()
+        for user in self.users[:2]:
+            TaskAssignment(answers={'b': user.username}, assigned_to=user, completed=True,
+                           task=self.task).save()
+
+    def create_batch(self, assignments_per_task, csv_text):
+        batch = Batch(project=self.project, assignments_per_task=assignments_per_task)
+        batch.save()
+        batch.create_tasks_from_csv(StringIO(csv_text))
+        return batch
+
+    def test_add_on_submit(self):
+        self.assertEqual(
+            sorted((c.assigned_to.username, c.answers['b'], c.input_hash)
+                   for c in CachedAnswer.objects.all()),
+            [('user0', 'user0', self.task.input_hash), ('user1', 'user1', self.task.input_hash)])
+
+    def test_resubmit_replaces_answers(self):
+        task_assignment = self.task.taskassignment_set.get(assigned_to=self.users[0])
+        task_assignment.answers = {'b': 'changed'}
+        task_assignment.save()
+        self.assertEqual(CachedAnswer.objects.get(assigned_to=self.users[0]).answers,
+                         {'b': 'changed'})
+        self.assertEqual(CachedAnswer.objects.count(), 2)
+
+    def test_not_cached_without_reuse_answers(self):
+        project = Project(name='other', html_template='<p>${a}</p>')
+        project.save()
+        batch = Batch(project=project)
+        batch.save()
+        task = Task(batch=batch, input_csv_fields={'a': '1'})
+        task.save()
+        TaskAssignment(assigned_to=self.users[2], completed=True, task=task).save()
+        self.assertEqual(CachedAnswer.objects.filter(assigned_to=self.users[2]).count(), 0)
+
+    def test_bulk_submit_answers(self):
+        batch = self.create_batch(1, b'a\r\n2\r\n')
+        task = batch.task_set.get()
+        batch.bulk_submit_answers(self.users[2], [{'task_id': task.id, 'answers': {'b': 'x'}}])
+        self.assertEqual(CachedAnswer.objects.get(assigned_to=self.users[2]).input_hash,
+                         task.input_hash)
+
+    def test_add_task_assignments_constant_queries(self):
+        batch = self.create_batch(1, b'a\r\n' + b''.join(b'%d\r\n' % i for i in range(10)))
+        task_assignments = [TaskAssignment(answers={'b': 'x'}, assigned_to=self.users[2],
+                                           completed=True, task=task)
+                            for task in batch.task_set.all()]
+        # Look up the Tasks, replace the Worker's answers, insert the new answers
+        with self.assertNumQueries(3):
+            CachedAnswer.add_task_assignments(task_assignments)
+        with self.assertNumQueries(3):
+            CachedAnswer.add_task_assignments(task_assignments + task_assignments[:1])
+        self.assertEqual(CachedAnswer.objects.filter(assigned_to=self.users[2]).count(), 10)
+
+    def test_save_without_reuse_answers_skips_cache(self):
+        self.project.reuse_answers = False
+        self.project.save()
+        task = Task.objects.select_related('batch__project').get(id=self.task.id)
+        task_assignment = TaskAssignment(assigned_to=self.users[2], task=task)
+        task_assignment.save()
+        task_assignment.completed = True
+        # Update the Task Assignment, count the completed Task Assignments, update the Task
+        with self.assertNumQueries(3):
+            task_assignment.save()
+
+    def test_reuse_completes_tasks(self):
+        batch = self.create_batch(2, b'a\r\n1\r\n2\r\n')
+        (reused_task, new_task) = batch.task_set.order_by('id')
+        self.assertTrue(reused_task.completed)
+        self.assertEqual(
+            sorted(ta.answers['b'] for ta in reused_task.taskassignment_set.all()),
+            ['user0', 'user1'])
+        self.assertFalse(new_task.completed)
+        self.assertEqual(new_task.taskassignment_set.count(), 0)
+
+    def test_reuse_with_fewer_assignments(self):
+        batch = self.create_batch(3, b'a\r\n1\r\n')
+        task = batch.task_set.get()
+        self.assertFalse(task.completed)
+        self.assertEqual(task.taskassignment_set.filter(completed=True).count(), 2)
+        # Only one more Worker, who has not already answered, is needed
+        self.assertEqual(list(batch.available_tasks_for(self.users[0])), [])
+        self.assertEqual(list(batch.available_tasks_for(self.users[2])), [task])
+
+    def test_reuse_at_most_assignments_per_task(self):
+        batch = self.create_batch(1, b'a\r\n1\r\n')
+        task = batch.task_set.get()
+        self.assertTrue(task.completed)
+        self.assertEqual(task.taskassignment_set.get().answers, {'b': 'user1'})
+
+
+class TestColumnarTaskInputs(django.test.TestCase):
+    def setUp(self):
+        self.project = Project(name='test', html_template='<p>${a} - ${b}</p>')
+        self.project.save()
+        self.batch = Batch(project=self.project)
+        self.batch.save()
+
+    def stored_inputs(self):
+        return [json.loads(v) for v in self.batch.task_set.order_by('id').
+                values_list('input_csv_fields', flat=True)]
+
+    def test_create_tasks(self):
+        self.batch.create_tasks_from_csv(StringIO(b'b,a\r\n2,1\r\n4,3\r\n'))
+        self.assertEqual(Batch.objects.get(id=self.batch.id).input_csv_header, ['b', 'a'])
+        self.assertEqual(self.stored_inputs(), [['2', '1'], ['4', '3']])
+
+        task = Task.objects.order_by('id').first()
+        self.assertEqual(task.input_csv_fields, {'a': '1', 'b': '2'})
+        self.assertEqual(task.populate_html_template(), '<p>1 - 2</p>')
+        self.assertEqual(task.input_hash, hash_input_csv_fields({'a': '1', 'b': '2'}))
+
+        # Saving a Task keeps its input stored as a list
+        task.completed = True
+        task.save()
+        self.assertEqual(self.stored_inputs()[0], ['2', '1'])
+
+    def test_deferred_input(self):
+        self.batch.create_tasks_from_csv(StringIO(b'a,b\r\n1,2\r\n'))
+        task = Task.objects.defer('input_csv_fields').get()
+        self.assertEqual(task.input_csv_fields, {'a': '1', 'b': '2'})
+
+    def test_append_tasks_in_header_order(self):
+        self.batch.create_tasks_from_csv(StringIO(b'a,b\r\n1,2\r\n'))
+        self.batch.append_tasks_from_csv(StringIO(b'b,a\r\n4,3\r\n'))
+        self.assertEqual(self.stored_inputs(), [['1', '2'], ['3', '4']])
+
+    def test_set_input_as_dict(self):
+        self.batch.create_tasks_from_csv(StringIO(b'a,b\r\n1,2\r\n'))
+        task = Task.objects.get()
+        task.input_csv_fields = {'a': '5', 'b': '6'}
+        task.save()
+        self.assertEqual(self.stored_inputs(), [{'a': '5', 'b': '6'}])
+        self.assertEqual(Task.objects.get().input_csv_fields, {'a': '5', 'b': '6'})
+
+    def test_results_csv(self):
+        self.batch.create_tasks_from_csv(StringIO(b'a,b\r\n1,2\r\n'))
+        user = User.objects.create_user('testuser', password='secret')
+        TaskAssignment(answers={'c': '3'}, assigned_to=user, completed=True,
+                       task=self.batch.task_set.get()).save()
+        csv_output = StringIO()
+        self.batch.to_csv(csv_output)
+        rows = csv_output.getvalue().decode('utf-8').splitlines()
+        self.assertTrue(rows[0].endswith('"Input.a","Input.b","Answer.c"'))
+        self.assertTrue(rows[1].endswith('"1","2","3"'))
+
+    def test_dict_inputs(self):
+        with self.settings(TURKLE_COLUMNAR_TASK_INPUTS=False):
+            self.batch.create_tasks_from_csv(StringIO(b'a,b\r\n1,2\r\n'))
+        self.assertEqual(self.stored_inputs(), [{'a': '1', 'b': '2'}])
+        self.assertEqual(self.batch.task_set.get().input_csv_fields, {'a': '1', 'b': '2'})
+
+        # Tasks appended to a Batch with dict inputs also store dicts
+        self.batch.append_tasks_from_csv(StringIO(b'a,b\r\n3,4\r\n'))
+        self.assertEqual(self.stored_inputs()[1], {'a': '3', 'b': '4'})
+
+
+class TestCompressedJSONField(django.test.TestCase):
+    def setUp(self):
+        self.project = Project(name='test', html_template='<p>${a}</p>')
+        self.project.save()
+        self.batch = Batch(project=self.project)
+        self.batch.save()
+        self.document = u' '.join([u'word%d' % (i % 50) for i in range(5000)])
+
+    def stored_answers(self):
+        return TaskAssignment.objects.values_list('answers', flat=True).get()
+
+    def test_encode_json(self):
+        with self.settings(TURKLE_COMPRESSION_THRESHOLD=100):
+            self.assertEqual(encode_json({'a': 'short'}), '{"a":"short"}')
+            encoded = encode_json({'a': self.document})
+            self.assertTrue(encoded.startswith('zlib:'))
+            self.assertLess(len(encoded), len(self.document) / 10)
+            self.assertEqual(decode_json(encoded), {'a': self.document})
+            # Values that do not compress well are stored uncompressed
+            incompressible = base64.b64encode(os.urandom(600)).decode('ascii')
+            self.assertEqual(encode_json([incompressible]), json.dumps([incompressible]))
+        with self.settings(TURKLE_COMPRESSION_THRESHOLD=None):
+            self.assertFalse(encode_json({'a': self.document}).startswith('zlib:'))
+
+    def test_task_input(self):
+        csv_data = u'a\r\n"{}"\r\nsmall\r\n'.format(self.document).encode('utf-8')
+        self.batch.create_tasks_from_csv(StringIO(csv_data))
+        stored = Task.objects.order_by('id').values_list('input_csv_fields', flat=True)
+        self.assertTrue(stored[0].startswith('zlib:'))
+        self.assertEqual(stored[1], '["small"]')
+
+        task = Task.objects.order_by('id').first()
+        self.assertEqual(task.input_csv_fields, {'a': self.document})
+        self.assertEqual(task.input_hash, hash_input_csv_fields({'a': self.document}))
+
+    def test_answers(self):
+        task = Task(batch=self.batch, input_csv_fields={'a': '1'})
+        task.save()
+        TaskAssignment(answers={'b': self.document}, completed=True, task=task).save()
+        self.assertTrue(self.stored_answers().startswith('zlib:'))
+        self.assertEqual(TaskAssignment.objects.get().answers, {'b': self.document})
+
+    def test_empty_answers(self):
+        task = Task(batch=self.batch, input_csv_fields={'a': '1'})
+        task.save()
+        TaskAssignment(task=task).save()
+        self.assertEqual(TaskAssignment.objects.get().answers, u'')
+
+    def test_unaccessed_value_is_saved_unchanged(self):
+        Task(batch=self.batch, input_csv_fields={'a': self.document}).save()
+        stored = Task.objects.values_list('input_csv_fields', flat=True).get()
+
+        task = Task.objects.get()
+        task.completed = True
+        with self.settings(TURKLE_COMPRESSION_THRESHOLD=None):
+            task.save()
+        self.assertEqual(Task.objects.values_list('input_csv_fields', flat=True).get(), stored)
+
+        # Values that were accessed are encoded again
+        task.input_csv_fields = {'a': task.input_csv_fields['a'] + '!'}
+        with self.settings(TURKLE_COMPRESSION_THRESHOLD=None):
+            task.save()
+        self.assertEqual(json.loads(Task.objects.values_list('input_csv_fields', flat=True).get()),
+                         {'a': self.document + '!'})
+
+    def test_deferred_value(self):
+        task = Task(batch=self.batch, input_csv_fields={'a': '1'})
+        task.save()
+        TaskAssignment(answers={'b': self.document}, task=task).save()
+        task_assignment = TaskAssignment.objects.defer('answers').get()
+        self.assertEqual(task_assignment.answers, {'b': self.document})
+
+
 __all__ = (
     'TestGenerateForm',
+    'TestAvailabilityVersion',
+    'TestBatchAppendTasks',
+    'TestBatchBulkSubmitAnswers',
+    'TestBatchClone',
+    'TestBatchDuplicateTasks',
+    'TestBatchIngestJob',
+    'TestBatchTopUpAssignments',
+    'TestCachedAnswer',
+    'TestColumnarTaskInputs',
+    'TestCompressedJSONField',
     'TestModels',
+    'TestProjectAsset',
 )
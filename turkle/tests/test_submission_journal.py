@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+import io
+import json
+import os
+import shutil
+import tempfile
+
+import django.test
+from django.contrib.auth.models import User
+from django.urls import reverse
+from django.utils.dateparse import parse_datetime
+
+from turkle.models import Batch, CachedAnswer, Project, Task, TaskAssignment
+from turkle.submission_journal import SubmissionJournal, get_submission_journal
+
+
+class SubmissionJournalTestCase(django.test.TestCase):
+    def setUp(self):
+        self.journal_dir = tempfile.mkdtemp()
+        self.journal_path = os.path.join(self.journal_dir, 'submissions.journal')
+        self.journal = SubmissionJournal(self.journal_path)
+
+        self.user = User.objects.create_user('testuser', password='secret')
+        project = Project(name='foo', html_template='<p>${foo}</p><textarea>')
+        project.save()
+        self.batch = Batch(assignments_per_task=1, project=project)
+        self.batch.save()
+        self.task = Task(batch=self.batch, input_csv_fields={'foo': 'bar'})
+        self.task.save()
+        self.task_assignment = TaskAssignment(assigned_to=self.user, task=self.task)
+        self.task_assignment.save()
+
+    def tearDown(self):
+        shutil.rmtree(self.journal_dir)
+
+
+class TestSubmissionJournal(SubmissionJournalTestCase):
+    def test_append(self):
+        self.journal.append(self.task_assignment, {'answer': 'yes'})
+        with io.open(self.journal_path, 'rb') as fh:
+            records = [json.loads(line.decode('utf-8')) for line in fh]
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0]['task_assignment_id'], self.task_assignment.id)
+        self.assertEqual(records[0]['answers'], {'answer': 'yes'})
+
+        self.task_assignment.refresh_from_db()
+        self.assertFalse(self.task_assignment.completed)
+
+    def test_flush(self):
+        self.journal.append(self.task_assignment, {'answer': 'yes'})
+        self.assertEqual(self.journal.flush(), 1)
+        self.assertFalse(os.path.exists(self.journal_path))
+        self.assertFalse(os.path.exists(self.journal.pending_path))
+
+        self.task_assignment.refresh_from_db()
+        self.assertTrue(self.task_assignment.completed)
+        self.assertEqual(self.task_assignment.answers, {'answer': 'yes'})
+        self.task.refresh_from_db()
+        self.assertTrue(self.task.completed)
+
+    def test_flush_caches_answers(self):
+        self.batch.project.reuse_answers = True
+        self.batch.project.save()
+        self.journal.append(self.task_assignment, {'answer': 'yes'})
+        self.journal.flush()
+        cached_answer = CachedAnswer.objects.get()
+        self.assertEqual(cached_answer.answers, {'answer': 'yes'})
+        self.assertEqual(cached_answer.assigned_to, self.user)
+        self.assertEqual(cached_answer.input_hash, self.task.input_hash)
+
+    def test_flush_empty_journal(self):
+        self.assertEqual(self.journal.flush(), 0)
+
+    def test_flush_last_submission_wins(self):
+        self.journal.append(self.task_assignment, {'answer': 'yes'})
+        self.journal.append(self.task_assignment, {'answer': 'no'})
+        self.journal.flush()
+        self.task_assignment.refresh_from_db()
+        self.assertEqual(self.task_assignment.answers, {'answer': 'no'})
+
+    def test_flush_recreates_expired_task_assignment(self):
+        task_assignment_id = self.task_assignment.id
+        self.journal.append(self.task_assignment, {'answer': 'yes'})
+        self.task_assignment.delete()
+
+        self.journal.flush()
+        task_assignment = TaskAssignment.objects.get(id=task_assignment_id)
+        self.assertTrue(task_assignment.completed)
+        self.assertEqual(task_assignment.assigned_to, self.user)
+        self.assertEqual(task_assignment.answers, {'answer': 'yes'})
+
+    def test_flush_keeps_recorded_timestamps(self):
+        task_assignment_id = self.task_assignment.id
+        created_at = self.task_assignment.created_at
+        self.journal.append(self.task_assignment, {'answer': 'yes'})
+        with io.open(self.journal_path, 'rb') as fh:
+            submitted_at = parse_datetime(json.loads(fh.read().decode('utf-8'))['submitted_at'])
+        self.task_assignment.delete()
+
+        self.journal.flush()
+        task_assignment = TaskAssignment.objects.get(id=task_assignment_id)
+        self.assertEqual(task_assignment.created_at, created_at)
+        self.assertEqual(task_assignment.updated_at, submitted_at)
+
+    def test_flush_skips_deleted_task(self):
+        self.journal.append(self.task_assignment, {'answer': 'yes'})
+        self.task.delete()
+        self.assertEqual(self.journal.flush(), 1)
+        self.assertEqual(TaskAssignment.objects.count(), 0)
+
+    def test_replay_after_crash(self):
+        # Simulate a crash after the journal was rotated and applied, but before
+        # the pending journal was removed, with a new submission journaled since
+        self.journal.append(self.task_assignment, {'answer': 'yes'})
+        os.rename(self.journal_path, self.journal.pending_path)
+        task = Task(batch=self.batch, input_csv_fields={'foo': 'baz'})
+        task.save()
+        other_task_assignment = TaskAssignment(assigned_to=self.user, task=task)
+        other_task_assignment.save()
+        self.journal.append(other_task_assignment, {'answer': 'no'})
+
+        self.assertEqual(self.journal.flush(), 1)
+        self.task_assignment.refresh_from_db()
+        self.assertTrue(self.task_assignment.completed)
+        self.assertTrue(os.path.exists(self.journal_path))
+
+        # Replaying is idempotent
+        self.assertEqual(self.journal.flush(), 1)
+        self.assertEqual(TaskAssignment.objects.filter(completed=True).count(), 2)
+
+
+class TestSubmissionJournalViews(SubmissionJournalTestCase):
+    def test_get_submission_journal_disabled(self):
+        self.assertIsNone(get_submission_journal())
+
+    def test_submit_task_assignment(self):
+        with django.test.override_settings(TURKLE_SUBMISSION_JOURNAL=self.journal_path,
+                                           TURKLE_SUBMISSION_JOURNAL_FLUSH_INTERVAL=0):
+            client = django.test.Client()
+            client.login(username='testuser', password='secret')
+            response = client.post(reverse('task_assignment',
+                                           kwargs={'task_id': self.task.id,
+                                                   'task_assignment_id': self.task_assignment.id}),
+                                   {u'foo': u'bar'})
+            self.assertEqual(response.status_code, 302)
+            self.assertEqual(response['Location'], reverse('index'))
+
+            self.task_assignment.refresh_from_db()
+            self.assertFalse(self.task_assignment.completed)
+
+            get_submission_journal().flush()
+            self.task_assignment.refresh_from_db()
+            self.assertTrue(self.task_assignment.completed)
+            self.assertEqual(self.task_assignment.answers['foo'], 'bar')
+
+    def test_submit_strips_csrf_token(self):
+        with django.test.override_settings(TURKLE_SUBMISSION_JOURNAL=self.journal_path,
+                                           TURKLE_SUBMISSION_JOURNAL_FLUSH_INTERVAL=0):
+            client = django.test.Client()
+            client.login(username='testuser', password='secret')
+            client.post(reverse('task_assignment',
+                                kwargs={'task_id': self.task.id,
+                                        'task_assignment_id': self.task_assignment.id}),
+                        {u'foo': u'bar', u'csrfmiddlewaretoken': u'secret'})
+            with io.open(self.journal_path, 'rb') as fh:
+                self.assertFalse(b'csrfmiddlewaretoken' in fh.read())
+
+            get_submission_journal().flush()
+            self.task_assignment.refresh_from_db()
+            self.assertEqual(self.task_assignment.answers, {'foo': 'bar'})
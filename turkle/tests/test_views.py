@@ -8,11 +8,16 @@ except NameError:
 import django.test
 from django.contrib.auth.models import Group, User
 from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from guardian.shortcuts import assign_perm
 
-from turkle.models import Task, TaskAssignment, Batch, Project
+from turkle import metrics
+import turkle.views
+from turkle.models import Task, TaskAssignment, Batch, Project, ProjectAsset
 
 
 class TestAcceptTask(TestCase):
@@ -114,6 +119,47 @@ class TestAcceptNextTask(TestCase):
         # full task_assignment URL
         self.assertTrue('{}/assignment/'.format(self.task.id) in response['Location'])
 
+    @django.test.override_settings(TURKLE_WAIT_POLL_INTERVAL=0.01)
+    def test_accept_next_task_wait_timeout(self):
+        User.objects.create_user('testuser', password='secret')
+        self.task.completed = True
+        self.task.save()
+
+        client = django.test.Client()
+        client.login(username='testuser', password='secret')
+        response = client.get(reverse('accept_next_task',
+                                      kwargs={'batch_id': self.batch.id}) + '?wait=0.05')
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response['Location'], reverse('index'))
+        messages = list(get_messages(response.wsgi_request))
+        self.assertEqual(len(messages), 1)
+        self.assertEqual(str(messages[0]),
+                         u'No more Tasks available from Batch {}'.format(self.batch.id))
+
+    def test_accept_next_task_wait_for_returned_task(self):
+        user = User.objects.create_user('testuser', password='secret')
+        other_user = User.objects.create_user('otheruser', password='secret')
+        other_assignment = TaskAssignment(assigned_to=other_user, task=self.task)
+        other_assignment.save()
+
+        # Simulate the other user returning the Task while the request is waiting
+        def return_task_while_waiting(version, timeout):
+            other_assignment.delete()
+            return True
+
+        original_wait = turkle.views.wait_for_availability_change
+        turkle.views.wait_for_availability_change = return_task_while_waiting
+        try:
+            client = django.test.Client()
+            client.login(username='testuser', password='secret')
+            response = client.get(reverse('accept_next_task',
+                                          kwargs={'batch_id': self.batch.id}) + '?wait=10')
+        finally:
+            turkle.views.wait_for_availability_change = original_wait
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue('{}/assignment/'.format(self.task.id) in response['Location'])
+        self.assertEqual(self.task.taskassignment_set.get().assigned_to, user)
+
     def test_accept_next_task__bad_batch_id(self):
         User.objects.create_user('testuser', password='secret')
         self.assertEqual(self.task.taskassignment_set.count(), 0)
@@ -621,6 +667,62 @@ class TestPreview(TestCase):
         self.assertTrue(u'No more Tasks are available for Batch' in str(messages[0]))
 
 
+class TestProjectAsset(TestCase):
+    def setUp(self):
+        self.project = Project(login_required=False, name='foo',
+                               html_template='<link href="${asset:style.css}"><p>${foo}</p>')
+        self.project.save()
+        self.asset = ProjectAsset(project=self.project, filename='style.css',
+                                  content=b'p { color: red; }')
+        self.asset.save()
+
+    def test_get_asset(self):
+        client = django.test.Client()
+        response = client.get(self.asset.url())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'p { color: red; }')
+        self.assertEqual(response['Content-Type'], 'text/css')
+        self.assertTrue('max-age=31536000' in response['Cache-Control'])
+        self.assertEqual(response['ETag'], '"{}"'.format(self.asset.digest))
+
+    def test_get_asset_if_none_match(self):
+        client = django.test.Client()
+        response = client.get(self.asset.url(),
+                              HTTP_IF_NONE_MATCH='"{}"'.format(self.asset.digest))
+        self.assertEqual(response.status_code, 304)
+
+    def test_get_asset_stale_digest(self):
+        client = django.test.Client()
+        old_url = self.asset.url()
+        self.asset.content = b'p { color: blue; }'
+        self.asset.save()
+        response = client.get(old_url)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response['Location'], self.asset.url())
+
+    def test_get_asset_no_permission(self):
+        self.project.login_required = True
+        self.project.save()
+        client = django.test.Client()
+        response = client.get(self.asset.url())
+        self.assertEqual(response.status_code, 404)
+
+    def test_task_assignment_iframe_references_asset(self):
+        batch = Batch(project=self.project)
+        batch.save()
+        task = Task(batch=batch, input_csv_fields={'foo': 'bar'})
+        task.save()
+        task_assignment = TaskAssignment(assigned_to=None, completed=False, task=task)
+        task_assignment.save()
+        client = django.test.Client()
+        response = client.get(reverse('task_assignment_iframe',
+                                      kwargs={'task_id': task.id,
+                                              'task_assignment_id': task_assignment.id}))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(self.asset.url().encode('utf-8') in response.content)
+        self.assertFalse(b'color: red' in response.content)
+
+
 class TestReturnTaskAssignment(TestCase):
     def setUp(self):
         project = Project(name='foo', html_template='<p>${foo}: ${bar}</p>')
@@ -875,3 +977,124 @@ class TestSkipTask(TestCase):
                                       kwargs={'batch_id': self.batch.id}))
         self.assertEqual(response.status_code, 302)
         self.assertTrue('{}/assignment/'.format(self.task_two.id) in response['Location'])
+
+
+class TestThrottling(TestCase):
+    def setUp(self):
+        cache.clear()
+        project = Project(login_required=False, name='foo', html_template='<p>${foo}</p>')
+        project.save()
+        self.batch = Batch(project=project, name='foo', filename='foo.csv')
+        self.batch.save()
+
+    @django.test.override_settings(TURKLE_THROTTLE_RATES={'ip': (2, 0.001)})
+    def test_throttle_ip(self):
+        client = django.test.Client()
+        self.assertEqual(client.get(reverse('index')).status_code, 200)
+        self.assertEqual(client.get(reverse('index')).status_code, 200)
+        response = client.get(reverse('index'))
+        self.assertEqual(response.status_code, 429)
+        self.assertTrue(int(response['Retry-After']) > 0)
+        self.assertTrue(b'You are sending requests too quickly' in response.content)
+        self.assertEqual(metrics.get_counters(), {'throttled.ip.index': 1})
+
+    @django.test.override_settings(TURKLE_THROTTLE_RATES={'user': (1, 0.001)})
+    def test_throttle_user(self):
+        User.objects.create_user('testuser', password='secret')
+        User.objects.create_user('otheruser', password='secret')
+        url = reverse('preview_next_task', kwargs={'batch_id': self.batch.id})
+
+        client = django.test.Client()
+        client.login(username='testuser', password='secret')
+        self.assertEqual(client.get(url).status_code, 302)
+        self.assertEqual(client.get(url).status_code, 429)
+
+        # Throttling is per user
+        other_client = django.test.Client()
+        other_client.login(username='otheruser', password='secret')
+        self.assertEqual(other_client.get(url).status_code, 302)
+
+    @django.test.override_settings(TURKLE_THROTTLE_RATES={'ip': (1, 1000)})
+    def test_tokens_refill(self):
+        client = django.test.Client()
+        for i in range(3):
+            self.assertEqual(client.get(reverse('index')).status_code, 200)
+
+    def test_throttling_disabled(self):
+        client = django.test.Client()
+        for i in range(20):
+            self.assertEqual(client.get(reverse('index')).status_code, 200)
+
+
+class TestPayloadColumns(TestCase):
+    """Only the views that render a Task read its input, and no view reads answers
+    """
+    def setUp(self):
+        self.user = User.objects.create_user('testuser', password='secret')
+        project = Project(html_template='<p>${foo}</p>', login_required=False)
+        project.save()
+        self.batch = Batch(assignments_per_task=2, project=project)
+        self.batch.save()
+        self.task = Task(batch=self.batch, input_csv_fields={'foo': 'bar'})
+        self.task.save()
+        self.task_assignment = TaskAssignment(answers={'a': '1'}, assigned_to=self.user,
+                                              completed=False, task=self.task)
+        self.task_assignment.save()
+        self.client = django.test.Client()
+        self.client.login(username='testuser', password='secret')
+
+    def columns_read(self, url, method='get'):
+        """Returns the payload columns read by SELECT queries while requesting url
+        """
+        qn = connection.ops.quote_name
+        columns = {
+            'input_csv_fields': '{}.{}'.format(qn(Task._meta.db_table), qn('input_csv_fields')),
+            'answers': '{}.{}'.format(qn(TaskAssignment._meta.db_table), qn('answers')),
+        }
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(url)
+        self.assertTrue(response.status_code in (200, 302))
+        return set(name for query in queries if query['sql'].startswith('SELECT')
+                   for (name, column) in columns.items() if column in query['sql'])
+
+    def task_assignment_kwargs(self):
+        return {'task_id': self.task.id, 'task_assignment_id': self.task_assignment.id}
+
+    def test_index(self):
+        self.assertEqual(self.columns_read(reverse('index')), set())
+
+    def test_accept_task(self):
+        other_task = Task(batch=self.batch, input_csv_fields={'foo': 'baz'})
+        other_task.save()
+        url = reverse('accept_task', kwargs={'batch_id': self.batch.id, 'task_id': other_task.id})
+        self.assertEqual(self.columns_read(url), set())
+
+    def test_accept_next_task(self):
+        Task(batch=self.batch, input_csv_fields={'foo': 'baz'}).save()
+        url = reverse('accept_next_task', kwargs={'batch_id': self.batch.id})
+        self.assertEqual(self.columns_read(url), set())
+
+    def test_preview(self):
+        self.assertEqual(self.columns_read(reverse('preview', kwargs={'task_id': self.task.id})),
+                         set())
+        self.assertEqual(
+            self.columns_read(reverse('preview_iframe', kwargs={'task_id': self.task.id})),
+            set(['input_csv_fields']))
+
+    def test_task_assignment(self):
+        url = reverse('task_assignment', kwargs=self.task_assignment_kwargs())
+        self.assertEqual(self.columns_read(url), set())
+        self.assertEqual(
+            self.columns_read(reverse('task_assignment_iframe',
+                                      kwargs=self.task_assignment_kwargs())),
+            set(['input_csv_fields']))
+
+    def test_submit_task_assignment(self):
+        url = reverse('task_assignment', kwargs=self.task_assignment_kwargs())
+        self.assertEqual(self.columns_read(url, method='post'), set())
+        self.assertEqual(TaskAssignment.objects.get(id=self.task_assignment.id).answers, {})
+
+    def test_return_task_assignment(self):
+        url = reverse('return_task_assignment', kwargs=self.task_assignment_kwargs())
+        self.assertEqual(self.columns_read(url), set())
+        self.assertFalse(TaskAssignment.objects.filter(id=self.task_assignment.id).exists())
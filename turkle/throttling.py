@@ -0,0 +1,86 @@
+"""Token bucket request throttling
+
+Workers using browser auto-refresh extensions can send many requests
+per second to views like accept_next_task, each of which runs the
+expensive Task availability queries.  The throttle decorator limits
+the request rate per user and per IP address using token buckets
+stored in the Django cache.
+
+Throttling is configured with the TURKLE_THROTTLE_RATES setting, a
+dict mapping 'user' and/or 'ip' to a (burst, rate) tuple, where burst
+is the bucket size and rate is the number of tokens added per second:
+
+    TURKLE_THROTTLE_RATES = {
+        'user': (10, 1.0),
+        'ip': (50, 5.0),
+    }
+
+Throttling is disabled if the setting is missing or empty.
+"""
+from functools import wraps
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.shortcuts import render
+
+from turkle import metrics
+
+THROTTLE_KEY_PREFIX = 'turkle:throttle:'
+
+
+def throttle(func):
+    """Decorator that returns an HTTP 429 response if the request rate is too high
+    """
+    @wraps(func)
+    def wrapper(request, *args, **kwargs):
+        rates = getattr(settings, 'TURKLE_THROTTLE_RATES', None)
+        if rates:
+            for scope, ident in _throttle_idents(request):
+                if scope in rates:
+                    burst, rate = rates[scope]
+                    retry_after = _take_token(scope, ident, burst, rate)
+                    if retry_after:
+                        metrics.increment('throttled.{}.{}'.format(scope, func.__name__))
+                        return _throttled_response(request, retry_after)
+        return func(request, *args, **kwargs)
+    return wrapper
+
+
+def _take_token(scope, ident, burst, rate):
+    """Take a token from the bucket for ident
+
+    The bucket is stored as a (tokens, timestamp) tuple.  Concurrent
+    requests can race when updating the bucket, which at worst lets a
+    few extra requests through.
+
+    Returns:
+        0 if a token was available, otherwise the number of seconds
+        until the next token becomes available
+    """
+    key = '{}{}:{}'.format(THROTTLE_KEY_PREFIX, scope, ident)
+    now = time.time()
+    tokens, timestamp = cache.get(key, (burst, now))
+    tokens = min(burst, tokens + (now - timestamp) * rate)
+    if tokens < 1:
+        cache.set(key, (tokens, now), int(burst / rate) + 1)
+        return (1 - tokens) / rate
+    cache.set(key, (tokens - 1, now), int(burst / rate) + 1)
+    return 0
+
+
+def _throttle_idents(request):
+    idents = []
+    if request.user.is_authenticated:
+        idents.append(('user', request.user.id))
+    remote_addr = request.META.get('REMOTE_ADDR')
+    if remote_addr:
+        idents.append(('ip', remote_addr))
+    return idents
+
+
+def _throttled_response(request, retry_after):
+    response = render(request, 'throttled.html', {'retry_after': int(retry_after) + 1},
+                      status=429)
+    response['Retry-After'] = int(retry_after) + 1
+    return response
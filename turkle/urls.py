@@ -1,15 +1,21 @@
 from django.conf.urls import url
 
+from turkle import api
 from turkle.views import (
     accept_task,
     accept_next_task,
+    batch_media,
+    download_batch_changes,
     download_batch_csv,
+    download_batch_jsonl,
+    download_project_jsonl,
     task_assignment,
     task_assignment_iframe,
     index,
     preview,
     preview_iframe,
     preview_next_task,
+    project_asset,
     return_task_assignment,
     skip_and_accept_next_task,
     skip_task,
@@ -36,5 +42,26 @@ urlpatterns = [
     url(r'^batch/(?P<batch_id>\d+)/accept_next_task/$', accept_next_task, name='accept_next_task'),
     url(r'^batch/(?P<batch_id>\d+)/preview_next_task/$',
         preview_next_task, name='preview_next_task'),
+    url(r'^project/(?P<project_id>\d+)/asset/(?P<digest>[0-9a-f]{40})/(?P<filename>.+)$',
+        project_asset, name='project_asset'),
     url(r'^batch/(?P<batch_id>\d+)/download/$', download_batch_csv, name='download_batch_csv'),
+    url(r'^batch/(?P<batch_id>\d+)/download/changes/$',
+        download_batch_changes, name='download_batch_changes'),
+    url(r'^batch/(?P<batch_id>\d+)/download/jsonl/$',
+        download_batch_jsonl, name='download_batch_jsonl'),
+    url(r'^project/(?P<project_id>\d+)/download/jsonl/$',
+        download_project_jsonl, name='download_project_jsonl'),
+    url(r'^media/(?P<digest>[0-9a-f]{64})/(?P<filename>.+)$', batch_media, name='batch_media'),
+
+    url(r'^api/v1/batches/$', api.batches, name='api_batches'),
+    url(r'^api/v1/batch/(?P<batch_id>\d+)/claim_next_task/$',
+        api.claim_next_task, name='api_claim_next_task'),
+    url(r'^api/v1/batch/(?P<batch_id>\d+)/submit_answers/$',
+        api.submit_answers, name='api_submit_answers'),
+    url(r'^api/v1/assignment/(?P<task_assignment_id>\d+)/submit/$',
+        api.submit_task_assignment, name='api_submit_task_assignment'),
+    url(r'^api/v1/assignment/(?P<task_assignment_id>\d+)/return/$',
+        api.return_task_assignment, name='api_return_task_assignment'),
+    url(r'^api/v1/assignment/(?P<task_assignment_id>\d+)/skip/$',
+        api.skip_task_assignment, name='api_skip_task_assignment'),
 ]
@@ -1,3 +1,5 @@
+import json
+
 from django.conf import settings
 
 
@@ -11,3 +13,41 @@ def get_site_name():
 
 def site(request):
     return {'turkle_site_name': get_site_name()}
+
+
+def read_answer_records(lines):
+    """Parse answer records in JSON Lines format
+
+    Each non-blank line must be a JSON object of the form:
+
+        {"task_id": 123, "answers": {"field": "value", ...}}
+
+    Args:
+        lines (iterable): Iterable of (byte or unicode) strings
+
+    Yields:
+        dicts with the keys 'task_id' (an int) and 'answers' (a dict)
+
+    Raises:
+        ValueError: If a line is not a valid answer record
+    """
+    for line_number, line in enumerate(lines, start=1):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            raise ValueError(u'Line {} is not valid JSON'.format(line_number))
+        if not isinstance(record, dict) or 'task_id' not in record or \
+           not isinstance(record.get('answers'), dict):
+            raise ValueError(u'Line {} must be a JSON object with the keys '
+                             u'"task_id" and "answers"'.format(line_number))
+        task_id = record['task_id']
+        if isinstance(task_id, type(u'')) and task_id.isdigit():
+            task_id = int(task_id)
+        if not isinstance(task_id, int) or isinstance(task_id, bool):
+            raise ValueError(u'Line {}: "task_id" must be an integer'.format(line_number))
+        record['task_id'] = task_id
+        yield record
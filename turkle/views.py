@@ -13,30 +13,60 @@ try:
 except NameError:
     unicode = str
 
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.admin.views.decorators import staff_member_required
 from django.core.exceptions import ObjectDoesNotExist
 from django.db import transaction
 from django.db.utils import OperationalError
-from django.http import HttpResponse, JsonResponse
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import redirect, render
 from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
 from functools import wraps
-
-from turkle.models import Task, TaskAssignment, Batch, Project
+import calendar
+import io
+import os
+import re
+import time
+
+from turkle.availability import (
+    availability_version,
+    requested_wait_seconds,
+    wait_for_availability_change,
+)
+from turkle.db import is_db_lock_error, retry_on_db_lock
+from turkle.exports import format_cursor, gzip_chunks, parse_cursor
+from turkle.models import (
+    Task, TaskAssignment, Batch, BatchExport, BatchMedia, Project, ProjectAsset
+)
+from turkle.submission_journal import get_submission_journal
+from turkle.throttling import throttle
+
+# Single byte range of a Range request header, e.g. 'bytes=0-499' or 'bytes=-500'
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+_MEDIA_BLOCK_BYTES = 64 * 1024
 
 
 def handle_db_lock(func):
-    """Decorator that catches database lock errors from sqlite"""
+    """Decorator that catches database lock errors from sqlite
+
+    The view is retried a few times (see turkle.db.retry_on_db_lock)
+    before the user is redirected to the index page with an error.
+    """
+    retrying_func = retry_on_db_lock(func)
+
     @wraps(func)
     def wrapper(request, *args, **kwargs):
         try:
-            return func(request, *args, **kwargs)
+            return retrying_func(request, *args, **kwargs)
         except OperationalError as ex:
             # sqlite3 cannot handle concurrent transactions.
             # This should be very rare with just a few users.
             # If it happens often, switch to mysql or postgres.
-            if str(ex) == 'database is locked':
+            if is_db_lock_error(ex):
                 messages.error(request, u'The database is busy. Please try again.')
                 return redirect(index)
             raise ex
@@ -56,7 +86,7 @@ def accept_task(request, batch_id, task_id):
         messages.error(request, u'Cannot find Task Batch with ID {}'.format(batch_id))
         return redirect(index)
     try:
-        task = Task.objects.get(id=task_id)
+        task = Task.objects.defer('input_csv_fields').get(id=task_id)
     except ObjectDoesNotExist:
         messages.error(request, u'Cannot find Task with ID {}'.format(task_id))
         return redirect(index)
@@ -83,61 +113,260 @@ def accept_task(request, batch_id, task_id):
     return redirect(task_assignment, task.id, ha.id)
 
 
+@throttle
 @handle_db_lock
 def accept_next_task(request, batch_id):
     """
+    If the optional 'wait' query parameter is set to a number of
+    seconds, and no Task is currently available, the request waits
+    (up to TURKLE_MAX_WAIT_SECONDS) for a Task to become available
+    instead of immediately redirecting to the index page.
+
     Security behavior:
     - If the user does not have permission to access the Batch+Task, they
       are redirected to the index page with an error message.
     """
-    try:
-        with transaction.atomic():
-            batch = Batch.objects.get(id=batch_id)
+    deadline = time.time() + requested_wait_seconds(request)
+    while True:
+        version = availability_version()
+        try:
+            with transaction.atomic():
+                batch = Batch.objects.get(id=batch_id)
+
+                # Lock access to all Tasks available to current user in the batch
+                batch.available_task_ids_for(request.user).select_for_update()
+
+                task_id = _skip_aware_next_available_task_id(request, batch)
+
+                if task_id:
+                    ha = TaskAssignment()
+                    if request.user.is_authenticated:
+                        ha.assigned_to = request.user
+                    else:
+                        ha.assigned_to = None
+                    ha.task_id = task_id
+                    ha.save()
+        except ObjectDoesNotExist:
+            messages.error(request, u'Cannot find Task Batch with ID {}'.format(batch_id))
+            return redirect(index)
 
-            # Lock access to all Tasks available to current user in the batch
-            batch.available_task_ids_for(request.user).select_for_update()
+        if task_id:
+            return redirect(task_assignment, task_id, ha.id)
 
-            task_id = _skip_aware_next_available_task_id(request, batch)
+        remaining = deadline - time.time()
+        if remaining <= 0 or not wait_for_availability_change(version, remaining):
+            messages.error(request, u'No more Tasks available from Batch {}'.format(batch_id))
+            return redirect(index)
 
-            if task_id:
-                ha = TaskAssignment()
-                if request.user.is_authenticated:
-                    ha.assigned_to = request.user
-                else:
-                    ha.assigned_to = None
-                ha.task_id = task_id
-                ha.save()
-    except ObjectDoesNotExist:
-        messages.error(request, u'Cannot find Task Batch with ID {}'.format(batch_id))
-        return redirect(index)
 
-    if task_id:
-        return redirect(task_assignment, task_id, ha.id)
+def batch_media(request, digest, filename):
+    """
+    Media URLs are versioned by content digest, so responses can be
+    cached indefinitely.  Requests for a single byte range (e.g. from
+    audio and video players seeking in a file) are answered with a
+    206 Partial Content response.
+
+    Security behavior:
+    - If the user does not have permission to access a Project with a
+      Batch that has the media file, a 404 error is returned.
+    """
+    media = None
+    for batch_media in BatchMedia.objects.select_related('batch__project').\
+            filter(digest=digest).order_by('-id'):
+        if batch_media.batch.project.available_for(request.user):
+            media = batch_media
+            break
+    if media is None:
+        raise Http404(u'Cannot find media file "{}"'.format(filename))
+
+    etag = '"{}"'.format(media.digest)
+    if request.META.get('HTTP_IF_NONE_MATCH') == etag:
+        response = HttpResponse(status=304)
     else:
-        messages.error(request, u'No more Tasks available from Batch {}'.format(batch_id))
-        return redirect(index)
+        try:
+            response = _file_response(request, media.path(), media.content_type, etag)
+        except IOError:
+            raise Http404(u'Cannot find media file "{}"'.format(filename))
+    response['Cache-Control'] = '{}, max-age=31536000, immutable'.format(
+        'private' if media.batch.project.login_required else 'public')
+    response['ETag'] = etag
+    return response
+
+
+def _file_response(request, path, content_type, etag):
+    """Stream a file, or the byte range of the file requested by a Range header
+    """
+    fh = io.open(path, 'rb')
+    size = os.fstat(fh.fileno()).st_size
+    range_match = RANGE_RE.match(request.META.get('HTTP_RANGE', ''))
+    # A Range request with an If-Range header that does not match gets the whole file
+    if range_match and request.META.get('HTTP_IF_RANGE', etag) == etag:
+        (first, last) = range_match.groups()
+        if first:
+            first = int(first)
+            last = min(int(last), size - 1) if last else size - 1
+        elif last:
+            # The last bytes of the file
+            first = max(size - int(last), 0)
+            last = size - 1
+        else:
+            first = size
+        if first >= size or first > last:
+            fh.close()
+            response = HttpResponse(status=416)
+            response['Content-Range'] = 'bytes */{}'.format(size)
+            return response
+        fh.seek(first)
+        response = StreamingHttpResponse(_read_file_range(fh, last - first + 1),
+                                         status=206, content_type=content_type)
+        response['Content-Range'] = 'bytes {}-{}/{}'.format(first, last, size)
+        response['Content-Length'] = last - first + 1
+    else:
+        response = FileResponse(fh, content_type=content_type)
+        response['Content-Length'] = size
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def _read_file_range(fh, length):
+    try:
+        while length > 0:
+            block = fh.read(min(length, _MEDIA_BLOCK_BYTES))
+            if not block:
+                break
+            length -= len(block)
+            yield block
+    finally:
+        fh.close()
 
 
 @staff_member_required
 def download_batch_csv(request, batch_id):
     """
+    If the TURKLE_EXPORT_DIR setting is set, the CSV file is served from
+    the cached export file of the Batch (see turkle.exports), with ETag
+    and Last-Modified headers so that unchanged files are answered
+    with a 304 Not Modified response.
+
+    If the 'gzip' query parameter is 1, the file is streamed through a
+    gzip compressor and downloaded as a .csv.gz file.
+
     Security behavior:
     - Access to this page is limited to requesters.  Any requester can
       download any CSV file.
     """
     batch = Batch.objects.get(id=batch_id)
-    csv_output = StringIO()
     if request.session.get('csv_unix_line_endings', False):
-        batch.to_csv(csv_output, lineterminator='\n')
+        lineterminator = '\n'
+    else:
+        lineterminator = '\r\n'
+    compress = _gzip_requested(request)
+    export = BatchExport.get_current(batch, lineterminator)
+    if export:
+        # The compressed file is a different representation with its own ETag
+        etag = export.etag()[:-1] + '-gzip"' if compress else export.etag()
+        last_modified = calendar.timegm(export.updated_at.utctimetuple())
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            if compress:
+                fh = io.open(export.path(), 'rb')
+                response = StreamingHttpResponse(
+                    gzip_chunks(_read_file_range(fh, os.fstat(fh.fileno()).st_size)),
+                    content_type='application/gzip')
+            else:
+                response = _file_response(request, export.path(), 'text/csv', etag)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+    elif compress:
+        response = StreamingHttpResponse(
+            gzip_chunks(batch.csv_chunks(lineterminator=lineterminator)),
+            content_type='application/gzip')
+    else:
+        csv_output = StringIO()
+        batch.to_csv(csv_output, lineterminator=lineterminator)
+        response = HttpResponse(csv_output.getvalue(), content_type='text/csv')
+    response['Content-Disposition'] = 'attachment; filename="{}{}"'.format(
+        batch.csv_results_filename(), '.gz' if compress else '')
+    return response
+
+
+@staff_member_required
+def download_batch_changes(request, batch_id):
+    """
+    Downloads a CSV file with the results saved after the cursor given
+    by the 'cursor' query parameter (all results if it is not given),
+    with at most 'limit' Task Assignments.  The cursor for the next
+    download is returned in the X-Turkle-Cursor header.
+
+    Security behavior:
+    - Access to this page is limited to requesters.  Any requester can
+      download any CSV file.
+    """
+    batch = Batch.objects.get(id=batch_id)
+    try:
+        cursor = parse_cursor(request.GET.get('cursor', ''))
+        limit = int(request.GET.get('limit', 0)) or None
+        if limit is not None and limit < 0:
+            raise ValueError(u'Invalid limit {}'.format(limit))
+    except ValueError as ex:
+        return HttpResponse(str(ex), content_type='text/plain', status=400)
+    if request.session.get('csv_unix_line_endings', False):
+        lineterminator = '\n'
     else:
-        batch.to_csv(csv_output)
-    csv_string = csv_output.getvalue()
-    response = HttpResponse(csv_string, content_type='text/csv')
+        lineterminator = '\r\n'
+    csv_output = StringIO()
+    cursor = batch.results_since_to_csv(csv_output, cursor, limit, lineterminator=lineterminator)
+    response = HttpResponse(csv_output.getvalue(), content_type='text/csv')
     response['Content-Disposition'] = 'attachment; filename="{}"'.format(
         batch.csv_results_filename())
+    response['X-Turkle-Cursor'] = format_cursor(cursor)
+    return response
+
+
+@staff_member_required
+def download_batch_jsonl(request, batch_id):
+    """
+    Streams the results of a Batch as JSON Lines (see Batch.results_jsonl),
+    compressed with gzip if the 'gzip' query parameter is 1
+
+    Security behavior:
+    - Access to this page is limited to requesters.  Any requester can
+      download any results file.
+    """
+    batch = Batch.objects.get(id=batch_id)
+    return _jsonl_response(request, batch.results_jsonl(), batch.jsonl_results_filename())
+
+
+@staff_member_required
+def download_project_jsonl(request, project_id):
+    """
+    Streams the results of every Batch of a Project as JSON Lines,
+    compressed with gzip if the 'gzip' query parameter is 1
+
+    Security behavior:
+    - Access to this page is limited to requesters.  Any requester can
+      download any results file.
+    """
+    project = Project.objects.get(id=project_id)
+    return _jsonl_response(request, project.results_jsonl(),
+                           'Project_{}_results.jsonl'.format(project.id))
+
+
+def _gzip_requested(request):
+    return request.GET.get('gzip') == '1'
+
+
+def _jsonl_response(request, lines, filename):
+    if _gzip_requested(request):
+        response = StreamingHttpResponse(gzip_chunks(lines), content_type='application/gzip')
+        filename += '.gz'
+    else:
+        response = StreamingHttpResponse(lines, content_type='application/x-ndjson')
+    response['Content-Disposition'] = 'attachment; filename="{}"'.format(filename)
     return response
 
 
+@handle_db_lock
 def task_assignment(request, task_id, task_assignment_id):
     """
     Security behavior:
@@ -145,12 +374,12 @@ def task_assignment(request, task_id, task_assignment_id):
       are redirected to the index page with an error message.
     """
     try:
-        task = Task.objects.get(id=task_id)
+        task = Task.objects.defer('input_csv_fields').get(id=task_id)
     except ObjectDoesNotExist:
         messages.error(request, u'Cannot find Task with ID {}'.format(task_id))
         return redirect(index)
     try:
-        task_assignment = TaskAssignment.objects.get(id=task_assignment_id)
+        task_assignment = TaskAssignment.objects.defer('answers').get(id=task_assignment_id)
     except ObjectDoesNotExist:
         messages.error(request,
                        u'Cannot find Task Assignment with ID {}'.format(task_assignment_id))
@@ -179,17 +408,27 @@ def task_assignment(request, task_id, task_assignment_id):
             'task_assignment.html',
             {
                 'auto_accept_status': auto_accept_status,
+                'preload_media_urls': _next_task_media_urls(request, task),
                 'task': task,
                 'task_assignment': task_assignment,
             },
         )
     else:
-        task_assignment.answers = dict(request.POST.items())
-        task_assignment.completed = True
-        task_assignment.save()
+        submission_journal = get_submission_journal()
+        if submission_journal:
+            submission_journal.append(task_assignment, dict(request.POST.items()))
+        else:
+            with transaction.atomic():
+                task_assignment.answers = dict(request.POST.items())
+                task_assignment.completed = True
+                task_assignment.save()
 
         if request.session.get('auto_accept_status'):
-            return redirect(accept_next_task, task.batch.id)
+            accept_next_task_url = reverse(accept_next_task, args=[task.batch.id])
+            auto_accept_wait = getattr(settings, 'TURKLE_AUTO_ACCEPT_WAIT_SECONDS', 0)
+            if auto_accept_wait:
+                accept_next_task_url += '?wait={}'.format(auto_accept_wait)
+            return redirect(accept_next_task_url)
         else:
             return redirect(index)
 
@@ -206,7 +445,7 @@ def task_assignment_iframe(request, task_id, task_assignment_id):
         messages.error(request, u'Cannot find Task with ID {}'.format(task_id))
         return redirect(index)
     try:
-        task_assignment = TaskAssignment.objects.get(id=task_assignment_id)
+        task_assignment = TaskAssignment.objects.defer('answers').get(id=task_assignment_id)
     except ObjectDoesNotExist:
         messages.error(request,
                        u'Cannot find Task Assignment with ID {}'.format(task_assignment_id))
@@ -230,6 +469,7 @@ def task_assignment_iframe(request, task_id, task_assignment_id):
     )
 
 
+@throttle
 def index(request):
     """
     Security behavior:
@@ -238,7 +478,12 @@ def index(request):
     """
     abandoned_assignments = []
     if request.user.is_authenticated:
-        for ha in TaskAssignment.objects.filter(assigned_to=request.user).filter(completed=False):
+        abandoned = TaskAssignment.objects.\
+            filter(assigned_to=request.user).\
+            filter(completed=False).\
+            select_related('task__batch__project').\
+            defer('answers', 'task__input_csv_fields')
+        for ha in abandoned:
             abandoned_assignments.append({
                 'task': ha.task,
                 'task_assignment_id': ha.id
@@ -273,7 +518,7 @@ def preview(request, task_id):
       are redirected to the index page with an error message.
     """
     try:
-        task = Task.objects.get(id=task_id)
+        task = Task.objects.defer('input_csv_fields').get(id=task_id)
     except ObjectDoesNotExist:
         messages.error(request, u'Cannot find Task with ID {}'.format(task_id))
         return redirect(index)
@@ -304,6 +549,7 @@ def preview_iframe(request, task_id):
     return render(request, 'preview_iframe.html', {'task': task})
 
 
+@throttle
 def preview_next_task(request, batch_id):
     """
     Security behavior:
@@ -326,6 +572,37 @@ def preview_next_task(request, batch_id):
         return redirect(index)
 
 
+def project_asset(request, project_id, digest, filename):
+    """
+    Security behavior:
+    - If the user does not have permission to access the Project, a
+      404 error is returned.
+    """
+    try:
+        asset = ProjectAsset.objects.select_related('project').\
+            get(project_id=project_id, filename=filename)
+    except ObjectDoesNotExist:
+        raise Http404(u'Cannot find asset "{}"'.format(filename))
+
+    if not asset.project.available_for(request.user):
+        raise Http404(u'Cannot find asset "{}"'.format(filename))
+
+    # The asset has been modified since the template was rendered
+    if asset.digest != digest:
+        return redirect(asset.url())
+
+    etag = '"{}"'.format(asset.digest)
+    if request.META.get('HTTP_IF_NONE_MATCH') == etag:
+        response = HttpResponse(status=304)
+    else:
+        response = HttpResponse(bytes(asset.content), content_type=asset.content_type)
+    # Asset URLs are versioned by content digest, so the content of a URL never changes
+    response['Cache-Control'] = '{}, max-age=31536000, immutable'.format(
+        'private' if asset.project.login_required else 'public')
+    response['ETag'] = etag
+    return response
+
+
 def return_task_assignment(request, task_id, task_assignment_id):
     """
     Security behavior:
@@ -406,12 +683,12 @@ def _delete_task_assignment(request, task_id, task_assignment_id):
             return redirect_due_to_error
     """
     try:
-        task = Task.objects.get(id=task_id)
+        task = Task.objects.defer('input_csv_fields').get(id=task_id)
     except ObjectDoesNotExist:
         messages.error(request, u'Cannot find Task with ID {}'.format(task_id))
         return redirect(index)
     try:
-        task_assignment = TaskAssignment.objects.get(id=task_assignment_id)
+        task_assignment = TaskAssignment.objects.defer('answers').get(id=task_assignment_id)
     except ObjectDoesNotExist:
         messages.error(request,
                        u'Cannot find Task Assignment with ID {}'.format(task_assignment_id))
@@ -439,6 +716,23 @@ def _delete_task_assignment(request, task_id, task_assignment_id):
         task_assignment.delete()
 
 
+def _next_task_media_urls(request, task):
+    """Returns the media URLs in the input of the next Task the user is likely to work on
+
+    The browser can fetch them while the user works on the current
+    Task.  Tasks of Batches without media files are never loaded.
+    """
+    if not BatchMedia.objects.filter(batch_id=task.batch_id).exists():
+        return []
+    next_task = task.batch.available_tasks_for(request.user).exclude(id=task.id).first()
+    if next_task is None:
+        return []
+    media_url = reverse('batch_media', kwargs={'digest': '0' * 64, 'filename': '_'})
+    media_url_prefix = media_url[:media_url.index('0' * 64)]
+    return sorted(value for value in next_task.input_csv_fields.values()
+                  if isinstance(value, unicode) and value.startswith(media_url_prefix))
+
+
 def _skip_aware_next_available_task_id(request, batch):
     """Get next available Task for user, taking into account previously skipped Tasks
 
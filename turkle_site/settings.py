@@ -50,6 +50,84 @@ else:
         }
     }
 
+    # SQLite production profile, enabled by setting the environment
+    # variable TURKLE_SQLITE_PRODUCTION.  WAL journal mode lets Workers
+    # read while another request is writing, synchronous=NORMAL is
+    # durable in WAL mode while avoiding an fsync per transaction, and
+    # the busy timeout makes a request wait for the write lock instead
+    # of immediately failing with "database is locked".
+    if os.environ.get('TURKLE_SQLITE_PRODUCTION'):
+        DATABASES['default']['OPTIONS'] = {'timeout': 20}
+        TURKLE_SQLITE_PRAGMAS = {
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'busy_timeout': 20000,
+        }
+
+# Views that fail because the SQLite database is locked are retried up
+# to TURKLE_DB_LOCK_RETRIES times, with a randomized exponential backoff
+# starting at TURKLE_DB_LOCK_RETRY_DELAY seconds.  Retries are counted
+# on the admin "Metrics" page.
+TURKLE_DB_LOCK_RETRIES = 3
+TURKLE_DB_LOCK_RETRY_DELAY = 0.05
+
+# If set to a file path, submitted answers are appended to this journal
+# and acknowledged immediately, instead of waiting for the database
+# write lock.  A background thread in each server process applies the
+# journal to the database every TURKLE_SUBMISSION_JOURNAL_FLUSH_INTERVAL
+# seconds.  The journal file must be on a local filesystem shared by all
+# server processes.
+# TURKLE_SUBMISSION_JOURNAL = os.path.join(BASE_DIR, 'submissions.journal')
+TURKLE_SUBMISSION_JOURNAL_FLUSH_INTERVAL = 1.0
+
+# Uploaded Batch CSV files are spooled to TURKLE_INGEST_DIR (default:
+# the system temporary directory) before Tasks are created from them.
+# If TURKLE_BACKGROUND_INGEST is True, Tasks are created by the
+# ingest_worker management command instead of during the upload
+# request, and TURKLE_INGEST_DIR must be readable by the worker.
+TURKLE_BACKGROUND_INGEST = False
+
+# Maximum number of CSV rows with the wrong number of fields that are
+# reported when an uploaded Batch is rejected
+TURKLE_MAX_CSV_ERRORS = 20
+# TURKLE_INGEST_DIR = os.path.join(BASE_DIR, 'ingest')
+
+# Number of processes used to parse uploaded Batch CSV files.  Values
+# greater than 1 speed up creating Tasks from very large CSV files in
+# the ingest_worker command (see TURKLE_BACKGROUND_INGEST).
+TURKLE_INGEST_PROCESSES = 1
+
+# Store the input of each Task as a list of values in the order of the
+# Batch's CSV header, instead of as a JSON object that repeats every
+# fieldname in every Task
+TURKLE_COLUMNAR_TASK_INPUTS = True
+
+# Task inputs and answers whose JSON encoding is at least this many
+# characters long are stored compressed with zlib.  Set to None to
+# store all new values uncompressed.
+TURKLE_COMPRESSION_THRESHOLD = 1024
+
+# If TURKLE_BLOB_DIR is set, Task input values of at least
+# TURKLE_BLOB_THRESHOLD characters are stored in files in that
+# directory instead of in the database
+# TURKLE_BLOB_DIR = os.path.join(BASE_DIR, 'blobs')
+TURKLE_BLOB_THRESHOLD = 64 * 1024
+
+# Directory where the files of media archives uploaded with Batches are
+# stored.  Media archives cannot be uploaded if it is not set.
+# TURKLE_MEDIA_DIR = os.path.join(BASE_DIR, 'media')
+
+# If TURKLE_EXPORT_DIR is set, the results CSV file of each Batch is
+# kept in that directory and updated when it is downloaded, instead of
+# being built from the database for every download
+# TURKLE_EXPORT_DIR = os.path.join(BASE_DIR, 'exports')
+
+# Downloads of the results saved after a cursor leave out the results
+# saved in the last TURKLE_RESULTS_CURSOR_LAG seconds, which may belong
+# to transactions that have not committed yet.  It must be longer than
+# the slowest transaction that completes Task Assignments.
+TURKLE_RESULTS_CURSOR_LAG = 10
+
 TEST_RUNNER = 'django_nose.NoseTestSuiteRunner'
 
 # Local time zone for this installation. Choices can be found here:
@@ -179,12 +257,48 @@ AUTHENTICATION_BACKENDS = (
 #     }
 # }
 
-# Set max size for file uploads and POST requests to 100MB
+# Set max size for POST requests (excluding file uploads) to 100MB
 DATA_UPLOAD_MAX_MEMORY_SIZE = 104857600
-FILE_UPLOAD_MAX_MEMORY_SIZE = 104857600
+
+# Uploaded files larger than 2.5MB are streamed to a temporary file in
+# FILE_UPLOAD_TEMP_DIR (default: the system temporary directory)
+# instead of being held in memory.  If FILE_UPLOAD_TEMP_DIR and
+# TURKLE_INGEST_DIR are on the same filesystem, uploaded Batch CSV
+# files are moved into TURKLE_INGEST_DIR instead of being copied.
+FILE_UPLOAD_MAX_MEMORY_SIZE = 2621440
 
 LOGIN_REDIRECT_URL = 'index'
 
+# Maximum number of seconds a request to accept the next Task of a
+# Batch can wait for a Task to become available, when the request
+# includes the 'wait' query parameter.  Waiting requests are woken up
+# using a version number stored in the cache.  When running multiple
+# server processes, configure a cache that is shared between processes
+# (https://docs.djangoproject.com/en/1.11/topics/cache/), e.g.:
+# CACHES = {
+#     'default': {
+#         'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+#         'LOCATION': 'turkle_cache',
+#     }
+# }
+TURKLE_MAX_WAIT_SECONDS = 30
+
+# Token bucket throttling for the index, accept_next_task and
+# preview_next_task views.  Maps 'user' (per logged in user) and/or
+# 'ip' (per IP address) to a (burst, rate) tuple, where burst is the
+# maximum number of requests in a burst, and rate is the sustained
+# number of requests per second.  Throttled requests are counted on
+# the admin "Metrics" page.  Like TURKLE_MAX_WAIT_SECONDS, throttling
+# requires a shared CACHES backend when running multiple processes.
+# TURKLE_THROTTLE_RATES = {
+#     'user': (10, 1.0),
+#     'ip': (50, 5.0),
+# }
+
+# If non-zero, Workers who have enabled "auto-accept" wait up to this
+# many seconds for the next Task when a Batch is temporarily drained
+TURKLE_AUTO_ACCEPT_WAIT_SECONDS = 0
+
 # If True, the "Password Reset" link will be added to the login form.
 # This requires MTA configuration below.
 TURKLE_EMAIL_ENABLED = False